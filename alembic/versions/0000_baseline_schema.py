@@ -0,0 +1,64 @@
+"""create the users, books and book_transactions tables
+
+Revision ID: 0000
+Revises:
+Create Date: 2026-10-18 09:00:00.000000
+
+The schema the application started with, before any indexes or columns
+added by the later revisions, so that ``alembic upgrade head`` builds a
+new database from scratch. Databases created by ``create_all`` before
+migrations existed already have these tables: mark them with
+``alembic stamp 0000`` before the first ``alembic upgrade head``.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0000'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(), nullable=False, unique=True),
+        sa.Column('email', sa.String(), nullable=False, unique=True),
+        sa.Column('password', sa.String(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('role', sa.Enum('admin', 'user', name='user_roles'), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    )
+    op.create_table(
+        'books',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('title', sa.String(), nullable=False, unique=True),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('author', sa.String(), nullable=False, unique=True),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    )
+    op.create_table(
+        'book_transactions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books.id'), nullable=False),
+        sa.Column('borrowed_by', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('borrowed', sa.Boolean(), nullable=True),
+        sa.Column('returned', sa.Boolean(), nullable=True),
+        sa.Column('borrowed_at', sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column('returned_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('book_transactions')
+    op.drop_table('books')
+    op.drop_table('users')
+    sa.Enum(name='user_roles').drop(op.get_bind(), checkfirst=True)
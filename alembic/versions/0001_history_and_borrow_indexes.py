@@ -0,0 +1,42 @@
+"""add history and borrow lookup indexes
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-18 10:00:00.000000
+
+``books(title)`` is not indexed here: its unique constraint already
+provides the index used by the history title filter.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = '0000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = (
+    ('ix_book_transactions_borrowed_by_borrowed_at', ['borrowed_by', 'borrowed_at']),
+    ('ix_book_transactions_book_id_returned', ['book_id', 'returned']),
+    ('ix_book_transactions_borrowed_at', ['borrowed_at']),
+)
+
+
+def upgrade() -> None:
+    # Build the indexes without blocking writes on large tables
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(name, 'book_transactions', columns,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='book_transactions',
+                          postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,58 @@
+"""add book full-text and trigram search indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:00:00.000000
+
+Adds the weighted ``books.search_vector`` generated column with its GIN index,
+trigram indexes on title and author for typo-tolerant matching, and a
+``lower(title) text_pattern_ops`` index for prefix autocomplete. PostgreSQL
+12+ only; other databases use the in-process index of ``app.search``.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(author, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+
+INDEXES = (
+    ('ix_books_search_vector', 'USING gin (search_vector)'),
+    ('ix_books_title_trgm', 'USING gin (title gin_trgm_ops)'),
+    ('ix_books_author_trgm', 'USING gin (author gin_trgm_ops)'),
+    ('ix_books_title_prefix', '(lower(title) text_pattern_ops)'),
+)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute(
+        f'ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector '
+        f'GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED'
+    )
+    # Build the indexes without blocking writes on large tables
+    with op.get_context().autocommit_block():
+        for name, definition in INDEXES:
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON books {definition}')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+    op.execute('ALTER TABLE books DROP COLUMN IF EXISTS search_vector')
@@ -0,0 +1,101 @@
+"""add circulation rollup tables
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 14:00:00.000000
+
+Creates the per book/day, per user/day, per day and all-time rollups read by
+``/stats`` and backfills them from ``book_transactions``. From then on
+``app.analytics`` keeps them up to date on every borrow and return.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# One row per borrow and per return, dated the day it happened
+EVENTS = (
+    "SELECT book_id, borrowed_by AS user_id, date(borrowed_at) AS day, 1 AS borrows, 0 AS returns "
+    "FROM book_transactions "
+    "UNION ALL "
+    "SELECT book_id, borrowed_by, date(returned_at), 0, 1 "
+    "FROM book_transactions WHERE returned AND returned_at IS NOT NULL"
+)
+
+BACKFILL = (
+    "INSERT INTO book_daily_stats (book_id, day, borrows, returns) "
+    "SELECT book_id, day, sum(borrows), sum(returns) FROM ({events}) AS events GROUP BY book_id, day",
+    "INSERT INTO user_daily_stats (user_id, day, borrows, returns) "
+    "SELECT user_id, day, sum(borrows), sum(returns) FROM ({events}) AS events GROUP BY user_id, day",
+    "INSERT INTO daily_stats (day, borrows, returns) "
+    "SELECT day, sum(borrows), sum(returns) FROM ({events}) AS events GROUP BY day",
+    "INSERT INTO book_stats (book_id, borrows, returns, active_loans) "
+    "SELECT book_id, sum(borrows), sum(returns), sum(borrows) - sum(returns) FROM ({events}) AS events GROUP BY book_id",
+    "INSERT INTO user_stats (user_id, borrows, returns, active_loans) "
+    "SELECT user_id, sum(borrows), sum(returns), sum(borrows) - sum(returns) FROM ({events}) AS events GROUP BY user_id",
+)
+
+
+def counters(*extra):
+    return [
+        sa.Column('borrows', sa.Integer(), nullable=False),
+        sa.Column('returns', sa.Integer(), nullable=False),
+        *extra,
+    ]
+
+
+def upgrade() -> None:
+    op.create_table(
+        'book_daily_stats',
+        sa.Column('book_id', sa.Integer(), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        *counters(),
+    )
+    op.create_index('ix_book_daily_stats_day', 'book_daily_stats', ['day'])
+    op.create_table(
+        'user_daily_stats',
+        sa.Column('user_id', sa.Integer(), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        *counters(),
+    )
+    op.create_index('ix_user_daily_stats_day', 'user_daily_stats', ['day'])
+    op.create_table(
+        'daily_stats',
+        sa.Column('day', sa.Date(), primary_key=True),
+        *counters(),
+    )
+    op.create_table(
+        'book_stats',
+        sa.Column('book_id', sa.Integer(), primary_key=True),
+        *counters(sa.Column('active_loans', sa.Integer(), nullable=False)),
+    )
+    op.create_index('ix_book_stats_borrows', 'book_stats', ['borrows'])
+    op.create_table(
+        'user_stats',
+        sa.Column('user_id', sa.Integer(), primary_key=True),
+        *counters(sa.Column('active_loans', sa.Integer(), nullable=False)),
+    )
+    op.create_index('ix_user_stats_active_loans', 'user_stats', ['active_loans'])
+
+    for statement in BACKFILL:
+        op.execute(statement.format(events=EVENTS))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_stats_active_loans', table_name='user_stats')
+    op.drop_table('user_stats')
+    op.drop_index('ix_book_stats_borrows', table_name='book_stats')
+    op.drop_table('book_stats')
+    op.drop_table('daily_stats')
+    op.drop_index('ix_user_daily_stats_day', table_name='user_daily_stats')
+    op.drop_table('user_daily_stats')
+    op.drop_index('ix_book_daily_stats_day', table_name='book_daily_stats')
+    op.drop_table('book_daily_stats')
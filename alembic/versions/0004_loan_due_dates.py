@@ -0,0 +1,67 @@
+"""add loan due dates, fines and the overdue scan index
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 16:00:00.000000
+
+Open loans get a due date of ``borrowed_at`` plus the default loan period
+and are scheduled for the next overdue scan. Returned loans keep a NULL due
+date and no fine. The partial index only covers open loans, so it stays
+small however long the history grows.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Default of the LOAN_PERIOD_DAYS setting
+LOAN_PERIOD_DAYS = 14
+
+INDEX = 'ix_book_transactions_open_next_reminder_at'
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    with op.batch_alter_table('book_transactions') as batch:
+        batch.add_column(sa.Column('due_at', sa.TIMESTAMP(timezone=True), nullable=True))
+        batch.add_column(sa.Column('next_reminder_at', sa.TIMESTAMP(timezone=True), nullable=True))
+        batch.add_column(sa.Column('fine_cents', sa.Integer(), nullable=False, server_default=sa.text('0')))
+
+    if dialect == 'postgresql':
+        due_at = f"borrowed_at + interval '{LOAN_PERIOD_DAYS} days'"
+    else:
+        due_at = f"datetime(borrowed_at, '+{LOAN_PERIOD_DAYS} days')"
+    op.execute(
+        f"UPDATE book_transactions SET due_at = {due_at}, next_reminder_at = {due_at} "
+        "WHERE returned = false"
+    )
+
+    if dialect == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index(INDEX, 'book_transactions', ['next_reminder_at', 'id'],
+                            postgresql_where=sa.text('returned = false'),
+                            postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index(INDEX, 'book_transactions', ['next_reminder_at', 'id'],
+                        sqlite_where=sa.text('returned = 0'))
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.drop_index(INDEX, table_name='book_transactions',
+                          postgresql_concurrently=True, if_exists=True)
+    else:
+        op.drop_index(INDEX, table_name='book_transactions')
+    with op.batch_alter_table('book_transactions') as batch:
+        batch.drop_column('fine_cents')
+        batch.drop_column('next_reminder_at')
+        batch.drop_column('due_at')
@@ -0,0 +1,50 @@
+"""add partial indexes over open loans by user and by book
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 20:00:00.000000
+
+Both indexes only cover loans that are not returned, so listing a user's
+current loans and finding the loan closed by a return read a handful of
+index entries whatever the length of the history.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = {
+    'ix_book_transactions_open_borrowed_by': ['borrowed_by', 'id'],
+    'ix_book_transactions_open_book_id': ['book_id', 'borrowed_at'],
+}
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, columns in INDEXES.items():
+                op.create_index(name, 'book_transactions', columns,
+                                postgresql_where=sa.text('returned = false'),
+                                postgresql_concurrently=True, if_not_exists=True)
+    else:
+        for name, columns in INDEXES.items():
+            op.create_index(name, 'book_transactions', columns, sqlite_where=sa.text('returned = 0'))
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name in INDEXES:
+                op.drop_index(name, table_name='book_transactions',
+                              postgresql_concurrently=True, if_exists=True)
+    else:
+        for name in INDEXES:
+            op.drop_index(name, table_name='book_transactions')
@@ -0,0 +1,37 @@
+"""add an index over books.updated_at
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 22:00:00.000000
+
+The Last-Modified of the book list pages is the latest updated_at, read
+from the end of this index instead of scanning the table.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index('ix_books_updated_at', 'books', ['updated_at'],
+                            postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index('ix_books_updated_at', 'books', ['updated_at'])
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.drop_index('ix_books_updated_at', table_name='books',
+                          postgresql_concurrently=True, if_exists=True)
+    else:
+        op.drop_index('ix_books_updated_at', table_name='books')
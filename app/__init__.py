@@ -1,16 +1,75 @@
-import logging
+import asyncio
+import contextlib
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.pool import QueuePool
 
 # Importing from internal modules
 from app import models
-from app.database import engine
+from app.database import (async_engine, async_replica_engines, engine, replica_engines, warm_async_pool,
+                          warm_pool)
+from app.metrics import MetricsMiddleware, instrument_engine, register_cache_metrics, register_hasher_metrics
+from app.crud import book_cache
+from app.oauth2 import user_cache
+from app.utils import password_hasher
+from app.overdue import notification_sink, run_overdue_scheduler
+from app.ratelimit import ConcurrencyLimitMiddleware, RateLimitMiddleware, create_rate_limit_backend
 
-from app.routers import users, auth, books
 from app.config import app_settings
 from app.settings import description
 from app.logging_config import logger
 
 
+def pool_warmup_connections() -> int:
+    """Returns how many connections to open at startup from the settings."""
+    if app_settings.DB_POOL_WARMUP_CONNECTIONS is not None:
+        return app_settings.DB_POOL_WARMUP_CONNECTIONS
+    return app_settings.DB_POOL_SIZE if app_settings.ENVIRONMENT == "production" else 0
+
+
+async def warm_up() -> None:
+    """Prepares the worker before it accepts requests.
+
+    Mappers are configured now rather than on the first query, and the
+    connection pool is filled so the first requests do not wait on
+    connecting. A database that is not reachable yet only gets logged: the
+    pool connects on demand once it is.
+    """
+    configure_mappers()
+    connections = pool_warmup_connections()
+    if connections <= 0:
+        return
+    try:
+        if app_settings.DB_MODE == "async":
+            if isinstance(async_engine.sync_engine.pool, QueuePool):
+                opened = await warm_async_pool(async_engine, connections)
+                logger.info("Opened %s database connections.", opened)
+        elif isinstance(engine.pool, QueuePool):
+            opened = await run_in_threadpool(warm_pool, engine, connections)
+            logger.info("Opened %s database connections.", opened)
+    except Exception as e:
+        logger.error("Database pool warmup failed: %s", e)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warms the worker up and runs the in-process background jobs for the lifetime of the app."""
+    await warm_up()
+    scheduler = None
+    if app_settings.OVERDUE_SCHEDULER_ENABLED:
+        scheduler = asyncio.create_task(
+            run_overdue_scheduler(notification_sink, app_settings.OVERDUE_SCAN_INTERVAL_SECONDS))
+        logger.info("Overdue scheduler started.")
+    try:
+        yield
+    finally:
+        if scheduler is not None:
+            scheduler.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await scheduler
+
 
 def initialize_app():
     """
@@ -26,23 +85,121 @@ def initialize_app():
         title=app_settings.APP_NAME,
         description=description,
         version="0.0.1",
-        debug=True,
-        root_path="/api"
+        debug=app_settings.DEBUG,
+        root_path="/api",
+        # orjson is several times faster than the stdlib encoder for list responses
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan,
     )
 
-    # Create database tables
-    try:
-        models.Base.metadata.create_all(bind=engine)
-    except Exception as e:
-        logger.info(f"Exception {e}")
+    # Create missing tables outside production, where the schema is managed
+    # by Alembic migrations only (revision 0000 creates the base tables)
+    if app_settings.ENVIRONMENT != "production":
+        try:
+            models.Base.metadata.create_all(bind=engine)
+        except Exception as e:
+            logger.info("Exception %s", e)
+
+
+    # Include routers for different functionalities, using the async
+    # request path when DB_MODE is "async"; only the routers of the mode in
+    # use are imported
+    if app_settings.DB_MODE == "async":
+        from app.routers.aio import users as async_users, auth as async_auth, books as async_books, \
+            stats as async_stats
+        app.include_router(async_users.router)
+        app.include_router(async_auth.router)
+        app.include_router(async_books.router)
+        app.include_router(async_stats.router)
+    else:
+        from app.routers import users, auth, books, stats
+        app.include_router(users.router)
+        app.include_router(auth.router)
+        app.include_router(books.router)
+        app.include_router(stats.router)
+
+    # Shed load beyond what the DB pool can serve, then rate limit each
+    # client; the later middleware runs first, so rejected requests never
+    # take a concurrency slot
+    max_concurrent = app_settings.MAX_CONCURRENT_REQUESTS
+    if max_concurrent is None:
+        max_concurrent = app_settings.DB_POOL_SIZE + app_settings.DB_MAX_OVERFLOW
+    if max_concurrent > 0:
+        app.add_middleware(
+            ConcurrencyLimitMiddleware,
+            max_requests=max_concurrent,
+            retry_after_seconds=app_settings.ADMISSION_RETRY_AFTER_SECONDS,
+            exempt=app_settings.ADMISSION_EXEMPT_ROUTES,
+        )
+    # Replay the responses of repeated Idempotency-Keys; inside the rate
+    # limiter, but replays never take a concurrency slot
+    if app_settings.IDEMPOTENCY_ENABLED:
+        from app.idempotency import IdempotencyMiddleware, create_idempotency_backend
+        app.add_middleware(
+            IdempotencyMiddleware,
+            backend=create_idempotency_backend(
+                app_settings.IDEMPOTENCY_BACKEND,
+                maxsize=app_settings.IDEMPOTENCY_MAXSIZE,
+                ttl_seconds=app_settings.IDEMPOTENCY_TTL_SECONDS,
+                redis_url=app_settings.IDEMPOTENCY_REDIS_URL,
+            ),
+            routes=app_settings.IDEMPOTENCY_ROUTES,
+            ttl_seconds=app_settings.IDEMPOTENCY_TTL_SECONDS,
+            lock_seconds=app_settings.IDEMPOTENCY_LOCK_SECONDS,
+        )
+    if app_settings.RATE_LIMIT_ENABLED:
+        app.add_middleware(
+            RateLimitMiddleware,
+            backend=create_rate_limit_backend(
+                app_settings.RATE_LIMIT_BACKEND,
+                maxsize=app_settings.RATE_LIMIT_MAXSIZE,
+                redis_url=app_settings.RATE_LIMIT_REDIS_URL,
+            ),
+            limits=app_settings.RATE_LIMITS,
+            default=app_settings.RATE_LIMIT_DEFAULT,
+            exempt=app_settings.ADMISSION_EXEMPT_ROUTES,
+        )
+
+    # Record request, query and pool metrics and serve them at /metrics
+    if app_settings.METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
+        instrument_engine(engine)
+        if async_engine is not None:
+            instrument_engine(async_engine, name="async")
+        for index, replica in enumerate(replica_engines):
+            instrument_engine(replica, name=f"replica{index}")
+        for index, replica in enumerate(async_replica_engines):
+            instrument_engine(replica, name=f"async_replica{index}")
+        register_cache_metrics("auth_user", user_cache)
+        if book_cache is not None:
+            register_cache_metrics("book", book_cache)
+        register_hasher_metrics(password_hasher)
+        from app.routers import metrics
+        app.include_router(metrics.router)
 
+    # Count the SQL statements of each request against its budget
+    if app_settings.QUERY_BUDGET_MODE:
+        from app.querybudget import QueryBudgetMiddleware
+        app.add_middleware(
+            QueryBudgetMiddleware,
+            mode=app_settings.QUERY_BUDGET_MODE,
+            default=app_settings.QUERY_BUDGET_DEFAULT,
+            budgets=app_settings.QUERY_BUDGETS,
+        )
 
-    # Include routers for different functionalities
-    app.include_router(users.router)
-    app.include_router(auth.router)
-    app.include_router(books.router)
+    # Compress responses last, so every middleware above sees them as sent
+    # by the routes and recorded responses are replayed in any encoding
+    if app_settings.COMPRESSION_ENABLED:
+        from app.compression import CompressionMiddleware
+        app.add_middleware(
+            CompressionMiddleware,
+            levels=app_settings.COMPRESSION_LEVELS,
+            encodings=app_settings.COMPRESSION_ENCODINGS,
+            minimum_size=app_settings.COMPRESSION_MINIMUM_SIZE,
+            offload_size=app_settings.COMPRESSION_OFFLOAD_SIZE,
+        )
 
     # Log initialization message
-    logging.info('FastAPI application initialized successfully.')
+    logger.info('FastAPI application initialized successfully.')
 
     return app
@@ -0,0 +1,291 @@
+"""Circulation rollups behind the /stats endpoints.
+
+Aggregating ``book_transactions`` on every request gets slower as the history
+grows and competes with borrowing for the same table. Instead each borrow and
+return increments a few counters per book, user and day in the same
+transaction, so the statistics read a bounded number of rows whatever the
+size of the history. ``rebuild`` recomputes every rollup from the history,
+to backfill or repair them:
+
+    python -m app.analytics rebuild
+"""
+import argparse
+import sys
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, func, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import app_settings
+from app.database import SessionLocal, replica_reads
+
+
+class CirculationEvent(NamedTuple):
+    book_id: int
+    user_id: int
+    day: date
+    borrowed: bool
+
+
+def loan_events(transactions: Iterable[models.BookTransactions], borrowed: bool) -> List[CirculationEvent]:
+    """Returns the borrow (or return) events of ``transactions``."""
+    events = []
+    for transaction in transactions:
+        happened_at = transaction.borrowed_at if borrowed else transaction.returned_at
+        day = (happened_at or datetime.now()).date()
+        events.append(CirculationEvent(transaction.book_id, transaction.borrowed_by, day, borrowed))
+    return events
+
+
+def _upsert(dialect_name: str):
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Circulation rollups do not support '{dialect_name}' databases")
+    return insert
+
+
+def circulation_statements(dialect_name: str, events: Iterable[CirculationEvent]):
+    """Returns the upserts adding ``events`` to every rollup.
+
+    Events on the same row are merged into one statement, and the statements
+    are sorted so concurrent transactions lock the rollup rows in the same
+    order.
+    """
+    deltas: Dict[Tuple, Counter] = {}
+    for event in events:
+        column = "borrows" if event.borrowed else "returns"
+        active = 1 if event.borrowed else -1
+        for model, keys, totals in (
+            (models.BookDailyStats, (("book_id", event.book_id), ("day", event.day)), False),
+            (models.UserDailyStats, (("user_id", event.user_id), ("day", event.day)), False),
+            (models.DailyStats, (("day", event.day),), False),
+            (models.BookStats, (("book_id", event.book_id),), True),
+            (models.UserStats, (("user_id", event.user_id),), True),
+        ):
+            counter = deltas.setdefault((model.__tablename__, keys, model), Counter())
+            counter[column] += 1
+            if totals:
+                counter["active_loans"] += active
+
+    insert = _upsert(dialect_name)
+    statements = []
+    for (_, keys, model), counter in sorted(deltas.items(), key=lambda item: item[0][:2]):
+        table = model.__table__
+        values = {"borrows": 0, "returns": 0, **counter}
+        statement = insert(table).values(**dict(keys), **values)
+        statements.append(statement.on_conflict_do_update(
+            index_elements=[name for name, _ in keys],
+            set_={name: table.c[name] + statement.excluded[name] for name in counter},
+        ))
+    return statements
+
+
+def record_circulation(db: Session, events: List[CirculationEvent]) -> None:
+    """Adds ``events`` to the rollups within the caller's transaction."""
+    if not app_settings.STATS_ROLLUPS_ENABLED or not events:
+        return
+    for statement in circulation_statements(db.get_bind().dialect.name, events):
+        db.execute(statement)
+
+
+async def record_circulation_async(db: AsyncSession, events: List[CirculationEvent]) -> None:
+    if not app_settings.STATS_ROLLUPS_ENABLED or not events:
+        return
+    for statement in circulation_statements(db.get_bind().dialect.name, events):
+        await db.execute(statement)
+
+
+def _since(days: int) -> date:
+    return date.today() - timedelta(days=days - 1)
+
+
+def top_books_statement(days: Optional[int], limit: int):
+    """Most borrowed books of the last ``days`` days, or of all time when None."""
+    if days is None:
+        return select(
+            models.BookStats.book_id, models.Books.title, models.BookStats.borrows,
+            models.BookStats.returns, models.BookStats.active_loans,
+        ).outerjoin(models.Books, models.Books.id == models.BookStats.book_id).order_by(
+            models.BookStats.borrows.desc(), models.BookStats.book_id
+        ).limit(limit)
+
+    window = select(
+        models.BookDailyStats.book_id,
+        func.sum(models.BookDailyStats.borrows).label("borrows"),
+        func.sum(models.BookDailyStats.returns).label("returns"),
+    ).where(models.BookDailyStats.day >= _since(days)).group_by(models.BookDailyStats.book_id).order_by(
+        func.sum(models.BookDailyStats.borrows).desc(), models.BookDailyStats.book_id
+    ).limit(limit).subquery()
+    return select(
+        window.c.book_id, models.Books.title, window.c.borrows, window.c.returns,
+        func.coalesce(models.BookStats.active_loans, 0).label("active_loans"),
+    ).outerjoin(models.Books, models.Books.id == window.c.book_id).outerjoin(
+        models.BookStats, models.BookStats.book_id == window.c.book_id
+    ).order_by(window.c.borrows.desc(), window.c.book_id)
+
+
+def top_users_statement(limit: int):
+    """Users with the most open loans."""
+    return select(
+        models.UserStats.user_id, models.Users.name, models.UserStats.borrows,
+        models.UserStats.returns, models.UserStats.active_loans,
+    ).outerjoin(models.Users, models.Users.id == models.UserStats.user_id).where(
+        models.UserStats.active_loans > 0
+    ).order_by(models.UserStats.active_loans.desc(), models.UserStats.user_id).limit(limit)
+
+
+def book_stats_statement(book_id: int):
+    return select(
+        models.Books.id.label("book_id"), models.Books.title,
+        func.coalesce(models.BookStats.borrows, 0).label("borrows"),
+        func.coalesce(models.BookStats.returns, 0).label("returns"),
+        func.coalesce(models.BookStats.active_loans, 0).label("active_loans"),
+    ).outerjoin(models.BookStats, models.BookStats.book_id == models.Books.id).where(models.Books.id == book_id)
+
+
+def user_stats_statement(user_id: int):
+    return select(
+        models.Users.id.label("user_id"), models.Users.name,
+        func.coalesce(models.UserStats.borrows, 0).label("borrows"),
+        func.coalesce(models.UserStats.returns, 0).label("returns"),
+        func.coalesce(models.UserStats.active_loans, 0).label("active_loans"),
+    ).outerjoin(models.UserStats, models.UserStats.user_id == models.Users.id).where(models.Users.id == user_id)
+
+
+def daily_statement(days: int):
+    """Library-wide borrows and returns per day, oldest first; days without any are omitted."""
+    return select(models.DailyStats.day, models.DailyStats.borrows, models.DailyStats.returns).where(
+        models.DailyStats.day >= _since(days)
+    ).order_by(models.DailyStats.day)
+
+
+@replica_reads
+def top_books(db: Session, days: Optional[int] = None, limit: int = 10) -> List[dict]:
+    return [dict(row) for row in db.execute(top_books_statement(days, limit)).mappings()]
+
+
+@replica_reads
+def top_users(db: Session, limit: int = 10) -> List[dict]:
+    return [dict(row) for row in db.execute(top_users_statement(limit)).mappings()]
+
+
+@replica_reads
+def book_stats(db: Session, book_id: int) -> Optional[dict]:
+    """Returns the totals of a book, or None if it does not exist."""
+    row = db.execute(book_stats_statement(book_id)).mappings().first()
+    return dict(row) if row else None
+
+
+@replica_reads
+def user_stats(db: Session, user_id: int) -> Optional[dict]:
+    """Returns the totals of a user, or None if they do not exist."""
+    row = db.execute(user_stats_statement(user_id)).mappings().first()
+    return dict(row) if row else None
+
+
+@replica_reads
+def daily_circulation(db: Session, days: int = 30) -> List[dict]:
+    return [dict(row) for row in db.execute(daily_statement(days)).mappings()]
+
+
+@replica_reads
+async def top_books_async(db: AsyncSession, days: Optional[int] = None, limit: int = 10) -> List[dict]:
+    return [dict(row) for row in (await db.execute(top_books_statement(days, limit))).mappings()]
+
+
+@replica_reads
+async def top_users_async(db: AsyncSession, limit: int = 10) -> List[dict]:
+    return [dict(row) for row in (await db.execute(top_users_statement(limit))).mappings()]
+
+
+@replica_reads
+async def book_stats_async(db: AsyncSession, book_id: int) -> Optional[dict]:
+    row = (await db.execute(book_stats_statement(book_id))).mappings().first()
+    return dict(row) if row else None
+
+
+@replica_reads
+async def user_stats_async(db: AsyncSession, user_id: int) -> Optional[dict]:
+    row = (await db.execute(user_stats_statement(user_id))).mappings().first()
+    return dict(row) if row else None
+
+
+@replica_reads
+async def daily_circulation_async(db: AsyncSession, days: int = 30) -> List[dict]:
+    return [dict(row) for row in (await db.execute(daily_statement(days))).mappings()]
+
+
+def rebuild(db: Session) -> None:
+    """Recomputes every rollup from ``book_transactions`` in one transaction.
+
+    Loans made while it runs may be counted twice or not at all, so run it
+    while borrowing is stopped (or with STATS_ROLLUPS_ENABLED off, followed
+    by a second run once it is back on).
+    """
+    transactions = models.BookTransactions
+    events = union_all(
+        select(
+            transactions.book_id, transactions.borrowed_by.label("user_id"),
+            func.date(transactions.borrowed_at).label("day"),
+            literal(1).label("borrows"), literal(0).label("returns"),
+        ),
+        select(
+            transactions.book_id, transactions.borrowed_by, func.date(transactions.returned_at),
+            literal(0), literal(1),
+        ).where(transactions.returned == True, transactions.returned_at.isnot(None)),
+    ).subquery()
+    borrows = func.sum(events.c.borrows)
+    returns = func.sum(events.c.returns)
+
+    try:
+        for model in (models.BookDailyStats, models.UserDailyStats, models.DailyStats,
+                      models.BookStats, models.UserStats):
+            db.execute(delete(model))
+        db.execute(models.BookDailyStats.__table__.insert().from_select(
+            ["book_id", "day", "borrows", "returns"],
+            select(events.c.book_id, events.c.day, borrows, returns).group_by(events.c.book_id, events.c.day),
+        ))
+        db.execute(models.UserDailyStats.__table__.insert().from_select(
+            ["user_id", "day", "borrows", "returns"],
+            select(events.c.user_id, events.c.day, borrows, returns).group_by(events.c.user_id, events.c.day),
+        ))
+        db.execute(models.DailyStats.__table__.insert().from_select(
+            ["day", "borrows", "returns"],
+            select(events.c.day, borrows, returns).group_by(events.c.day),
+        ))
+        db.execute(models.BookStats.__table__.insert().from_select(
+            ["book_id", "borrows", "returns", "active_loans"],
+            select(events.c.book_id, borrows, returns, borrows - returns).group_by(events.c.book_id),
+        ))
+        db.execute(models.UserStats.__table__.insert().from_select(
+            ["user_id", "borrows", "returns", "active_loans"],
+            select(events.c.user_id, borrows, returns, borrows - returns).group_by(events.c.user_id),
+        ))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.analytics", description="Maintain the circulation rollups.")
+    parser.add_argument("command", choices=("rebuild",), help="rebuild: recompute every rollup from the loan history")
+    parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        rebuild(db)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
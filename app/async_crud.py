@@ -0,0 +1,270 @@
+"""Async counterparts of the functions in ``app.crud`` for DB_MODE=async."""
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.analytics import loan_events, record_circulation_async
+from app.cache import CachedBody, make_etag
+from app.database import primary_reads, replica_reads
+from app.pagination import as_utc
+from app.crud import (
+    BOOK_LOAD_OPTIONS,
+    HISTORY_COLUMNS,
+    HISTORY_ORDER,
+    BookNotFoundError,
+    BookUnavailableError,
+    LoanNotFoundError,
+    ALL_BOOKS_NAMESPACE,
+    BOOK_LIST_NAMESPACE,
+    book_cache,
+    book_namespaces,
+    books_count,
+    books_last_modified,
+    books_page_key,
+    borrowed_by_user_statement,
+    close_loan_statement,
+    invalidate_books,
+    serialize_book,
+    serialize_books_page,
+    with_next_cursor,
+    history_filters,
+    new_loan,
+    release_copy_statement,
+    settle_fine,
+    take_copy_statement,
+)
+from app.schemes import BookCreate, BookUpdate
+
+
+async def add_book(db: AsyncSession, book: BookCreate):
+    db_book = models.Books(**book.model_dump())
+    db.add(db_book)
+    await db.commit()
+    await db.refresh(db_book)
+    books_count.invalidate()
+    invalidate_books(db_book.id)
+    return db_book
+
+
+@replica_reads
+async def get_all_books(db: AsyncSession, skip: int = 0, limit: int = 10):
+    result = await db.scalars(
+        select(models.Books).options(*BOOK_LOAD_OPTIONS).order_by(models.Books.id).offset(skip).limit(limit))
+    return result.all()
+
+
+@replica_reads
+async def get_books_by_ids(db: AsyncSession, book_ids: Sequence[int]) -> Dict[int, models.Books]:
+    """Returns the existing books among ``book_ids`` by id, in one IN query."""
+    return {book.id: book for book in await db.scalars(
+        select(models.Books).options(*BOOK_LOAD_OPTIONS).where(models.Books.id.in_(book_ids)))}
+
+
+@replica_reads
+async def get_books_after(db: AsyncSession, after_id: int = 0, limit: int = 10):
+    """Returns up to ``limit`` books with an id greater than ``after_id``."""
+    result = await db.scalars(
+        select(models.Books).options(*BOOK_LOAD_OPTIONS).where(models.Books.id > after_id).order_by(
+            models.Books.id).limit(limit))
+    return result.all()
+
+
+@replica_reads
+async def get_newest_book_update(db: AsyncSession) -> Optional[datetime]:
+    """Returns the latest ``Books.updated_at``, from the end of its index."""
+    return await db.scalar(select(func.max(models.Books.updated_at)))
+
+
+async def count_books(db: AsyncSession) -> int:
+    """Returns the total number of books, served from a short-lived cache."""
+    total = books_count.peek()
+    if total is None:
+        total = await db.scalar(select(func.count(models.Books.id)))
+        books_count.set(total)
+    return total
+
+
+@replica_reads
+async def get_book_by_id(db: AsyncSession, book_id: int):
+    return await db.get(models.Books, book_id, options=BOOK_LOAD_OPTIONS)
+
+
+async def read_book(db: AsyncSession, book_id: int) -> Optional[CachedBody]:
+    """Returns the serialized book, from the cache when possible, or None if it does not exist."""
+    key = None
+    if book_cache is not None:
+        key = book_cache.key(book_namespaces(book_id), f"book:{book_id}")
+        cached = book_cache.get(key)
+        if cached is not None:
+            return cached
+    # Books stored in the cache are read from the primary, see crud.read_book
+    with primary_reads(db) if key is not None else nullcontext():
+        book = await get_book_by_id(db, book_id)
+    if book is None:
+        return None
+    body = serialize_book(book)
+    if key is None:
+        return CachedBody(make_etag(body), body, as_utc(book.updated_at))
+    return book_cache.set(key, body, as_utc(book.updated_at))
+
+
+async def read_books_page(db: AsyncSession, page: int, page_size: int, after_id: Optional[int] = None) -> CachedBody:
+    """Returns a serialized page of books, from the cache when possible."""
+    key = None
+    if book_cache is not None:
+        key = book_cache.key((ALL_BOOKS_NAMESPACE, BOOK_LIST_NAMESPACE), books_page_key(page, page_size, after_id))
+        cached = book_cache.get(key)
+        if cached is not None:
+            return cached
+    with primary_reads(db) if key is not None else nullcontext():
+        if after_id is not None:
+            books = await get_books_after(db, after_id=after_id, limit=page_size + 1)
+        else:
+            books = await get_all_books(db, skip=(page - 1) * page_size, limit=page_size + 1)
+        books, next_cursor = with_next_cursor(books, page_size)
+        total = await count_books(db)
+        newest_update = await get_newest_book_update(db)
+    body = serialize_books_page(books, total, next_cursor)
+    last_modified = books_last_modified.observe(newest_update, total)
+    if key is None:
+        return CachedBody(make_etag(body), body, last_modified)
+    return book_cache.set(key, body, last_modified)
+
+
+async def update_book(db: AsyncSession, book_id: int, new_book_data: BookUpdate):
+    book = await db.get(models.Books, book_id)
+    if book:
+        for key, value in new_book_data.model_dump().items():
+            setattr(book, key, value)
+        await db.commit()
+        await db.refresh(book)
+        invalidate_books(book_id)
+        return book
+    return None
+
+
+async def delete_book(db: AsyncSession, book_id: int):
+    book = await db.get(models.Books, book_id)
+    if book:
+        await db.delete(book)
+        await db.commit()
+        books_count.invalidate()
+        invalidate_books(book_id)
+        return True
+    return False
+
+
+async def _take_copy(db: AsyncSession, book_id: int) -> models.Books:
+    book = (await db.scalars(take_copy_statement(book_id))).first()
+    if book is None:
+        if await db.get(models.Books, book_id) is None:
+            raise BookNotFoundError("Book not found")
+        raise BookUnavailableError("Book is not available for borrowing")
+    return book
+
+
+async def borrow_book(db: AsyncSession, book_id: int, user_id: int):
+    """Lend one copy of a book to a user in a single transaction."""
+    try:
+        book = await _take_copy(db, book_id)
+        book_transaction = new_loan(book, user_id)
+        db.add(book_transaction)
+        await record_circulation_async(db, loan_events([book_transaction], borrowed=True))
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    invalidate_books(book_id)
+    return book_transaction
+
+
+async def borrow_books(db: AsyncSession, book_ids: List[int], user_id: int):
+    """Lend one copy of each book to a user, all or nothing, in one transaction."""
+    if len(set(book_ids)) != len(book_ids):
+        raise ValueError("Each book can only be borrowed once per batch")
+    try:
+        books = {}
+        for book_id in sorted(book_ids):
+            books[book_id] = await _take_copy(db, book_id)
+        transactions = [new_loan(books[book_id], user_id) for book_id in book_ids]
+        db.add_all(transactions)
+        await record_circulation_async(db, loan_events(transactions, borrowed=True))
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    invalidate_books(*book_ids)
+    return transactions
+
+
+async def return_book(db: AsyncSession, book_id: int, user_id: int = None):
+    """Close the open loan of a book and put the copy back in one transaction."""
+    try:
+        transaction = (await db.scalars(close_loan_statement(book_id, user_id))).first()
+        if not transaction:
+            raise LoanNotFoundError("Book transaction not found or already returned")
+        transaction.book = (await db.scalars(release_copy_statement(book_id))).first()
+        settle_fine(transaction)
+        await record_circulation_async(db, loan_events([transaction], borrowed=False))
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    invalidate_books(book_id)
+    return transaction
+
+
+@replica_reads
+async def get_books_borrowed_by_user(db: AsyncSession, user_id: int, active_only: bool = False,
+                                     after_id: Optional[int] = None, limit: Optional[int] = None):
+    """Returns the user's loans as rows of ``BORROWED_FIELDS``, see ``borrowed_by_user_statement``."""
+    result = await db.execute(borrowed_by_user_statement(user_id, active_only, after_id, limit))
+    return result.all()
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(models.Users).where(models.Users.email == email).limit(1))
+
+
+@replica_reads
+async def get_user_book_history(
+    db: AsyncSession,
+    user_id: str = None,
+    book_title: str = None,
+    transaction_type: str = None,
+    date: datetime = None,
+    skip: int = 0,
+    limit: int = None
+):
+    """Returns one page of history as rows of ``HISTORY_FIELDS``."""
+    query = select(*HISTORY_COLUMNS).select_from(models.Books).join(
+        models.BookTransactions, models.BookTransactions.book_id == models.Books.id
+    ).where(
+        *history_filters(user_id, book_title, transaction_type, date)
+    ).order_by(*HISTORY_ORDER).offset(skip).limit(limit)
+
+    result = await db.execute(query)
+    return result.all()
+
+
+async def iter_user_book_history(
+    db: AsyncSession,
+    user_id: str = None,
+    book_title: str = None,
+    transaction_type: str = None,
+    date: datetime = None,
+    chunk_size: int = 1000
+):
+    """Yield history rows as mappings of ``HISTORY_FIELDS`` through a server-side cursor."""
+    query = select(*HISTORY_COLUMNS).select_from(models.Books).join(
+        models.BookTransactions, models.BookTransactions.book_id == models.Books.id
+    ).where(
+        *history_filters(user_id, book_title, transaction_type, date)
+    ).order_by(*HISTORY_ORDER).execution_options(yield_per=chunk_size)
+    result = await db.stream(query)
+    async for row in result:
+        yield row._mapping
@@ -0,0 +1,220 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Hashable, Optional, Sequence
+
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU cache whose entries expire after a TTL.
+
+    Hit and miss counters are kept so callers can report cache efficiency.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the cached value for ``key`` or None if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """Stores ``value`` under ``key``, evicting the least recently used entry."""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Removes ``key`` from the cache if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the hit/miss counters and the current size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+class CachedBody:
+    """Serialized response body together with its ETag and, if known, its last modification."""
+
+    __slots__ = ("etag", "body", "last_modified")
+
+    def __init__(self, etag: str, body: bytes, last_modified: Optional[datetime] = None):
+        self.etag = etag
+        self.body = body
+        self.last_modified = last_modified
+
+    def encode(self) -> bytes:
+        header = self.etag
+        if self.last_modified is not None:
+            header += " " + self.last_modified.isoformat()
+        return header.encode() + b"\n" + self.body
+
+    @classmethod
+    def decode(cls, data: bytes) -> "CachedBody":
+        header, body = data.split(b"\n", 1)
+        etag, _, last_modified = header.decode().partition(" ")
+        return cls(etag, body, datetime.fromisoformat(last_modified) if last_modified else None)
+
+
+class CacheBackend:
+    """Key/value store used by ``ResponseCache``.
+
+    Backends with ``stores_objects`` keep values as given, the others only
+    store bytes.
+    """
+
+    stores_objects = False
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": 0}
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Process-local LRU backend. Each worker process has its own copy."""
+
+    stores_objects = True
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl_seconds=ttl_seconds)
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        self._cache.set(key, value, ttl_seconds)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._cache)}
+
+
+def redis_client(url: Optional[str], asynchronous: bool = False):
+    """Returns a client of the Redis-compatible server at ``url`` for the redis backends.
+
+    Requires the optional ``redis`` package. ``asynchronous`` returns a
+    ``redis.asyncio`` client, for the backends used on the event loop.
+    """
+    if not url:
+        raise ValueError("The redis backends need a redis URL")
+    try:
+        import redis
+        import redis.asyncio
+    except ImportError as e:
+        raise RuntimeError("The redis backends require the 'redis' package") from e
+    return (redis.asyncio.Redis if asynchronous else redis.Redis).from_url(url)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Backend shared by every worker through a Redis-compatible server."""
+
+    def __init__(self, url: Optional[str]):
+        self._client = redis_client(url)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        self._client.set(key, value, px=int(ttl_seconds * 1000))
+
+
+def create_cache_backend(backend: str, maxsize: int, ttl_seconds: float, redis_url: Optional[str] = None) -> CacheBackend:
+    """Builds the cache backend named by the settings ("memory" or "redis")."""
+    if backend == "memory":
+        return MemoryCacheBackend(maxsize=maxsize, ttl_seconds=ttl_seconds)
+    if backend == "redis":
+        return RedisCacheBackend(redis_url)
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+class ResponseCache:
+    """Read-through cache of serialized responses with namespace invalidation.
+
+    Every namespace has a version token that is part of the keys written under
+    it. Invalidating a namespace replaces its token, which makes every entry
+    written under the old token unreachable. A reader that loaded data just
+    before a write can therefore only store it under a stale key, and never
+    serves it after the write.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl_seconds: float, prefix: str = "librarian"):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def _version(self, namespace: str) -> str:
+        version_key = f"{self.prefix}:{namespace}:version"
+        version = self.backend.get(version_key)
+        if version is None:
+            version = uuid.uuid4().hex.encode()
+            # Versions outlive the entries they guard
+            self.backend.set(version_key, version, self.ttl_seconds * 2)
+        return version.decode() if isinstance(version, bytes) else version
+
+    def key(self, namespaces: Sequence[str], name: str) -> str:
+        """Returns the current key for ``name`` under the given namespaces."""
+        versions = ".".join(self._version(namespace) for namespace in namespaces)
+        return f"{self.prefix}:{name}:{versions}"
+
+    def get(self, key: str) -> Optional[CachedBody]:
+        data = self.backend.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data if self.backend.stores_objects else CachedBody.decode(data)
+
+    def set(self, key: str, body: bytes, last_modified: Optional[datetime] = None) -> CachedBody:
+        cached = CachedBody(make_etag(body), body, last_modified)
+        self.backend.set(key, cached if self.backend.stores_objects else cached.encode(), self.ttl_seconds)
+        return cached
+
+    def invalidate(self, *namespaces: str) -> None:
+        """Makes every entry written under ``namespaces`` unreachable."""
+        for namespace in namespaces:
+            self.backend.set(f"{self.prefix}:{namespace}:version", uuid.uuid4().hex.encode(), self.ttl_seconds * 2)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, **self.backend.stats()}
+
+
+def make_etag(body: bytes) -> str:
+    """Returns a strong ETag for a response body."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
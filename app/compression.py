@@ -0,0 +1,240 @@
+"""Negotiated response compression.
+
+``CompressionMiddleware`` compresses the responses whose media type has
+levels in ``COMPRESSION_LEVELS`` with the encoding the client prefers among
+``COMPRESSION_ENCODINGS``: zstd and br when the optional ``zstandard`` and
+``brotli`` packages are installed, gzip always.
+
+- Complete bodies under ``COMPRESSION_MINIMUM_SIZE`` bytes are sent as is.
+- Streamed responses (``more_body``) are compressed chunk by chunk, each
+  chunk flushed so the client receives it without waiting for the rest.
+- Data of at least ``COMPRESSION_OFFLOAD_SIZE`` bytes is compressed in the
+  thread pool, the codecs releasing the GIL, so large history pages and
+  exports do not block the event loop.
+
+Responses of a compressible media type carry ``Vary: Accept-Encoding`` and a
+weak ETag, which still matches its strong form in ``If-None-Match``, whether
+or not their body was large enough to compress. A 304 answering a request
+that negotiated an encoding gets the same, so it sends the validator the 200
+would have sent.
+"""
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.logging_config import logger
+
+# Statuses sent without a body
+BODYLESS_STATUSES = frozenset({204, 205, 304})
+
+
+class Encoder:
+    """Incremental compressor of one response."""
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def flush(self) -> bytes:
+        """Returns everything compressed so far, keeping the stream open."""
+        raise NotImplementedError
+
+    def finish(self) -> bytes:
+        raise NotImplementedError
+
+
+class GzipEncoder(Encoder):
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder(Encoder):
+    def __init__(self, level: int):
+        import brotli
+
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder(Encoder):
+    def __init__(self, level: int):
+        import zstandard
+
+        self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(self._flush_mode)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+ENCODERS = {"zstd": ZstdEncoder, "br": BrotliEncoder, "gzip": GzipEncoder}
+
+# Optional package each encoding needs
+ENCODING_PACKAGES = {"zstd": "zstandard", "br": "brotli"}
+
+
+def available_encodings(encodings: Iterable[str]) -> List[str]:
+    """Returns ``encodings`` without the unknown ones and those whose package is missing."""
+    available = []
+    for encoding in encodings:
+        if encoding not in ENCODERS:
+            raise ValueError(f"Unknown compression encoding: {encoding}")
+        package = ENCODING_PACKAGES.get(encoding)
+        if package is not None:
+            try:
+                __import__(package)
+            except ImportError:
+                logger.info("Compression with %s disabled, the '%s' package is not installed.", encoding, package)
+                continue
+        available.append(encoding)
+    return available
+
+
+def negotiate(accept_encoding: str, encodings: List[str]) -> Optional[str]:
+    """Returns the encoding of ``encodings`` the Accept-Encoding header prefers.
+
+    Ties go to the earlier of ``encodings``; None if the client accepts none.
+    """
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+    default = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for encoding in encodings:
+        weight = weights.get(encoding, default)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with the encoding negotiated per request."""
+
+    def __init__(self, app, levels: Dict[str, Dict[str, int]], encodings: Iterable[str],
+                 minimum_size: int, offload_size: int):
+        self.app = app
+        self.levels = levels
+        self.encodings = available_encodings(encodings)
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder: Optional[Encoder] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, encoder, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # Held back until the first body tells whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                level = self._level(start, encoding)
+                headers = MutableHeaders(scope=start)
+                if level is not None or self._revalidates(start, encoding):
+                    headers.add_vary_header("Accept-Encoding")
+                    etag = headers.get("etag")
+                    if etag is not None and not etag.startswith("W/"):
+                        headers["ETag"] = "W/" + etag
+                if level is None or (not more_body and len(body) < self.minimum_size):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                encoder = ENCODERS[encoding](level)
+                headers["Content-Encoding"] = encoding
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    data = await self._compress(encoder, body, finish=True)
+                    headers["Content-Length"] = str(len(data))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                await send(start)
+
+            data = await self._compress(encoder, body, finish=not more_body)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _level(self, start, encoding: str) -> Optional[int]:
+        """Returns the level to compress this response at, None to send it as is."""
+        if start["status"] < 200 or start["status"] in BODYLESS_STATUSES:
+            return None
+        headers = Headers(raw=start.get("headers", []))
+        if "content-encoding" in headers or "content-range" in headers:
+            return None
+        media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+        return self.levels.get(media_type, {}).get(encoding)
+
+    def _revalidates(self, start, encoding: str) -> bool:
+        """Returns True for a 304 whose 200 could have been sent with ``encoding``.
+
+        A 304 carries no Content-Type, so any media type compressed with
+        ``encoding`` counts.
+        """
+        return start["status"] == 304 and any(encoding in levels for levels in self.levels.values())
+
+    async def _compress(self, encoder: Encoder, data: bytes, finish: bool) -> bytes:
+        if len(data) >= self.offload_size:
+            return await run_in_threadpool(_encode, encoder, data, finish)
+        return _encode(encoder, data, finish)
+
+
+def _encode(encoder: Encoder, data: bytes, finish: bool) -> bytes:
+    compressed = encoder.compress(data)
+    return compressed + (encoder.finish() if finish else encoder.flush())
@@ -0,0 +1,55 @@
+"""Conditional request handling for cached JSON responses."""
+import time
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+from app.cache import CachedBody
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Returns True if the request's If-None-Match header matches ``etag``."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    # Weak comparison, as required for If-None-Match
+    return "*" in candidates or etag in (c[2:] if c.startswith("W/") else c for c in candidates)
+
+
+def not_modified_since(request: Request, last_modified: Optional[datetime]) -> bool:
+    """Returns True if ``last_modified`` is not after the request's If-Modified-Since date.
+
+    Ignored when the request has If-None-Match, which takes precedence, or
+    an invalid date.
+    """
+    header = request.headers.get("if-modified-since")
+    if not header or last_modified is None or "if-none-match" in request.headers:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    # HTTP dates have a one second resolution
+    return last_modified.replace(microsecond=0) <= since
+
+
+def cached_json_response(request: Request, cached: CachedBody) -> Response:
+    """Returns the cached body, or an empty 304 if the client already has it.
+
+    Last-Modified is left out while it falls within the current second: a
+    later change in that second would carry the same HTTP date.
+    """
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    last_modified = cached.last_modified
+    if last_modified is not None and int(last_modified.timestamp()) >= int(time.time()):
+        last_modified = None
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    if etag_matches(request, cached.etag) or not_modified_since(request, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
@@ -1,12 +1,7 @@
-from typing import Optional
-from dotenv import load_dotenv
-import logging
+from typing import Dict, List, Optional
 
 from pydantic_settings import BaseSettings
-from app.logging_config import logger
-
-# Load environment variables from .env file
-load_dotenv()
+from app.logging_config import configure_logging, logger
 
 
 class AppSettings(BaseSettings):
@@ -16,6 +11,183 @@ class AppSettings(BaseSettings):
     ALGORITHIM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
     APP_NAME: str = "LIBRARIAN"
+    # "production" relies on Alembic migrations for the schema instead of
+    # creating missing tables on every worker start
+    ENVIRONMENT: str = "development"
+    # Debug tracebacks in error responses; never enable in production
+    DEBUG: bool = False
+    # "sync" serves requests through the threadpool with Session,
+    # "async" serves them on the event loop with AsyncSession
+    DB_MODE: str = "sync"
+    # Defaults to SQLALCHEMY_DATABASE_URL with an asyncpg/aiosqlite driver
+    ASYNC_DATABASE_URL: Optional[str] = None
+    # Connection pool of every engine (ignored by databases without a
+    # queue pool, e.g. aiosqlite); -1 disables recycling
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    # Liveness check on checkout: "always", "idle" (only connections idle for
+    # longer than DB_POOL_PRE_PING_IDLE_SECONDS) or "never"
+    DB_POOL_PRE_PING: str = "idle"
+    DB_POOL_PRE_PING_IDLE_SECONDS: float = 30.0
+    # Connections opened at startup so the first requests do not pay for
+    # connecting; defaults to DB_POOL_SIZE in production and 0 otherwise
+    DB_POOL_WARMUP_CONNECTIONS: Optional[int] = None
+    # Connections the database allows this deployment (e.g. PostgreSQL
+    # max_connections minus those reserved for admin and other clients);
+    # app.server shrinks each worker's pool to its share of the budget
+    DB_MAX_CONNECTIONS: Optional[int] = None
+    # Read replicas for read-only queries, in the SQLALCHEMY_DATABASE_URL
+    # format; a replica that fails is skipped until its health check passes
+    DB_REPLICA_URLS: List[str] = []
+    DB_REPLICA_RETRY_SECONDS: float = 10.0
+    # Cache of user principals used by get_current_user
+    AUTH_USER_CACHE_ENABLED: bool = True
+    AUTH_USER_CACHE_MAXSIZE: int = 10000
+    AUTH_USER_CACHE_TTL_SECONDS: float = 60.0
+    # Trust the name/role/is_active claims in the access token and skip the
+    # user lookup; a role or deactivation change applies once the tokens
+    # issued before it expire (ACCESS_TOKEN_EXPIRE_MINUTES)
+    AUTH_STATELESS: bool = False
+    # Password hashing: new hashes use the first scheme with PASSWORD_ROUNDS
+    # (the scheme default when unset); other hashes are upgraded on login
+    PASSWORD_SCHEMES: List[str] = ["sha256_crypt"]
+    PASSWORD_ROUNDS: Optional[int] = None
+    # Pool running the hashes ("process" or "thread"), sized to the CPU count
+    # when unset, and the hashes admitted at once before answering 503
+    PASSWORD_HASH_EXECUTOR: str = "process"
+    PASSWORD_HASH_WORKERS: Optional[int] = None
+    PASSWORD_HASH_MAX_PENDING: Optional[int] = None
+    PASSWORD_HASH_RETRY_AFTER_SECONDS: int = 1
+    # Token-bucket rate limits per client (user id of the access token, else
+    # IP) and route, as "<count>/<second|minute|hour|day>" keyed by
+    # "<METHOD> <route>"; RATE_LIMIT_DEFAULT covers the other routes
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMITS: Dict[str, str] = {
+        "POST /auth/login": "10/minute",
+        "POST /users/register": "5/minute",
+        "POST /books/import": "10/hour",
+    }
+    RATE_LIMIT_DEFAULT: Optional[str] = "600/minute"
+    # Where buckets live: "memory" (per process) or "redis" (shared)
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_REDIS_URL: Optional[str] = None
+    RATE_LIMIT_MAXSIZE: int = 100000
+    # Requests served at once per process before answering 503; defaults to
+    # the DB pool capacity (DB_POOL_SIZE + DB_MAX_OVERFLOW), 0 disables
+    MAX_CONCURRENT_REQUESTS: Optional[int] = None
+    ADMISSION_RETRY_AFTER_SECONDS: int = 1
+    # Routes neither rate limited nor shed, e.g. health checks and scrapes
+    ADMISSION_EXEMPT_ROUTES: List[str] = ["GET /", "GET /metrics"]
+    # Idempotency-Key handling: a request repeating the key of an earlier
+    # one on these "<METHOD> <route>" gets its recorded response back
+    # instead of running again; keys are kept IDEMPOTENCY_TTL_SECONDS and a
+    # duplicate waits IDEMPOTENCY_LOCK_SECONDS on a request still running
+    IDEMPOTENCY_ENABLED: bool = True
+    IDEMPOTENCY_ROUTES: List[str] = [
+        "POST /books/",
+        "POST /books/{book_id}/borrow",
+        "PUT /books/{book_id}/return",
+        "POST /books/borrow:batch",
+    ]
+    # Where records live: "memory" (per process) or "redis" (shared)
+    IDEMPOTENCY_BACKEND: str = "memory"
+    IDEMPOTENCY_REDIS_URL: Optional[str] = None
+    IDEMPOTENCY_MAXSIZE: int = 100000
+    IDEMPOTENCY_TTL_SECONDS: float = 24 * 60 * 60
+    IDEMPOTENCY_LOCK_SECONDS: float = 60.0
+    # SQL statement budget per request, to catch N+1 queries in development
+    # and CI: "warn" logs requests over budget, "raise" answers 500 instead;
+    # unset (the default) counts nothing. Budgets are keyed by
+    # "<METHOD> <route>", QUERY_BUDGET_DEFAULT covers the other routes
+    QUERY_BUDGET_MODE: Optional[str] = None
+    QUERY_BUDGET_DEFAULT: int = 10
+    QUERY_BUDGETS: Dict[str, int] = {
+        # One conditional decrement per book, at most 100 books
+        "POST /books/borrow:batch": 120,
+        # One upsert per chunk of rows
+        "POST /books/import": 200,
+    }
+    # Response compression, negotiated from Accept-Encoding in the order of
+    # COMPRESSION_ENCODINGS ("zstd" and "br" need the zstandard and brotli
+    # packages). Only media types listed in COMPRESSION_LEVELS are
+    # compressed, at the level given per encoding; complete bodies under
+    # COMPRESSION_MINIMUM_SIZE bytes are sent as is, and data of at least
+    # COMPRESSION_OFFLOAD_SIZE bytes is compressed off the event loop
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_ENCODINGS: List[str] = ["zstd", "br", "gzip"]
+    COMPRESSION_LEVELS: Dict[str, Dict[str, int]] = {
+        "application/json": {"zstd": 3, "br": 4, "gzip": 6},
+        # Exports stream the whole history; favour throughput
+        "application/x-ndjson": {"zstd": 1, "br": 1, "gzip": 1},
+        "text/csv": {"zstd": 1, "br": 1, "gzip": 1},
+    }
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_OFFLOAD_SIZE: int = 64 * 1024
+    # Request, query and pool metrics served at /metrics
+    METRICS_ENABLED: bool = True
+    # Logging pipeline, see app.logging_config
+    LOG_LEVEL: str = "INFO"
+    LOG_FILE: str = "librarian.log"
+    LOG_JSON: bool = True
+    LOG_MAX_BYTES: int = 50 * 1024 * 1024
+    LOG_BACKUP_COUNT: int = 5
+    # Fraction of records kept per logger name prefix, e.g. {"uvicorn": 0.1}
+    LOG_SAMPLE_RATES: Dict[str, float] = {}
+    # Maximum records per second per logger name prefix, e.g. {"uvicorn": 100}
+    LOG_RATE_LIMITS: Dict[str, float] = {}
+    BOOKS_COUNT_CACHE_TTL_SECONDS: float = 60.0
+    # Read-through cache of GET /books responses ("memory" or "redis")
+    BOOK_CACHE_ENABLED: bool = True
+    BOOK_CACHE_BACKEND: str = "memory"
+    BOOK_CACHE_REDIS_URL: Optional[str] = None
+    BOOK_CACHE_MAXSIZE: int = 10000
+    # Writes invalidate the redis cache for every worker, but the memory
+    # cache only in the worker that wrote: its short TTL bounds how long
+    # other workers serve a book or list page from before a write
+    BOOK_CACHE_TTL_SECONDS: float = 300.0
+    BOOK_CACHE_MEMORY_TTL_SECONDS: float = 5.0
+    # Most ids accepted by one GET /books/?ids= or POST /books/get:batch
+    # call, all fetched in one IN query
+    BOOKS_BATCH_MAX_IDS: int = 1000
+    # Full rebuild interval of the in-process search index used without
+    # PostgreSQL; picks up catalogue writes made by other processes
+    SEARCH_INDEX_TTL_SECONDS: float = 300.0
+    # Update the circulation rollups behind /stats on every borrow and return;
+    # when off, refresh them with "python -m app.analytics rebuild"
+    STATS_ROLLUPS_ENABLED: bool = True
+    # Loans are due LOAN_PERIOD_DAYS after borrowing; late loans are fined per
+    # started day, up to OVERDUE_FINE_MAX_CENTS (0 for no cap)
+    LOAN_PERIOD_DAYS: int = 14
+    OVERDUE_FINE_CENTS_PER_DAY: int = 25
+    OVERDUE_FINE_MAX_CENTS: int = 2000
+    # Overdue scan: loans per batch transaction and time between reminders
+    # of the same loan
+    OVERDUE_BATCH_SIZE: int = 1000
+    OVERDUE_REMINDER_INTERVAL_HOURS: float = 24.0
+    # Run the overdue scan inside the app process; with several server
+    # processes leave it off and run "python worker.py" once instead
+    OVERDUE_SCHEDULER_ENABLED: bool = False
+    OVERDUE_SCAN_INTERVAL_SECONDS: float = 3600.0
+    # Where reminders are queued: "log", "file" (NDJSON appended to
+    # NOTIFICATION_FILE) or "memory"
+    NOTIFICATION_SINK: str = "log"
+    NOTIFICATION_FILE: str = "notifications.ndjson"
+    # Production server started by "python -m app.server": worker processes
+    # (the CPU count when unset), listen backlog, idle keep-alive timeout,
+    # grace period for in-flight requests on shutdown, and requests after
+    # which a worker is replaced (unlimited when unset)
+    SERVER_HOST: str = "127.0.0.1"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: Optional[int] = None
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEPALIVE_SECONDS: int = 5
+    SERVER_GRACEFUL_SHUTDOWN_SECONDS: int = 30
+    SERVER_MAX_REQUESTS: Optional[int] = None
+    SERVER_ACCESS_LOG: bool = False
+    # Trust X-Forwarded-* headers from these proxy addresses
+    SERVER_FORWARDED_ALLOW_IPS: str = "127.0.0.1"
 
     class Config:
         """Configuration settings."""
@@ -25,6 +197,7 @@ class AppSettings(BaseSettings):
 
 # Create an instance of AppSettings
 app_settings = AppSettings()
+configure_logging(app_settings)
 
 # Example logging
 logger.info("App settings loaded successfully.")
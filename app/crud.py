@@ -1,13 +1,112 @@
-from fastapi import status, Response, Depends, APIRouter, HTTPException
+from fastapi import Depends
 from app import models
-from sqlalchemy.orm import Session
-from app.schemes import CreateUser, UserResponse, BookCreate, BookUpdate
-from app.utils import hash_password
-from app.database import get_db
-from app.oauth2 import get_current_user
-from datetime import datetime, timedelta
-from sqlalchemy import or_, and_, func, String
-from app.logging_config import logger
+from sqlalchemy.orm import Session, raiseload
+from app.schemes import Book, BookBatch, BookCreate, BookUpdate, PaginatedBooks
+from app.database import get_db, primary_reads, replica_reads
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Sequence
+from datetime import datetime, time, timedelta
+from sqlalchemy import and_, func, select, update
+from app.config import app_settings
+from app.cache import CachedBody, ResponseCache, create_cache_backend, make_etag
+from app.pagination import CachedCount, ListLastModified, as_utc, encode_cursor
+from app.analytics import loan_events, record_circulation
+from app.overdue import compute_fine, due_date
+
+# Cached total for the books table, shared by all requests in this process
+books_count = CachedCount(app_settings.BOOKS_COUNT_CACHE_TTL_SECONDS)
+
+# Last-Modified of the book list pages, see read_books_page
+books_last_modified = ListLastModified()
+
+# How long cached book responses live; short in memory, where other
+# workers never see the invalidations of a write
+BOOK_CACHE_TTL_SECONDS = (app_settings.BOOK_CACHE_MEMORY_TTL_SECONDS if app_settings.BOOK_CACHE_BACKEND == "memory"
+                          else app_settings.BOOK_CACHE_TTL_SECONDS)
+
+# Read-through cache of serialized book responses, see read_book and read_books_page
+book_cache = ResponseCache(
+    create_cache_backend(
+        app_settings.BOOK_CACHE_BACKEND,
+        maxsize=app_settings.BOOK_CACHE_MAXSIZE,
+        ttl_seconds=BOOK_CACHE_TTL_SECONDS,
+        redis_url=app_settings.BOOK_CACHE_REDIS_URL,
+    ),
+    ttl_seconds=BOOK_CACHE_TTL_SECONDS,
+) if app_settings.BOOK_CACHE_ENABLED else None
+
+# Loader options of the book queries: books are serialized from their own
+# columns, so touching a relationship while serializing raises
+BOOK_LOAD_OPTIONS = (raiseload("*"),)
+
+# Cache namespaces: every book, the list pages, and one per book
+ALL_BOOKS_NAMESPACE = "books"
+BOOK_LIST_NAMESPACE = "books:list"
+
+
+def book_namespaces(book_id: int):
+    return (ALL_BOOKS_NAMESPACE, f"book:{book_id}")
+
+
+def invalidate_books(*book_ids: int, all_books: bool = False) -> None:
+    """Drop cached responses of the given books and of every list page."""
+    if book_cache is None:
+        return
+    namespaces = [BOOK_LIST_NAMESPACE] + [f"book:{book_id}" for book_id in book_ids]
+    if all_books:
+        namespaces.append(ALL_BOOKS_NAMESPACE)
+    book_cache.invalidate(*namespaces)
+
+
+def serialize_book(book: models.Books) -> bytes:
+    return Book.model_validate(book, from_attributes=True).model_dump_json().encode()
+
+
+def serialize_books_page(books, total: int, next_cursor: Optional[str]) -> bytes:
+    return PaginatedBooks(
+        total=total,
+        items=[Book.model_validate(book, from_attributes=True) for book in books],
+        next_cursor=next_cursor,
+    ).model_dump_json().encode()
+
+
+def serialize_books_batch(book_ids: Sequence[int], books: Dict[int, models.Books]) -> CachedBody:
+    """Serializes the books found by id in the order of ``book_ids``, listing the ids that do not exist."""
+    body = BookBatch(
+        items=[Book.model_validate(books[book_id], from_attributes=True) for book_id in book_ids if book_id in books],
+        missing=[book_id for book_id in book_ids if book_id not in books],
+    ).model_dump_json().encode()
+    return CachedBody(make_etag(body), body)
+
+
+def parse_book_ids(value: str) -> List[int]:
+    """Parses the ``ids`` query parameter, e.g. ``"1,2,3"``."""
+    try:
+        return [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise ValueError("ids must be a comma-separated list of integers")
+
+
+def unique_book_ids(book_ids: Sequence[int]) -> List[int]:
+    """Drops repeated ids, keeping the first occurrence, and checks the batch size."""
+    unique = list(dict.fromkeys(book_ids))
+    if not unique:
+        raise ValueError("At least one book id is required")
+    if len(unique) > app_settings.BOOKS_BATCH_MAX_IDS:
+        raise ValueError(f"At most {app_settings.BOOKS_BATCH_MAX_IDS} book ids can be fetched at once")
+    return unique
+
+
+def books_page_key(page: int, page_size: int, after_id: Optional[int]) -> str:
+    return f"books:after={after_id}:size={page_size}" if after_id is not None else f"books:page={page}:size={page_size}"
+
+
+def with_next_cursor(books, page_size: int):
+    """Trims a page fetched with one extra row and returns it with its next cursor."""
+    if len(books) > page_size:
+        books = books[:page_size]
+        return books, encode_cursor(books[-1].id)
+    return books, None
 
 
 def add_book(book: BookCreate, db: Session = Depends(get_db)):
@@ -15,15 +114,90 @@ def add_book(book: BookCreate, db: Session = Depends(get_db)):
     db.add(db_book)
     db.commit()
     db.refresh(db_book)
+    books_count.invalidate()
+    invalidate_books(db_book.id)
     return db_book
 
 
+@replica_reads
 def get_all_books(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(models.Books).offset(skip).limit(limit).all()
+    return db.query(models.Books).options(*BOOK_LOAD_OPTIONS).order_by(models.Books.id).offset(skip).limit(limit).all()
+
 
+@replica_reads
+def get_books_after(db: Session, after_id: int = 0, limit: int = 10):
+    """Returns up to ``limit`` books with an id greater than ``after_id``."""
+    return db.query(models.Books).options(*BOOK_LOAD_OPTIONS).filter(
+        models.Books.id > after_id
+    ).order_by(models.Books.id).limit(limit).all()
 
+
+@replica_reads
+def get_newest_book_update(db: Session) -> Optional[datetime]:
+    """Returns the latest ``Books.updated_at``, from the end of its index."""
+    return db.scalar(select(func.max(models.Books.updated_at)))
+
+
+def count_books(db: Session) -> int:
+    """Returns the total number of books, served from a short-lived cache."""
+    return books_count.get(lambda: db.query(func.count(models.Books.id)).scalar())
+
+
+@replica_reads
 def get_book_by_id(db: Session, book_id: int):
-    return db.query(models.Books).filter(models.Books.id == book_id).first()
+    return db.query(models.Books).options(*BOOK_LOAD_OPTIONS).filter(models.Books.id == book_id).first()
+
+
+@replica_reads
+def get_books_by_ids(db: Session, book_ids: Sequence[int]) -> Dict[int, models.Books]:
+    """Returns the existing books among ``book_ids`` by id, in one IN query."""
+    return {book.id: book for book in db.scalars(
+        select(models.Books).options(*BOOK_LOAD_OPTIONS).where(models.Books.id.in_(book_ids)))}
+
+
+def read_book(db: Session, book_id: int) -> Optional[CachedBody]:
+    """Returns the serialized book, from the cache when possible, or None if it does not exist."""
+    if book_cache is None:
+        book = get_book_by_id(db, book_id)
+        if book is None:
+            return None
+        body = serialize_book(book)
+        return CachedBody(make_etag(body), body, as_utc(book.updated_at))
+    key = book_cache.key(book_namespaces(book_id), f"book:{book_id}")
+    cached = book_cache.get(key)
+    if cached is None:
+        # Filled from the primary, a lagging replica would cache the book
+        # from before the write that invalidated it
+        with primary_reads(db):
+            book = get_book_by_id(db, book_id)
+        if book is None:
+            return None
+        cached = book_cache.set(key, serialize_book(book), as_utc(book.updated_at))
+    return cached
+
+
+def read_books_page(db: Session, page: int, page_size: int, after_id: Optional[int] = None) -> CachedBody:
+    """Returns a serialized page of books, from the cache when possible."""
+    key = None
+    if book_cache is not None:
+        key = book_cache.key((ALL_BOOKS_NAMESPACE, BOOK_LIST_NAMESPACE), books_page_key(page, page_size, after_id))
+        cached = book_cache.get(key)
+        if cached is not None:
+            return cached
+    # Pages stored in the cache are read from the primary, see read_book
+    with primary_reads(db) if key is not None else nullcontext():
+        if after_id is not None:
+            books = get_books_after(db, after_id=after_id, limit=page_size + 1)
+        else:
+            books = get_all_books(db, skip=(page - 1) * page_size, limit=page_size + 1)
+        books, next_cursor = with_next_cursor(books, page_size)
+        total = count_books(db)
+        newest_update = get_newest_book_update(db)
+    body = serialize_books_page(books, total, next_cursor)
+    last_modified = books_last_modified.observe(newest_update, total)
+    if key is None:
+        return CachedBody(make_etag(body), body, last_modified)
+    return book_cache.set(key, body, last_modified)
 
 
 def update_book(db: Session, book_id: int, new_book_data: BookUpdate):
@@ -33,6 +207,7 @@ def update_book(db: Session, book_id: int, new_book_data: BookUpdate):
             setattr(book, key, value)
         db.commit()
         db.refresh(book)
+        invalidate_books(book_id)
         return book
     return None
 
@@ -42,72 +217,296 @@ def delete_book(db: Session, book_id: int):
     if book:
         db.delete(book)
         db.commit()
+        books_count.invalidate()
+        invalidate_books(book_id)
         return True
     return False
 
 
-def borrow_book(db, book_id: int, user_id: int):
-    book_transaction = models.BookTransactions(
-        book_id=book_id,
+class BookNotFoundError(LookupError):
+    """Raised when a book id does not exist."""
+
+
+class BookUnavailableError(ValueError):
+    """Raised when a book has no copies left to lend."""
+
+
+class LoanNotFoundError(ValueError):
+    """Raised when there is no open loan to return."""
+
+
+def take_copy_statement(book_id: int):
+    """UPDATE that lends one copy only if one is left, returning the book."""
+    return update(models.Books).where(
+        models.Books.id == book_id,
+        models.Books.count > 0
+    ).values(count=models.Books.count - 1).returning(models.Books)
+
+
+def release_copy_statement(book_id: int):
+    """UPDATE that puts a returned copy back on the shelf, returning the book."""
+    return update(models.Books).where(
+        models.Books.id == book_id
+    ).values(count=models.Books.count + 1).returning(models.Books)
+
+
+def close_loan_statement(book_id: int, user_id: int = None):
+    """UPDATE that marks the oldest open loan of a book as returned.
+
+    The ``returned == False`` guard on the outer statement makes concurrent
+    returns of the same loan race-free: only one of them matches.
+    """
+    open_loan = select(models.BookTransactions.id).where(
+        models.BookTransactions.book_id == book_id,
+        models.BookTransactions.returned == False
+    )
+    if user_id is not None:
+        open_loan = open_loan.where(models.BookTransactions.borrowed_by == user_id)
+    open_loan = open_loan.order_by(models.BookTransactions.borrowed_at).limit(1).scalar_subquery()
+    return update(models.BookTransactions).where(
+        models.BookTransactions.id == open_loan,
+        models.BookTransactions.returned == False
+    ).values(returned=True, returned_at=datetime.now()).returning(models.BookTransactions)
+
+
+def new_loan(book: models.Books, user_id: int) -> models.BookTransactions:
+    borrowed_at = datetime.now()
+    return models.BookTransactions(
+        book_id=book.id,
         borrowed_by=user_id,
         borrowed=True,
         returned=False,
-        borrowed_at=datetime.now(),
-        returned_at=None
+        borrowed_at=borrowed_at,
+        returned_at=None,
+        due_at=due_date(borrowed_at),
+        next_reminder_at=due_date(borrowed_at),
+        book=book
     )
-    db.add(book_transaction)
+
+
+def settle_fine(transaction: models.BookTransactions) -> None:
+    """Sets the final fine of a loan that was just returned."""
+    fine = compute_fine(transaction.due_at, transaction.returned_at)
+    if fine != transaction.fine_cents:
+        transaction.fine_cents = fine
+
+
+def _take_copy(db: Session, book_id: int) -> models.Books:
+    book = db.scalars(take_copy_statement(book_id)).first()
+    if book is None:
+        if db.get(models.Books, book_id) is None:
+            raise BookNotFoundError("Book not found")
+        raise BookUnavailableError("Book is not available for borrowing")
+    return book
+
+
+def _commit_detached(db: Session, *instances) -> None:
+    """Commit, keeping the already loaded state of ``instances``.
+
+    Detaching them first means commit does not expire them, so the caller can
+    serialize them without a reload SELECT per object.
+    """
+    db.flush()
+    for instance in instances:
+        db.expunge(instance)
     db.commit()
-    db.refresh(book_transaction)
+
+
+def borrow_book(db: Session, book_id: int, user_id: int):
+    """Lend one copy of a book to a user in a single transaction.
+
+    The copy is taken with a conditional decrement, so concurrent borrowers
+    can never take more copies than exist.
+    """
+    try:
+        book = _take_copy(db, book_id)
+        book_transaction = new_loan(book, user_id)
+        db.add(book_transaction)
+        record_circulation(db, loan_events([book_transaction], borrowed=True))
+        _commit_detached(db, book_transaction, book)
+    except Exception:
+        db.rollback()
+        raise
+    invalidate_books(book_id)
     return book_transaction
 
 
-def return_book(db, book_id: int):
-    transaction = db.query(models.BookTransactions).filter(
-        models.BookTransactions.book_id == book_id,
-        models.BookTransactions.returned == False
-    ).first()
-    if not transaction:
-        raise ValueError("Book transaction not found or already returned")
+def borrow_books(db: Session, book_ids: List[int], user_id: int):
+    """Lend one copy of each book to a user, all or nothing, in one transaction."""
+    if len(set(book_ids)) != len(book_ids):
+        raise ValueError("Each book can only be borrowed once per batch")
+    try:
+        # Take copies in id order so concurrent batches lock rows consistently
+        books = {book_id: _take_copy(db, book_id) for book_id in sorted(book_ids)}
+        transactions = [new_loan(books[book_id], user_id) for book_id in book_ids]
+        db.add_all(transactions)
+        record_circulation(db, loan_events(transactions, borrowed=True))
+        _commit_detached(db, *transactions, *books.values())
+    except Exception:
+        db.rollback()
+        raise
+    invalidate_books(*book_ids)
+    return transactions
 
-    # Update the transaction record to mark as returned
-    transaction.returned = True
-    transaction.returned_at = datetime.now()
-    db.commit()
-    db.refresh(transaction)
+
+def return_book(db: Session, book_id: int, user_id: int = None):
+    """Close the open loan of a book and put the copy back in one transaction."""
+    try:
+        transaction = db.scalars(close_loan_statement(book_id, user_id)).first()
+        if not transaction:
+            raise LoanNotFoundError("Book transaction not found or already returned")
+        book = db.scalars(release_copy_statement(book_id)).first()
+        transaction.book = book
+        settle_fine(transaction)
+        record_circulation(db, loan_events([transaction], borrowed=False))
+        _commit_detached(db, transaction, book)
+    except Exception:
+        db.rollback()
+        raise
+    invalidate_books(book_id)
     return transaction
 
-def get_books_borrowed_by_user(db: Session, user_id: int):
-    return db.query(models.Books, models.BookTransactions).join(models.BookTransactions).filter(
+
+def borrowed_by_user_statement(user_id: int, active_only: bool = False, after_id: Optional[int] = None,
+                               limit: Optional[int] = None):
+    """SELECT of the user's loans in loan order, after the loan ``after_id``.
+
+    Rows hold ``BORROWED_COLUMNS`` followed by ``loan_id``, which is not
+    part of ``BORROWED_FIELDS`` and only feeds the next cursor. With
+    ``active_only`` the open loans are read from the partial
+    ``(borrowed_by, id) WHERE returned = false`` index, so the lookup does
+    not grow with the user's history.
+    """
+    query = select(*BORROWED_COLUMNS, models.BookTransactions.id.label("loan_id")).select_from(
+        models.BookTransactions
+    ).join(
+        models.Books, models.Books.id == models.BookTransactions.book_id
+    ).join(
+        models.Users, models.Users.id == models.BookTransactions.borrowed_by
+    ).where(
         models.BookTransactions.borrowed_by == user_id
-    ).all()
+    )
+    if active_only:
+        query = query.where(models.BookTransactions.returned == False)
+    if after_id is not None:
+        query = query.where(models.BookTransactions.id > after_id)
+    query = query.order_by(models.BookTransactions.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def with_next_loan_cursor(rows, limit: Optional[int]):
+    """Trims loans fetched with one extra row and returns them with their next cursor."""
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].loan_id)
+    return rows, None
+
+
+@replica_reads
+def get_books_borrowed_by_user(db: Session, user_id: int, active_only: bool = False,
+                               after_id: Optional[int] = None, limit: Optional[int] = None):
+    """Returns the user's loans as rows of ``BORROWED_FIELDS``, see ``borrowed_by_user_statement``."""
+    return db.execute(borrowed_by_user_statement(user_id, active_only, after_id, limit)).all()
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.Users).filter(models.Users.email == email).first()
 
 
-def get_user_book_history(
-    db: Session,
+def history_filters(
     user_id: str = None,
     book_title: str = None,
     transaction_type: str = None,
-    date: str = None
-):
-    # Start building the query
-    query = db.query(models.Books, models.BookTransactions)
+    date: datetime = None
+) -> list:
+    """Build the WHERE clauses of the book history query.
 
-    # Apply filters based on query parameters
+    The date filter is a half-open range over the whole day so it can use
+    the ``borrowed_at`` indexes instead of casting every row to text.
+    """
+    filters = []
     if user_id:
-        query = query.filter(models.BookTransactions.borrowed_by == user_id)
+        filters.append(models.BookTransactions.borrowed_by == user_id)
     if book_title:
-        query = query.filter(models.Books.title == book_title)
+        filters.append(models.Books.title == book_title)
     if transaction_type:
         if transaction_type.lower() == "borrow":
-            query = query.filter(and_(models.BookTransactions.borrowed == True, models.BookTransactions.returned == False))
+            filters.append(and_(models.BookTransactions.borrowed == True, models.BookTransactions.returned == False))
         else:
-            query = query.filter(models.BookTransactions.returned == True)
+            filters.append(models.BookTransactions.returned == True)
     if date:
-        query = query.filter(models.BookTransactions.borrowed_at.cast(String).like(f"%{str(date.date())}%"))
+        day_start = datetime.combine(date.date(), time.min, tzinfo=date.tzinfo)
+        filters.append(models.BookTransactions.borrowed_at >= day_start)
+        filters.append(models.BookTransactions.borrowed_at < day_start + timedelta(days=1))
+    return filters
+
+
+# Columns returned by the history endpoints, in output order
+HISTORY_COLUMNS = (
+    models.Books.id,
+    models.Books.title,
+    models.Books.description,
+    models.Books.author,
+    models.Books.count,
+    models.BookTransactions.borrowed_by,
+    models.BookTransactions.borrowed,
+    models.BookTransactions.returned,
+    models.BookTransactions.borrowed_at,
+    models.BookTransactions.returned_at,
+)
+HISTORY_FIELDS = tuple(column.key for column in HISTORY_COLUMNS)
+
+# Columns of the borrowed books list, which names the borrower instead of its id
+BORROWED_COLUMNS = tuple(
+    models.Users.name.label("borrowed_by") if column is models.BookTransactions.borrowed_by else column
+    for column in HISTORY_COLUMNS
+)
+BORROWED_FIELDS = HISTORY_FIELDS
+
+# Ordering shared by the paginated and streamed history queries
+HISTORY_ORDER = (models.BookTransactions.borrowed_at.desc(), models.BookTransactions.id.desc())
+
+
+@replica_reads
+def get_user_book_history(
+    db: Session,
+    user_id: str = None,
+    book_title: str = None,
+    transaction_type: str = None,
+    date: datetime = None,
+    skip: int = 0,
+    limit: int = None
+):
+    """Returns one page of history as rows of ``HISTORY_FIELDS``."""
+    query = db.query(*HISTORY_COLUMNS).select_from(models.Books).join(
+        models.BookTransactions, models.BookTransactions.book_id == models.Books.id
+    ).filter(
+        *history_filters(user_id, book_title, transaction_type, date)
+    ).order_by(*HISTORY_ORDER).offset(skip).limit(limit)
 
     # Execute the query and fetch the results
     user_book_history = query.all()
-    return user_book_history
\ No newline at end of file
+    return user_book_history
+
+
+def iter_user_book_history(
+    db: Session,
+    user_id: str = None,
+    book_title: str = None,
+    transaction_type: str = None,
+    date: datetime = None,
+    chunk_size: int = 1000
+):
+    """Yield history rows as mappings of ``HISTORY_FIELDS`` through a server-side cursor.
+
+    Only plain columns are selected, so no ORM objects are built and memory
+    use is bounded by ``chunk_size`` whatever the size of the result.
+    """
+    query = db.query(*HISTORY_COLUMNS).select_from(models.Books).join(
+        models.BookTransactions, models.BookTransactions.book_id == models.Books.id
+    ).filter(
+        *history_filters(user_id, book_title, transaction_type, date)
+    ).order_by(*HISTORY_ORDER).yield_per(chunk_size)
+    for row in query:
+        yield row._mapping
@@ -1,21 +1,297 @@
-from sqlalchemy import create_engine, Column, Integer, String
-from sqlalchemy.orm import sessionmaker
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import QueuePool
 
 from app.config import app_settings
 from app.logging_config import logger
 
+# Async drivers used when ASYNC_DATABASE_URL is not set explicitly
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+PRE_PING_STRATEGIES = ("always", "idle", "never")
+
+# Session.info keys used by RoutingSession and replica_reads
+USE_REPLICA = "use_replica"
+REPLICA_IN_USE = "replica_in_use"
+PRIMARY_ONLY = "primary_only"
+PRIMARY_READS = "primary_reads"
+
+
+def engine_options(url: str) -> dict:
+    """Returns the pool options from the settings that apply to ``url``."""
+    if app_settings.DB_POOL_PRE_PING not in PRE_PING_STRATEGIES:
+        raise ValueError(f"Unknown DB_POOL_PRE_PING strategy: {app_settings.DB_POOL_PRE_PING}")
+    options = {
+        "pool_pre_ping": app_settings.DB_POOL_PRE_PING == "always",
+        "pool_recycle": app_settings.DB_POOL_RECYCLE_SECONDS,
+    }
+    parsed = make_url(url)
+    # Sizing only applies to queue pools; aiosqlite and in-memory SQLite use others
+    if issubclass(parsed.get_dialect().get_pool_class(parsed), QueuePool):
+        options.update(
+            pool_size=app_settings.DB_POOL_SIZE,
+            max_overflow=app_settings.DB_MAX_OVERFLOW,
+            pool_timeout=app_settings.DB_POOL_TIMEOUT_SECONDS,
+        )
+    return options
+
+
+def ping_idle_connections(engine, idle_seconds: float) -> None:
+    """Pings connections on checkout only when they sat idle in the pool.
+
+    A failed ping raises ``DisconnectionError``, which makes the pool replace
+    the connection and retry the checkout.
+    """
+    pool = getattr(engine, "sync_engine", engine).pool
+
+    @event.listens_for(pool, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(pool, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        except Exception as e:
+            raise exc.DisconnectionError() from e
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+
+def build_engine(url: str) -> Engine:
+    engine = create_engine(url, **engine_options(url))
+    if app_settings.DB_POOL_PRE_PING == "idle":
+        ping_idle_connections(engine, app_settings.DB_POOL_PRE_PING_IDLE_SECONDS)
+    return engine
+
+
+def build_async_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(url, **engine_options(url))
+    if app_settings.DB_POOL_PRE_PING == "idle":
+        ping_idle_connections(engine, app_settings.DB_POOL_PRE_PING_IDLE_SECONDS)
+    return engine
+
+
+class ReplicaSet:
+    """Round-robin choice among the read replicas that are healthy.
+
+    A replica that fails is skipped for ``retry_seconds``. After that, the
+    next read that picks it acts as its health check: success puts it back
+    in rotation, failure marks it down again.
+    """
+
+    def __init__(self, engines: List[Engine], retry_seconds: float):
+        self.engines = engines
+        self.retry_seconds = retry_seconds
+        self._down: Dict[int, float] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def choose(self) -> Optional[Engine]:
+        """Returns the next usable replica, or None when all are down."""
+        with self._lock:
+            for _ in range(len(self.engines)):
+                index = self._next % len(self.engines)
+                self._next += 1
+                down_since = self._down.get(index)
+                if down_since is not None:
+                    if time.monotonic() - down_since < self.retry_seconds:
+                        continue
+                    del self._down[index]
+                    logger.info("Retrying read replica %s", index)
+                return self.engines[index]
+        return None
+
+    def mark_down(self, engine: Engine) -> None:
+        with self._lock:
+            index = self.engines.index(engine)
+            self._down[index] = time.monotonic()
+        logger.warning("Read replica %s failed, sending its reads elsewhere for %ss", index, self.retry_seconds)
+
+
+class RoutingSession(Session):
+    """Session that sends the reads of ``replica_reads`` functions to a replica.
+
+    Writes, and reads made after the transaction has written, go to the
+    primary so a request always sees its own changes.
+    """
+
+    replicas: Optional[ReplicaSet] = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if (self.replicas is not None and self.info.get(USE_REPLICA) and not self.info.get(PRIMARY_ONLY)
+                and not self.info.get(PRIMARY_READS) and not self._flushing
+                and clause is not None and clause.is_select):
+            replica = self.replicas.choose()
+            if replica is not None:
+                self.info[REPLICA_IN_USE] = replica
+                return replica
+        if clause is not None and clause.is_dml:
+            self.info[PRIMARY_ONLY] = True
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+class AsyncRoutingSession(RoutingSession):
+    """``RoutingSession`` used under ``AsyncSession``, routing to async replicas."""
+
+    replicas: Optional[ReplicaSet] = None
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _pin_to_primary(session, flush_context):
+    session.info[PRIMARY_ONLY] = True
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _unpin_from_primary(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(PRIMARY_ONLY, None)
+
+
+def _replica_failed(db, error: exc.DBAPIError) -> bool:
+    """Marks the replica used by ``db`` down if ``error`` is a connection failure on it."""
+    replica = db.info.get(REPLICA_IN_USE)
+    if replica is None:
+        return False
+    if not (error.connection_invalidated or isinstance(error, (exc.OperationalError, exc.InterfaceError))):
+        return False
+    # Only fail over when rolling back cannot lose pending changes
+    if db.new or db.dirty or db.deleted or db.info.get(PRIMARY_ONLY):
+        return False
+    getattr(db, "sync_session", db).replicas.mark_down(replica)
+    return True
+
+
+@contextmanager
+def primary_reads(db):
+    """Sends the reads of ``replica_reads`` functions in the block to the primary.
+
+    For reads stored in a cache: a lagging replica could return rows from
+    before a write that already invalidated the cache, which would then be
+    served until they expire.
+    """
+    previous = db.info.get(PRIMARY_READS)
+    db.info[PRIMARY_READS] = True
+    try:
+        yield
+    finally:
+        db.info[PRIMARY_READS] = previous
+
+
+def replica_reads(fn):
+    """Runs a read-only CRUD function on a read replica when one is configured.
+
+    If the replica connection fails, the replica is marked down and the call
+    is retried once on the primary.
+    """
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(db, *args, **kwargs):
+            previous = db.info.get(USE_REPLICA)
+            db.info[USE_REPLICA] = True
+            db.info[REPLICA_IN_USE] = None
+            try:
+                return await fn(db, *args, **kwargs)
+            except exc.DBAPIError as e:
+                if not _replica_failed(db, e):
+                    raise
+                await db.rollback()
+                db.info[USE_REPLICA] = False
+                db.info[REPLICA_IN_USE] = None
+                return await fn(db, *args, **kwargs)
+            finally:
+                db.info[USE_REPLICA] = previous
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(db, *args, **kwargs):
+        previous = db.info.get(USE_REPLICA)
+        db.info[USE_REPLICA] = True
+        db.info[REPLICA_IN_USE] = None
+        try:
+            return fn(db, *args, **kwargs)
+        except exc.DBAPIError as e:
+            if not _replica_failed(db, e):
+                raise
+            db.rollback()
+            db.info[USE_REPLICA] = False
+            db.info[REPLICA_IN_USE] = None
+            return fn(db, *args, **kwargs)
+        finally:
+            db.info[USE_REPLICA] = previous
+    return wrapper
+
+
 # Create the SQLAlchemy engine using the database URL from app_settings
-engine = create_engine(
-    app_settings.SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
+engine = build_engine(app_settings.SQLALCHEMY_DATABASE_URL)
+replica_engines = [build_engine(url) for url in app_settings.DB_REPLICA_URLS]
+if replica_engines:
+    RoutingSession.replicas = ReplicaSet(replica_engines, app_settings.DB_REPLICA_RETRY_SECONDS)
+    logger.info("Routing reads to %s read replicas.", len(replica_engines))
 
 
 # Create a session maker object with autocommit and autoflush set to False
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
 
 # Create a base class for declarative class definitions
 Base = declarative_base()
 
+
+def to_async_url(url: str) -> str:
+    """Returns ``url`` with the async driver of its database."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}' databases")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def get_async_database_url() -> str:
+    """Returns the async database URL, deriving it from the sync one if needed."""
+    if app_settings.ASYNC_DATABASE_URL:
+        return app_settings.ASYNC_DATABASE_URL
+    return to_async_url(app_settings.SQLALCHEMY_DATABASE_URL)
+
+
+# The async engine is only built in async mode so that the sync deployment
+# does not need asyncpg/aiosqlite installed.
+async_engine: Optional[AsyncEngine] = None
+async_replica_engines: List[AsyncEngine] = []
+AsyncSessionLocal: Optional[async_sessionmaker] = None
+
+if app_settings.DB_MODE == "async":
+    async_engine = build_async_engine(get_async_database_url())
+    async_replica_engines = [build_async_engine(to_async_url(url)) for url in app_settings.DB_REPLICA_URLS]
+    if async_replica_engines:
+        AsyncRoutingSession.replicas = ReplicaSet(
+            [replica.sync_engine for replica in async_replica_engines], app_settings.DB_REPLICA_RETRY_SECONDS)
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False, class_=AsyncSession,
+        sync_session_class=AsyncRoutingSession)
+    logger.info("Async database engine created.")
+
+
 def get_db():
     """Function to get a database session."""
     db = SessionLocal()
@@ -23,3 +299,51 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Function to get an async database session."""
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database session requested but DB_MODE is not 'async'")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def warm_pool(engine: Engine, connections: int) -> int:
+    """Opens up to ``connections`` pooled connections and returns them to the pool.
+
+    The connections are held at the same time so the pool keeps that many
+    open; returns how many were opened.
+    """
+    opened = []
+    try:
+        for _ in range(connections):
+            opened.append(engine.connect())
+    finally:
+        for connection in opened:
+            connection.close()
+    return len(opened)
+
+
+async def warm_async_pool(engine: AsyncEngine, connections: int) -> int:
+    """Async counterpart of ``warm_pool``."""
+    opened = []
+    try:
+        for _ in range(connections):
+            opened.append(await engine.connect())
+    finally:
+        for connection in opened:
+            await connection.close()
+    return len(opened)
+
+
+def reset_pools_after_fork() -> None:
+    """Drops the pooled connections inherited from the parent of a forked worker.
+
+    The parent's connections are left open for the parent; the worker opens
+    its own on first use.
+    """
+    for pooled in [engine, *replica_engines]:
+        pooled.dispose(close=False)
+    for pooled in filter(None, [async_engine, *async_replica_engines]):
+        pooled.sync_engine.dispose(close=False)
@@ -0,0 +1,81 @@
+import csv
+import io
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Mapping, Sequence
+
+import orjson
+
+# Media types of the supported streaming export formats
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Number of rows encoded into each chunk written to the response
+ROWS_PER_CHUNK = 500
+
+
+def encode_json_rows(rows: Iterable[Sequence], fields: Sequence[str]) -> bytes:
+    """Encodes column rows as a JSON array of objects keyed by ``fields``.
+
+    Rows go straight from the database cursor to orjson, which also writes
+    datetimes natively, without ORM objects or response model validation.
+    """
+    return orjson.dumps([dict(zip(fields, row)) for row in rows])
+
+
+def _encode_ndjson(rows: Sequence[Mapping]) -> bytes:
+    return b"".join(orjson.dumps(dict(row)) + b"\n" for row in rows)
+
+
+def _encode_csv(rows: Sequence[Mapping], fields: Sequence[str]) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            [value.isoformat() if isinstance(value, datetime) else value for value in (row[f] for f in fields)])
+    return buffer.getvalue()
+
+
+def _encoder(export_format: str, fields: Sequence[str]):
+    if export_format == "ndjson":
+        return _encode_ndjson
+    if export_format == "csv":
+        return lambda rows: _encode_csv(rows, fields)
+    raise ValueError(f"Unsupported export format: {export_format}")
+
+
+def _header(export_format: str, fields: Sequence[str]) -> str:
+    return _encode_csv([dict(zip(fields, fields))], fields) if export_format == "csv" else ""
+
+
+def stream_rows(rows: Iterable[Mapping], export_format: str, fields: Sequence[str]) -> Iterator[str]:
+    """Encodes rows into NDJSON or CSV chunks without materializing the result."""
+    encode = _encoder(export_format, fields)
+    header = _header(export_format, fields)
+    if header:
+        yield header
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield encode(chunk)
+            chunk = []
+    if chunk:
+        yield encode(chunk)
+
+
+async def stream_rows_async(rows: AsyncIterable[Mapping], export_format: str, fields: Sequence[str]) -> AsyncIterator[str]:
+    """Async variant of ``stream_rows`` for rows read from an AsyncSession stream."""
+    encode = _encoder(export_format, fields)
+    header = _header(export_format, fields)
+    if header:
+        yield header
+    chunk = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield encode(chunk)
+            chunk = []
+    if chunk:
+        yield encode(chunk)
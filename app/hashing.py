@@ -0,0 +1,136 @@
+"""Password hashing on a dedicated, bounded worker pool.
+
+Hashing is deliberately slow, so running it on the request threadpool lets a
+login burst starve every other endpoint. ``PasswordHasher`` runs hashes on a
+separate process (or thread) pool and admits at most ``max_pending`` of them
+at a time; callers beyond that get ``HashingBusyError`` right away instead of
+queueing behind the burst.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+HASH_EXECUTORS = ("process", "thread")
+
+
+class HashingBusyError(RuntimeError):
+    """Raised when the hashing queue is full."""
+
+
+def build_context(schemes: Sequence[str], rounds: Optional[int] = None) -> "CryptContext":
+    """Returns a context hashing with ``schemes[0]``.
+
+    Hashes using the other schemes, or other rounds than ``rounds``, are
+    reported as needing an update.
+    """
+    # Imported here so only the hashing workers load passlib
+    from passlib.context import CryptContext
+
+    options: Dict[str, object] = {"schemes": list(schemes), "deprecated": "auto"}
+    if rounds is not None:
+        for option in ("default_rounds", "min_rounds", "max_rounds"):
+            options[f"{schemes[0]}__{option}"] = rounds
+    return CryptContext(**options)
+
+
+# Context of the current pool worker, set up by _init_worker
+_worker_context: Optional["CryptContext"] = None
+
+
+def _init_worker(schemes: Sequence[str], rounds: Optional[int]) -> None:
+    global _worker_context
+    _worker_context = build_context(schemes, rounds)
+
+
+def _hash(password: str) -> str:
+    return _worker_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    return _worker_context.verify_and_update(password, hashed)
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded pool.
+
+    The pool is started on first use, so each server worker process gets its
+    own after forking.
+    """
+
+    def __init__(self, schemes: Sequence[str], rounds: Optional[int] = None, executor: str = "process",
+                 workers: Optional[int] = None, max_pending: Optional[int] = None):
+        if executor not in HASH_EXECUTORS:
+            raise ValueError(f"Unknown password hash executor: {executor}")
+        self.schemes = tuple(schemes)
+        self.rounds = rounds
+        self.executor_type = executor
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.executor_type == "process":
+                        # The server already runs threads by now, which a
+                        # forked child could inherit holding locks
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.workers,
+                            mp_context=multiprocessing.get_context("forkserver"),
+                            initializer=_init_worker,
+                            initargs=(self.schemes, self.rounds),
+                        )
+                    else:
+                        _init_worker(self.schemes, self.rounds)
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    def submit(self, fn, *args) -> Future:
+        """Queues ``fn`` on the pool or raises ``HashingBusyError`` when full."""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingBusyError("Too many password hashes in progress")
+            self.pending += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def hash(self, password: str) -> str:
+        return self.submit(_hash, password).result()
+
+    def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Returns whether ``password`` matches and, if it needs an upgrade, its new hash."""
+        return self.submit(_verify_and_update, password, hashed).result()
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self.submit(_hash, password))
+
+    async def verify_and_update_async(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        return await asyncio.wrap_future(self.submit(_verify_and_update, password, hashed))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
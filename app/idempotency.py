@@ -0,0 +1,279 @@
+"""Idempotency-Key handling for the write endpoints clients retry.
+
+A client sends the same ``Idempotency-Key`` header with every attempt of one
+operation. ``IdempotencyMiddleware`` runs the first attempt and records its
+response; later attempts with the key get that response back, marked with
+``Idempotent-Replayed: true``, without reaching the route or the database.
+
+- Keys are scoped to the client (the user of the access token, else the IP)
+  and tied to the request: reusing a key for another method, path or body
+  answers 422.
+- An attempt arriving while the first is still running waits for its
+  response, up to ``IDEMPOTENCY_LOCK_SECONDS``, then answers 409.
+- Responses are kept for ``IDEMPOTENCY_TTL_SECONDS``. Server errors and
+  responses asking to retry (408, 409, 425, 429) are not kept, so the next
+  attempt runs again.
+
+Records live in an ``IdempotencyBackend``, per process in memory or shared
+by every process through Redis.
+"""
+import asyncio
+import hashlib
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import orjson
+
+from app.cache import TTLCache, redis_client
+from app.ratelimit import request_client, request_route
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+
+# Statuses the client is expected to retry; answering them again would
+# prevent the retry from ever going through
+RETRYABLE_STATUSES = frozenset({408, 409, 425, 429})
+
+# Seconds between checks of a shared backend for a response being produced
+# by another process
+POLL_INTERVAL_SECONDS = 0.05
+
+
+class IdempotencyBackend:
+    """Store of the requests being processed and the recorded responses."""
+
+    async def claim(self, key: str, ttl_seconds: float) -> bool:
+        """Marks ``key`` as being processed. False if it is already processing or done."""
+        raise NotImplementedError
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Returns the recorded response of ``key``, None while missing or processing."""
+        raise NotImplementedError
+
+    async def complete(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        raise NotImplementedError
+
+    async def release(self, key: str) -> None:
+        """Forgets a claim whose request failed, so that it can be retried."""
+        raise NotImplementedError
+
+
+_PROCESSING = object()
+
+
+class MemoryIdempotencyBackend(IdempotencyBackend):
+    """Process-local LRU store. Each worker process only knows its own requests."""
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self._entries = TTLCache(maxsize=maxsize, ttl_seconds=ttl_seconds)
+
+    async def claim(self, key: str, ttl_seconds: float) -> bool:
+        # Requests of a process share one event loop, so nothing runs
+        # between the check and the set
+        if self._entries.get(key) is not None:
+            return False
+        self._entries.set(key, _PROCESSING, ttl_seconds)
+        return True
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = self._entries.get(key)
+        return None if value is _PROCESSING else value
+
+    async def complete(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        self._entries.set(key, value, ttl_seconds)
+
+    async def release(self, key: str) -> None:
+        self._entries.invalidate(key)
+
+
+class RedisIdempotencyBackend(IdempotencyBackend):
+    """Store shared by every worker through a Redis-compatible server."""
+
+    def __init__(self, url: Optional[str]):
+        self._client = redis_client(url, asynchronous=True)
+
+    async def claim(self, key: str, ttl_seconds: float) -> bool:
+        return bool(await self._client.set(key, b"", nx=True, px=int(ttl_seconds * 1000)))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(key) or None
+
+    async def complete(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        await self._client.set(key, value, px=int(ttl_seconds * 1000))
+
+    async def release(self, key: str) -> None:
+        await self._client.delete(key)
+
+
+def create_idempotency_backend(backend: str, maxsize: int, ttl_seconds: float,
+                               redis_url: Optional[str] = None) -> IdempotencyBackend:
+    """Builds the idempotency backend named by the settings ("memory" or "redis")."""
+    if backend == "memory":
+        return MemoryIdempotencyBackend(maxsize, ttl_seconds)
+    if backend == "redis":
+        return RedisIdempotencyBackend(redis_url)
+    raise ValueError(f"Unknown idempotency backend: {backend}")
+
+
+class RecordedResponse:
+    """Response of the first attempt, with the fingerprint of its request."""
+
+    __slots__ = ("fingerprint", "status", "headers", "body")
+
+    def __init__(self, fingerprint: str, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def encode(self) -> bytes:
+        meta = orjson.dumps({
+            "fingerprint": self.fingerprint,
+            "status": self.status,
+            "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in self.headers],
+        })
+        return meta + b"\n" + self.body
+
+    @classmethod
+    def decode(cls, data: bytes) -> "RecordedResponse":
+        meta, body = data.split(b"\n", 1)
+        meta = orjson.loads(meta)
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in meta["headers"]]
+        return cls(meta["fingerprint"], meta["status"], headers, body)
+
+
+def fingerprint(scope, body: bytes) -> str:
+    """Identifies the request a key was first used for."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), body):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def _respond(send, status: int, headers: List[Tuple[bytes, bytes]], body: bytes) -> None:
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _error(send, status: int, detail: str) -> None:
+    body = orjson.dumps({"detail": detail})
+    await _respond(send, status, [(b"content-type", b"application/json"),
+                                  (b"content-length", str(len(body)).encode())], body)
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware replaying the recorded response of a repeated Idempotency-Key."""
+
+    def __init__(self, app, backend: IdempotencyBackend, routes: Iterable[str],
+                 ttl_seconds: float, lock_seconds: float):
+        self.app = app
+        self.backend = backend
+        self.routes = set(routes)
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        # Requests of this process being processed, awaited by their duplicates
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        idempotency_key = None
+        for name, value in scope["headers"]:
+            if name == IDEMPOTENCY_HEADER:
+                idempotency_key = value
+                break
+        if idempotency_key is None or request_route(scope) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            await _error(send, 400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+            return
+
+        body = await _read_body(receive)
+        request_fingerprint = fingerprint(scope, body)
+        key = f"idempotency:{request_client(scope)}:{idempotency_key.decode('latin-1')}"
+
+        try:
+            recorded = await self._claim_or_wait(key)
+        except asyncio.TimeoutError:
+            await _error(send, 409, "A request with this Idempotency-Key is still being processed")
+            return
+        if recorded is not None:
+            if recorded.fingerprint != request_fingerprint:
+                await _error(send, 422, "This Idempotency-Key was used for a different request")
+            else:
+                await _respond(send, recorded.status,
+                               recorded.headers + [(b"idempotent-replayed", b"true")], recorded.body)
+            return
+
+        self._in_flight[key] = asyncio.get_running_loop().create_future()
+        body_sent = False
+        start = None
+        chunks = []
+
+        async def receive_body():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def send_and_record(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        recorded = None
+        try:
+            await self.app(scope, receive_body, send_and_record)
+            if start is not None and start["status"] < 500 and start["status"] not in RETRYABLE_STATUSES:
+                recorded = RecordedResponse(request_fingerprint, start["status"],
+                                            list(start.get("headers", [])), b"".join(chunks))
+        finally:
+            if recorded is not None:
+                await self.backend.complete(key, recorded.encode(), self.ttl_seconds)
+            else:
+                await self.backend.release(key)
+            self._in_flight.pop(key).set_result(recorded)
+
+    async def _claim_or_wait(self, key: str) -> Optional[RecordedResponse]:
+        """Claims ``key`` and returns None, or returns the response recorded for it.
+
+        While another request holds the key, waits for it to finish: its
+        response is returned, or the key is claimed if it failed. Raises
+        ``asyncio.TimeoutError`` if it does not finish within
+        ``lock_seconds``.
+        """
+        deadline = time.monotonic() + self.lock_seconds
+        while not await self.backend.claim(key, self.lock_seconds):
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                recorded = await asyncio.wait_for(asyncio.shield(in_flight), max(0.0, deadline - time.monotonic()))
+            else:
+                # Done, or being processed by another worker
+                data = await self.backend.get(key)
+                recorded = RecordedResponse.decode(data) if data is not None else None
+                if recorded is None:
+                    if time.monotonic() >= deadline:
+                        raise asyncio.TimeoutError()
+                    await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            if recorded is not None:
+                return recorded
+        return None
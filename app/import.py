@@ -0,0 +1,38 @@
+"""Command line bulk import of books.
+
+    python -m app.import books.csv
+    python -m app.import --format ndjson - < books.ndjson
+"""
+import argparse
+import sys
+
+from app.database import SessionLocal
+from app.importer import IMPORT_FORMATS, detect_format, import_books
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.import", description="Bulk import books from CSV or NDJSON.")
+    parser.add_argument("path", help="File to import, or - to read from stdin")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="Input format (default: from the file extension)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Rows validated and written per transaction")
+    args = parser.parse_args(argv)
+
+    import_format = args.format or detect_format(args.path)
+    if import_format is None:
+        parser.error("cannot detect the format from the file name, pass --format")
+
+    stream = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8", newline="")
+    db = SessionLocal()
+    try:
+        report = import_books(db, stream, import_format, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+    print(report.model_dump_json(indent=2))
+    return 0 if report.failed == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""Bulk catalogue import from CSV or NDJSON.
+
+Rows are validated with ``BookCreate`` and upserted on the ``title`` unique
+key in chunks. PostgreSQL loads each chunk with ``COPY`` into a temporary
+table followed by a single ``INSERT ... ON CONFLICT``, other databases use a
+multi-row ``INSERT ... ON CONFLICT``. A chunk that fails is retried row by row
+so one bad row is reported without aborting the rest of the import.
+"""
+import csv
+import io
+import json
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import func, insert, text
+from sqlalchemy.orm import Session
+
+from app import models
+from app.crud import books_count, invalidate_books
+from app.logging_config import logger
+from app.schemes import BookCreate, BookImportError, BookImportReport
+from app.search import local_index
+
+IMPORT_FORMATS = ("csv", "ndjson")
+IMPORT_COLUMNS = ("title", "description", "author", "count")
+
+# Errors kept in the report; further failures are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+def detect_format(filename: Optional[str]) -> Optional[str]:
+    """Guesses the import format from a file name."""
+    if filename:
+        lowered = filename.lower()
+        if lowered.endswith(".csv"):
+            return "csv"
+        if lowered.endswith((".ndjson", ".jsonl")):
+            return "ndjson"
+    return None
+
+
+def read_rows(stream: IO[str], import_format: str) -> Iterator[Tuple[int, object]]:
+    """Yields ``(row_number, raw_row)`` pairs from a CSV or NDJSON text stream."""
+    if import_format == "csv":
+        for row_number, row in enumerate(csv.DictReader(stream), start=1):
+            yield row_number, row
+    elif import_format == "ndjson":
+        for row_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield row_number, json.loads(line)
+            except ValueError as e:
+                yield row_number, e
+    else:
+        raise ValueError(f"Unsupported import format: {import_format}")
+
+
+def _upsert_statement(dialect_name: str, rows: List[Dict]):
+    # Dialect modules are imported on use; loading them costs every worker start
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects import postgresql
+        stmt = postgresql.insert(models.Books).values(rows)
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects import sqlite
+        stmt = sqlite.insert(models.Books).values(rows)
+    else:
+        return insert(models.Books).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["title"],
+        set_={
+            "description": stmt.excluded.description,
+            "author": stmt.excluded.author,
+            "count": stmt.excluded.count,
+            "updated_at": func.now(),
+        },
+    )
+
+
+def _copy_upsert(db: Session, rows: List[Dict]) -> None:
+    """Loads rows with COPY into a temporary table and upserts them from there."""
+    db.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS books_import "
+        "(title varchar, description varchar, author varchar, count integer) "
+        "ON COMMIT DELETE ROWS"
+    ))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in IMPORT_COLUMNS])
+    buffer.seek(0)
+    cursor = db.connection().connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY books_import (title, description, author, count) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+    db.execute(text(
+        "INSERT INTO books (title, description, author, count, updated_at) "
+        "SELECT title, description, author, count, now() FROM books_import "
+        "ON CONFLICT (title) DO UPDATE SET description = EXCLUDED.description, "
+        "author = EXCLUDED.author, count = EXCLUDED.count, updated_at = now()"
+    ))
+
+
+def _write_chunk(db: Session, rows: List[Dict]) -> None:
+    dialect_name = db.get_bind().dialect.name
+    if dialect_name == "postgresql" and len(rows) > 1:
+        _copy_upsert(db, rows)
+    else:
+        db.execute(_upsert_statement(dialect_name, rows))
+
+
+def _flush_chunk(db: Session, chunk: List[Tuple[int, Dict]], report: BookImportReport) -> None:
+    # Later rows with the same title win, as they would in a row-by-row load
+    by_title = {row["title"]: (row_number, row) for row_number, row in chunk}
+    try:
+        with db.begin_nested():
+            _write_chunk(db, [row for _, row in by_title.values()])
+        db.commit()
+        report.imported += len(by_title)
+        return
+    except Exception as e:
+        db.rollback()
+        logger.warning("Import chunk failed, retrying row by row: %s", e)
+
+    for row_number, row in by_title.values():
+        try:
+            with db.begin_nested():
+                db.execute(_upsert_statement(db.get_bind().dialect.name, [row]))
+            report.imported += 1
+        except Exception as e:
+            _record_error(report, row_number, str(getattr(e, "orig", e)))
+    db.commit()
+
+
+def _record_error(report: BookImportReport, row_number: int, error: str) -> None:
+    report.failed += 1
+    if len(report.errors) < MAX_REPORTED_ERRORS:
+        report.errors.append(BookImportError(row=row_number, error=error))
+
+
+def import_books(db: Session, stream: IO[str], import_format: str, chunk_size: int = 1000) -> BookImportReport:
+    """Validates and upserts every book in ``stream``, committing once per chunk."""
+    report = BookImportReport()
+    chunk: List[Tuple[int, Dict]] = []
+    for row_number, raw in read_rows(stream, import_format):
+        try:
+            if isinstance(raw, Exception):
+                raise raw
+            book = BookCreate.model_validate(raw)
+        except (ValidationError, ValueError, TypeError) as e:
+            _record_error(report, row_number, str(e))
+            continue
+        chunk.append((row_number, book.model_dump()))
+        if len(chunk) >= chunk_size:
+            _flush_chunk(db, chunk, report)
+            chunk = []
+    if chunk:
+        _flush_chunk(db, chunk, report)
+    books_count.invalidate()
+    invalidate_books(all_books=True)
+    local_index.mark_stale()
+    logger.info("Imported %s books, %s rows failed", report.imported, report.failed)
+    return report
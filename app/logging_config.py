@@ -1,11 +1,158 @@
+"""Non-blocking logging pipeline.
+
+Request threads only put records on an in-memory queue through a
+``QueueHandler``; a ``QueueListener`` thread formats them and writes them to a
+rotating file. Per-logger sampling and rate limiting filters run before a
+record is queued, so dropped records cost almost nothing.
+
+The ``logger`` is usable as soon as this module is imported. Records are
+buffered in the queue until ``configure_logging`` starts the writer thread
+with the handlers described by ``AppSettings``.
+"""
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
 
 logger = logging.getLogger('uvicorn')
-logger.setLevel(logging.DEBUG)
+logger.setLevel(logging.INFO)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Records that are always kept by the sampling and rate limiting filters
+ALWAYS_KEEP_LEVEL = logging.ERROR
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _PrefixLookup:
+    """Finds the setting of the most specific configured logger prefix."""
+
+    def __init__(self, values: Dict[str, float]):
+        self._values = sorted(values.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def get(self, name: str) -> Optional[float]:
+        for prefix, value in self._values:
+            if name == prefix or name.startswith(prefix + ".") or prefix == "*":
+                return value
+        return None
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a configured fraction of the records of each logger."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self._rates = _PrefixLookup(rates)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= ALWAYS_KEEP_LEVEL:
+            return True
+        rate = self._rates.get(record.name)
+        return rate is None or random.random() < rate
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket limiting the records per second of each logger."""
+
+    def __init__(self, limits: Dict[str, float]):
+        super().__init__()
+        self._limits = _PrefixLookup(limits)
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= ALWAYS_KEEP_LEVEL:
+            return True
+        rate = self._limits.get(record.name)
+        if rate is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(record.name, (rate, now))
+            tokens = min(rate, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self._buckets[record.name] = [tokens, now]
+                self.dropped += 1
+                return False
+            self._buckets[record.name] = [tokens - 1, now]
+            return True
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    Only the message arguments are merged on the calling thread, so objects
+    passed as arguments are not touched from the writer thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+queue_handler = LazyQueueHandler(log_queue)
+logger.addHandler(queue_handler)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(settings) -> None:
+    """Starts the writer thread and applies the logging options of ``settings``."""
+    global _listener
+    if _listener is not None:
+        return
+
+    logger.setLevel(settings.LOG_LEVEL.upper())
+
+    queue_handler.filters.clear()
+    if settings.LOG_SAMPLE_RATES:
+        queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
+    if settings.LOG_RATE_LIMITS:
+        queue_handler.addFilter(RateLimitFilter(settings.LOG_RATE_LIMITS))
+
+    handler = logging.handlers.RotatingFileHandler(
+        settings.LOG_FILE,
+        maxBytes=settings.LOG_MAX_BYTES,
+        backupCount=settings.LOG_BACKUP_COUNT,
+        delay=True,
+    )
+    handler.setFormatter(JSONFormatter() if settings.LOG_JSON else logging.Formatter(TEXT_FORMAT))
 
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
 
-file_handler = logging.FileHandler('librarian.log')  # Change the file path here
-file_handler.setFormatter(formatter)
 
-logger.addHandler(file_handler)
\ No newline at end of file
+def stop_logging() -> None:
+    """Flushes queued records and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
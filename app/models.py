@@ -1,8 +1,7 @@
-from datetime import datetime
 from sqlalchemy import (
-    Column, Integer, String, Boolean, TIMESTAMP, text, DateTime, Enum, ForeignKey
+    Column, Date, Integer, String, Boolean, TIMESTAMP, text, Enum, ForeignKey, Index, func
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import backref, relationship
 from app.database import Base
 
 
@@ -18,15 +17,19 @@ class Users(Base):
     is_active = Column(Boolean, default=True)
     role = Column(Enum("admin", "user", name="user_roles"), default="user")
     created_at = Column(TIMESTAMP(timezone=True),
-                        nullable=False, server_default=text('now()'))
+                        nullable=False, server_default=func.now())
     updated_at = Column(TIMESTAMP(timezone=True), nullable=False,
-                        default=text('now()'), onupdate=text('now()'))
+                        default=func.now(), onupdate=func.now())
 
 
 class Books(Base):
     """Class representing the 'books' table in the database."""
 
     __tablename__ = 'books'
+    __table_args__ = (
+        # Latest change to any book, the Last-Modified of the list pages
+        Index('ix_books_updated_at', 'updated_at'),
+    )
 
     id = Column(Integer, primary_key=True)
     title = Column(String, unique=True, nullable=False)
@@ -34,15 +37,29 @@ class Books(Base):
     author = Column(String, unique=True, nullable=False)
     count = Column(Integer, nullable=False)
     created_at = Column(TIMESTAMP(timezone=True),
-                        nullable=False, server_default=text('now()'))
+                        nullable=False, server_default=func.now())
     updated_at = Column(TIMESTAMP(timezone=True), nullable=False,
-                        default=text('now()'), onupdate=text('now()'))
+                        default=func.now(), onupdate=func.now())
 
 
 class BookTransactions(Base):
     """Class representing the 'book_transactions' table in the database."""
 
     __tablename__ = 'book_transactions'
+    __table_args__ = (
+        Index('ix_book_transactions_borrowed_by_borrowed_at', 'borrowed_by', 'borrowed_at'),
+        Index('ix_book_transactions_book_id_returned', 'book_id', 'returned'),
+        Index('ix_book_transactions_borrowed_at', 'borrowed_at'),
+        # Open loans in reminder order, walked by app.overdue
+        Index('ix_book_transactions_open_next_reminder_at', 'next_reminder_at', 'id',
+              postgresql_where=text('returned = false'), sqlite_where=text('returned = 0')),
+        # Open loans of a user in loan order, for GET /users/book?active_only
+        Index('ix_book_transactions_open_borrowed_by', 'borrowed_by', 'id',
+              postgresql_where=text('returned = false'), sqlite_where=text('returned = 0')),
+        # Open loans of a book, oldest first, closed by a return
+        Index('ix_book_transactions_open_book_id', 'book_id', 'borrowed_at',
+              postgresql_where=text('returned = false'), sqlite_where=text('returned = 0')),
+    )
 
     id = Column(Integer, primary_key=True)
     book_id = Column(Integer, ForeignKey('books.id'), nullable=False)
@@ -50,8 +67,87 @@ class BookTransactions(Base):
     borrowed = Column(Boolean, default=True)
     returned = Column(Boolean, default=False)
     borrowed_at = Column(TIMESTAMP(timezone=True),
-                         nullable=False, server_default=text('now()'))
+                         nullable=False, server_default=func.now())
     returned_at = Column(TIMESTAMP(timezone=True))
+    due_at = Column(TIMESTAMP(timezone=True))
+    # When the overdue scan next looks at the loan: the due date, then the
+    # time of the next reminder
+    next_reminder_at = Column(TIMESTAMP(timezone=True))
+    fine_cents = Column(Integer, nullable=False, default=0, server_default=text('0'))
 
-    user = relationship("Users", backref="book_transactions")
-    book = relationship("Books", backref="book_transactions")
+    # Relationships are never loaded implicitly: a query that needs them asks
+    # for selectinload/joinedload, and a lazy load that would emit one SELECT
+    # per row raises instead
+    user = relationship("Users", backref=backref("book_transactions", lazy="raise_on_sql"), lazy="raise_on_sql")
+    book = relationship("Books", backref=backref("book_transactions", lazy="raise_on_sql"), lazy="raise_on_sql")
+
+
+# Circulation rollups kept up to date by app.analytics in the same transaction
+# as each borrow and return. They have no foreign keys so that statistics
+# outlive deleted books and users.
+
+
+class BookDailyStats(Base):
+    """Borrows and returns of one book on one day."""
+
+    __tablename__ = 'book_daily_stats'
+    __table_args__ = (
+        Index('ix_book_daily_stats_day', 'day'),
+    )
+
+    book_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    borrows = Column(Integer, nullable=False, default=0)
+    returns = Column(Integer, nullable=False, default=0)
+
+
+class UserDailyStats(Base):
+    """Borrows and returns of one user on one day."""
+
+    __tablename__ = 'user_daily_stats'
+    __table_args__ = (
+        Index('ix_user_daily_stats_day', 'day'),
+    )
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    borrows = Column(Integer, nullable=False, default=0)
+    returns = Column(Integer, nullable=False, default=0)
+
+
+class DailyStats(Base):
+    """Borrows and returns of the whole library on one day."""
+
+    __tablename__ = 'daily_stats'
+
+    day = Column(Date, primary_key=True)
+    borrows = Column(Integer, nullable=False, default=0)
+    returns = Column(Integer, nullable=False, default=0)
+
+
+class BookStats(Base):
+    """All-time borrows and returns of one book and its loans still open."""
+
+    __tablename__ = 'book_stats'
+    __table_args__ = (
+        Index('ix_book_stats_borrows', 'borrows'),
+    )
+
+    book_id = Column(Integer, primary_key=True)
+    borrows = Column(Integer, nullable=False, default=0)
+    returns = Column(Integer, nullable=False, default=0)
+    active_loans = Column(Integer, nullable=False, default=0)
+
+
+class UserStats(Base):
+    """All-time borrows and returns of one user and their loans still open."""
+
+    __tablename__ = 'user_stats'
+    __table_args__ = (
+        Index('ix_user_stats_active_loans', 'active_loans'),
+    )
+
+    user_id = Column(Integer, primary_key=True)
+    borrows = Column(Integer, nullable=False, default=0)
+    returns = Column(Integer, nullable=False, default=0)
+    active_loans = Column(Integer, nullable=False, default=0)
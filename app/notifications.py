@@ -0,0 +1,70 @@
+"""Sinks receiving the notifications queued by background jobs.
+
+A sink only has to accept a batch of JSON-serializable messages; delivering
+them (mail, SMS, a message broker) is left to whatever consumes the sink.
+"""
+import threading
+from typing import List
+
+import orjson
+
+from app.logging_config import logger
+
+
+class NotificationSink:
+    """Destination of queued notifications.
+
+    ``send`` is called with each batch before the job commits it, so raising
+    makes the job retry the batch on its next run.
+    """
+
+    def send(self, messages: List[dict]) -> None:
+        raise NotImplementedError
+
+
+class MemorySink(NotificationSink):
+    """Keeps the messages in a list, for tests and local development."""
+
+    def __init__(self):
+        self.messages: List[dict] = []
+        self._lock = threading.Lock()
+
+    def send(self, messages: List[dict]) -> None:
+        with self._lock:
+            self.messages.extend(messages)
+
+
+class LogSink(NotificationSink):
+    """Writes each message to the application log."""
+
+    def send(self, messages: List[dict]) -> None:
+        for message in messages:
+            logger.info("Notification %s", orjson.dumps(message).decode())
+
+
+class FileSink(NotificationSink):
+    """Appends the messages to an NDJSON file read by a separate delivery process."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, messages: List[dict]) -> None:
+        if not messages:
+            return
+        lines = b"".join(orjson.dumps(message) + b"\n" for message in messages)
+        with self._lock, open(self.path, "ab") as output:
+            output.write(lines)
+
+
+def create_notification_sink(sink: str, path: str = None) -> NotificationSink:
+    """Builds the sink named by the settings ("log", "file" or "memory")."""
+    if sink == "log":
+        return LogSink()
+    if sink == "file":
+        if not path:
+            raise ValueError("The file notification sink needs a path")
+        return FileSink(path)
+    if sink == "memory":
+        return MemorySink()
+    raise ValueError(f"Unknown notification sink: {sink}")
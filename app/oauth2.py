@@ -1,17 +1,17 @@
 from datetime import datetime, timedelta
-import logging
 
-from fastapi import (
-    APIRouter, Depends, HTTPException, Response, status
-)
+from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app import models
 from app.config import app_settings
-from app.database import get_db
-from app.schemes import TokenData
+from app.database import get_async_db, get_db
+from app.cache import TTLCache
+from app.schemes import CurrentUser, TokenData
 from app.logging_config import logger
 
 # Create an OAuth2 password bearer schema
@@ -22,31 +22,96 @@ SECRET_KEY = app_settings.SECRET_KEY
 ALGORITHIM = app_settings.ALGORITHIM
 ACCESS_TOKEN_EXPIRE_MINUTES = app_settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
+# Principal data of recently authenticated users, keyed by user id
+user_cache = TTLCache(
+    maxsize=app_settings.AUTH_USER_CACHE_MAXSIZE,
+    ttl_seconds=app_settings.AUTH_USER_CACHE_TTL_SECONDS,
+)
+
 
 def create_access_token(data: dict) -> str:
     """Generate an access token based on input data."""
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"expire": expire.strftime("%Y-%m-%dT%H:%M:%SZ")})
+    # Standard claim, checked by jwt.decode; the role and active flag a
+    # stateless principal trusts are at most this old
+    to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHIM)
 
 
+def user_token_claims(user: models.Users) -> dict:
+    """Build the access token claims needed to authorize a user without a DB lookup."""
+    return {
+        "user_id": user.id,
+        "name": user.name,
+        "role": user.role,
+        "is_active": user.is_active,
+    }
+
+
 def verify_access_token(token: str, credentials_exception) -> TokenData:
     """Verify the access token and return token data."""
     try:
-        payload = jwt.decode(token, SECRET_KEY)
+        # Tokens without an expiry are refused, including those issued
+        # with the former non-standard "expire" claim
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHIM], options={"require_exp": True})
         user_id: str = payload.get("user_id")
         if not user_id:
             raise credentials_exception
-        token_data = TokenData(id=user_id)
-        logger.info(f"Token verified successfully for user ID: {user_id}")
+        token_data = TokenData(
+            id=user_id,
+            name=payload.get("name"),
+            role=payload.get("role"),
+            is_active=payload.get("is_active"),
+        )
+        logger.debug("Token verified successfully for user ID: %s", user_id)
     except JWTError:
         logger.error("Error decoding JWT token")
         raise credentials_exception
     return token_data
 
 
-def get_current_user(token: str = Depends(oauth2_schema), db: Session = Depends(get_db)) -> models.Users:
+def invalidate_cached_user(user_id: int) -> None:
+    """Drop a user's cached principal so the next request reloads it."""
+    user_cache.invalidate(user_id)
+
+
+@event.listens_for(models.Users, "after_update")
+@event.listens_for(models.Users, "after_delete")
+def _invalidate_user_on_change(mapper, connection, target) -> None:
+    invalidate_cached_user(target.id)
+
+
+def _principal_from_token(token_data: TokenData):
+    """Return the principal carried by the token claims, or None when they are incomplete."""
+    if app_settings.AUTH_STATELESS and token_data.name and token_data.role:
+        return CurrentUser(
+            id=token_data.id,
+            name=token_data.name,
+            role=token_data.role,
+            is_active=True if token_data.is_active is None else token_data.is_active,
+        )
+    if app_settings.AUTH_USER_CACHE_ENABLED:
+        return user_cache.get(token_data.id)
+    return None
+
+
+def _active_principal(principal: CurrentUser, credentials_exception) -> CurrentUser:
+    """Returns the principal unless its user is deactivated."""
+    if not principal.is_active:
+        logger.warning("Inactive user rejected: %s", principal.id)
+        raise credentials_exception
+    return principal
+
+
+def _remember_principal(user: models.Users) -> CurrentUser:
+    principal = CurrentUser.model_validate(user)
+    if app_settings.AUTH_USER_CACHE_ENABLED:
+        user_cache.set(user.id, principal)
+    return principal
+
+
+def get_current_user(token: str = Depends(oauth2_schema), db: Session = Depends(get_db)) -> CurrentUser:
     """Get the current user based on the access token."""
     try:
         credentials_exception = HTTPException(
@@ -55,13 +120,39 @@ def get_current_user(token: str = Depends(oauth2_schema), db: Session = Depends(
             headers={"WWW-Authenticate": "Bearer"}
         )
         token_data = verify_access_token(token, credentials_exception)
+        principal = _principal_from_token(token_data)
+        if principal is not None:
+            return _active_principal(principal, credentials_exception)
         user = db.query(models.Users).filter(
             models.Users.id == token_data.id).first()
         if not user:
-            logger.warning(f"User not found with ID: {token_data.id}")
+            logger.warning("User not found with ID: %s", token_data.id)
+            raise credentials_exception
+        logger.debug("Current user retrieved: %s", user.name)
+        return _active_principal(_remember_principal(user), credentials_exception)
+    except Exception as e:
+        logger.error("Error while getting current user: %s", e)
+        raise credentials_exception
+
+
+async def get_current_user_async(token: str = Depends(oauth2_schema), db: AsyncSession = Depends(get_async_db)) -> CurrentUser:
+    """Get the current user based on the access token using an async session."""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate the credentials",
+        headers={"WWW-Authenticate": "Bearer"}
+    )
+    try:
+        token_data = verify_access_token(token, credentials_exception)
+        principal = _principal_from_token(token_data)
+        if principal is not None:
+            return _active_principal(principal, credentials_exception)
+        user = await db.get(models.Users, token_data.id)
+        if not user:
+            logger.warning("User not found with ID: %s", token_data.id)
             raise credentials_exception
-        logger.info(f"Current user retrieved: {user.name}")
-        return user
+        logger.debug("Current user retrieved: %s", user.name)
+        return _active_principal(_remember_principal(user), credentials_exception)
     except Exception as e:
-        logger.error(f"Error while getting current user: {e}")
+        logger.error("Error while getting current user: %s", e)
         raise credentials_exception
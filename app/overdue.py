@@ -0,0 +1,149 @@
+"""Overdue loan processing.
+
+Loans are due ``LOAN_PERIOD_DAYS`` after they are borrowed. ``scan_overdue``
+walks the open loans whose ``next_reminder_at`` has passed, in keyset batches
+over the partial ``(next_reminder_at, id) WHERE returned = false`` index, so
+it never reads returned loans nor loans that are not due yet. For each loan
+it updates the fine, queues a reminder to the notification sink and moves
+``next_reminder_at`` one reminder interval ahead. Every batch is its own
+short transaction, so a scan over millions of loans holds no lock for long
+and resumes from where it stopped if it fails.
+"""
+import asyncio
+import math
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy import and_, bindparam, or_, select, update
+
+from app import models
+from app.config import app_settings
+from app.database import SessionLocal
+from app.logging_config import logger
+from app.notifications import NotificationSink, create_notification_sink
+
+# Sink receiving the reminders of this process
+notification_sink = create_notification_sink(app_settings.NOTIFICATION_SINK, app_settings.NOTIFICATION_FILE)
+
+
+def due_date(borrowed_at: datetime) -> datetime:
+    return borrowed_at + timedelta(days=app_settings.LOAN_PERIOD_DAYS)
+
+
+def _lateness(due_at: datetime, at: datetime) -> timedelta:
+    # Loans are stamped with naive local times, which PostgreSQL returns as aware
+    if due_at.tzinfo is not None and at.tzinfo is None:
+        at = at.astimezone()
+    elif due_at.tzinfo is None and at.tzinfo is not None:
+        due_at = due_at.astimezone()
+    return at - due_at
+
+
+def compute_fine(due_at: Optional[datetime], at: datetime) -> int:
+    """Returns the fine in cents of a loan due at ``due_at`` if still out at ``at``."""
+    if due_at is None:
+        return 0
+    late = _lateness(due_at, at)
+    if late <= timedelta(0):
+        return 0
+    days_late = math.ceil(late.total_seconds() / 86400)
+    fine = days_late * app_settings.OVERDUE_FINE_CENTS_PER_DAY
+    if app_settings.OVERDUE_FINE_MAX_CENTS:
+        fine = min(fine, app_settings.OVERDUE_FINE_MAX_CENTS)
+    return fine
+
+
+def overdue_batch_statement(now: datetime, after: Optional[Tuple[datetime, int]], limit: int):
+    """Next ``limit`` open loans due for a reminder at ``now``, after the keyset ``after``.
+
+    On PostgreSQL the rows are locked and rows locked by a concurrent scan
+    are skipped, so two scanners never remind the same loan twice.
+    """
+    transactions = models.BookTransactions
+    query = select(
+        transactions.id, transactions.book_id, transactions.borrowed_by, transactions.due_at,
+        transactions.next_reminder_at, models.Users.name, models.Users.email, models.Books.title,
+    ).join(models.Users, models.Users.id == transactions.borrowed_by).join(
+        models.Books, models.Books.id == transactions.book_id
+    ).where(
+        transactions.returned == False,
+        transactions.next_reminder_at <= now,
+    )
+    if after is not None:
+        reminder_at, loan_id = after
+        query = query.where(or_(
+            transactions.next_reminder_at > reminder_at,
+            and_(transactions.next_reminder_at == reminder_at, transactions.id > loan_id),
+        ))
+    return query.order_by(transactions.next_reminder_at, transactions.id).limit(limit).with_for_update(
+        of=transactions, skip_locked=True)
+
+
+# Still guarded on returned: on SQLite the batch is read without row locks
+remind_statement = update(models.BookTransactions.__table__).where(
+    models.BookTransactions.id == bindparam("loan_id"),
+    models.BookTransactions.returned == False,
+).values(fine_cents=bindparam("fine"), next_reminder_at=bindparam("reminder_at"))
+
+
+def reminder(row, fine: int, now: datetime) -> dict:
+    return {
+        "type": "overdue_loan",
+        "loan_id": row.id,
+        "book_id": row.book_id,
+        "title": row.title,
+        "user_id": row.borrowed_by,
+        "name": row.name,
+        "email": row.email,
+        "due_at": row.due_at.isoformat(),
+        "days_overdue": _lateness(row.due_at, now).days,
+        "fine_cents": fine,
+    }
+
+
+def scan_overdue(sink: NotificationSink, batch_size: Optional[int] = None, now: Optional[datetime] = None,
+                 session_factory=SessionLocal) -> dict:
+    """Fines and reminds every open loan due for a reminder, one batch per transaction.
+
+    The reminders of a batch are sent before it commits: a failure makes the
+    next scan send the batch again rather than lose it.
+    """
+    batch_size = batch_size or app_settings.OVERDUE_BATCH_SIZE
+    now = now or datetime.now()
+    next_reminder_at = now + timedelta(hours=app_settings.OVERDUE_REMINDER_INTERVAL_HOURS)
+    report = {"batches": 0, "reminded": 0, "fined_cents": 0}
+    after = None
+    while True:
+        with session_factory() as db:
+            try:
+                rows = db.execute(overdue_batch_statement(now, after, batch_size)).all()
+                if not rows:
+                    break
+                fines = [compute_fine(row.due_at, now) for row in rows]
+                db.execute(remind_statement, [
+                    {"loan_id": row.id, "fine": fine, "reminder_at": next_reminder_at}
+                    for row, fine in zip(rows, fines)
+                ])
+                sink.send([reminder(row, fine, now) for row, fine in zip(rows, fines)])
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        report["batches"] += 1
+        report["reminded"] += len(rows)
+        report["fined_cents"] += sum(fines)
+        after = (rows[-1].next_reminder_at, rows[-1].id)
+        if len(rows) < batch_size:
+            break
+    return report
+
+
+async def run_overdue_scheduler(sink: NotificationSink, interval_seconds: float) -> None:
+    """Runs ``scan_overdue`` every ``interval_seconds`` off the event loop until cancelled."""
+    while True:
+        try:
+            report = await asyncio.to_thread(scan_overdue, sink)
+            logger.info("Overdue scan finished: %s", report)
+        except Exception as e:
+            logger.error("Overdue scan failed: %s", e)
+        await asyncio.sleep(interval_seconds)
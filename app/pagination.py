@@ -0,0 +1,108 @@
+import base64
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(last_id: int) -> str:
+    """Encodes the last seen primary key into an opaque cursor token."""
+    payload = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Decodes an opaque cursor token back into the last seen primary key."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        last_id = payload["id"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor("Invalid pagination cursor") from e
+    if not isinstance(last_id, int) or last_id < 0:
+        raise InvalidCursor("Invalid pagination cursor")
+    return last_id
+
+
+class CachedCount:
+    """Process-local cached row count with a TTL and explicit invalidation.
+
+    The count is loaded lazily on first use and reused until it expires or
+    a write path calls ``invalidate``.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._value: Optional[int] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, loader: Callable[[], int]) -> int:
+        """Returns the cached count, calling ``loader`` when it is stale."""
+        now = time.monotonic()
+        value = self._value
+        if value is not None and now < self._expires_at:
+            return value
+        with self._lock:
+            if self._value is not None and time.monotonic() < self._expires_at:
+                return self._value
+            self._value = loader()
+            self._expires_at = time.monotonic() + self.ttl_seconds
+            return self._value
+
+    def peek(self) -> Optional[int]:
+        """Returns the cached count if it is still fresh, otherwise None."""
+        if self._value is not None and time.monotonic() < self._expires_at:
+            return self._value
+        return None
+
+    def set(self, value: int) -> None:
+        """Stores a freshly loaded count, e.g. from an async query."""
+        with self._lock:
+            self._value = value
+            self._expires_at = time.monotonic() + self.ttl_seconds
+
+    def invalidate(self) -> None:
+        """Drops the cached count so the next read reloads it."""
+        with self._lock:
+            self._value = None
+            self._expires_at = 0.0
+
+
+def as_utc(value: datetime) -> datetime:
+    """Returns a database timestamp as an aware UTC datetime."""
+    if value.tzinfo is None:
+        # SQLite returns the UTC timestamps of func.now() without a zone
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+class ListLastModified:
+    """Process-local Last-Modified of a list, from its newest ``updated_at`` and its row count.
+
+    Deleting a row leaves no ``updated_at`` behind, so a count lower than the
+    one last observed moves the date to the time the drop is seen. The
+    process start counts as such a change, since deletions before it went
+    unobserved.
+    """
+
+    def __init__(self):
+        self._count: Optional[int] = None
+        self._changed_at = datetime.now(timezone.utc)
+        self._lock = threading.Lock()
+
+    def observe(self, newest_updated_at: Optional[datetime], count: int) -> datetime:
+        """Returns the Last-Modified of the list given its newest ``updated_at`` and row count."""
+        with self._lock:
+            if self._count is not None and count < self._count:
+                self._changed_at = datetime.now(timezone.utc)
+            self._count = count
+            changed_at = self._changed_at
+        if newest_updated_at is None:
+            return changed_at
+        return max(as_utc(newest_updated_at), changed_at)
@@ -0,0 +1,104 @@
+"""Per-request SQL statement budgets, to catch N+1 queries before production.
+
+With ``QUERY_BUDGET_MODE`` set, ``QueryBudgetMiddleware`` counts the
+statements every request executes on any engine and compares the count with
+the budget of its route, ``QUERY_BUDGETS["<METHOD> <route>"]`` or
+``QUERY_BUDGET_DEFAULT``. Over budget, "warn" logs the route and count and
+"raise" answers 500 instead of the response (whatever the request wrote is
+already committed), so a load test or CI run fails on the regression. Every
+response carries ``X-Query-Count`` and ``X-Query-Budget``.
+
+The count is taken when the response starts; statements a streaming
+response runs afterwards are not checked. Meant for development and CI: it
+adds an event listener on every statement.
+"""
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+import orjson
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+from app.logging_config import logger
+from app.ratelimit import request_route
+
+QUERY_BUDGET_MODES = ("warn", "raise")
+
+
+class StatementCounter:
+    """Statements executed by one request; shared by every task and thread it uses."""
+
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+
+_counter: ContextVar[Optional[StatementCounter]] = ContextVar("query_budget_counter", default=None)
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _counter.get()
+    if counter is not None:
+        counter.count += 1
+
+
+def install_statement_counter() -> None:
+    """Counts the statements of every engine, sync or async, for the current request."""
+    if not event.contains(Engine, "before_cursor_execute", _count_statement):
+        event.listen(Engine, "before_cursor_execute", _count_statement)
+
+
+class QueryBudgetMiddleware:
+    """ASGI middleware enforcing a statement budget per route."""
+
+    def __init__(self, app, mode: str, default: int, budgets: Dict[str, int]):
+        if mode not in QUERY_BUDGET_MODES:
+            raise ValueError(f"Unknown QUERY_BUDGET_MODE: {mode}")
+        self.app = app
+        self.mode = mode
+        self.default = default
+        self.budgets = budgets
+        install_statement_counter()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = request_route(scope)
+        budget = self.budgets.get(route, self.default)
+        counter = StatementCounter()
+        replaced = False
+
+        async def send_with_count(message):
+            nonlocal replaced
+            if message["type"] == "http.response.start":
+                count = counter.count
+                body = None
+                if count > budget:
+                    logger.warning("%s ran %s SQL statements, over its budget of %s", route, count, budget)
+                    if self.mode == "raise":
+                        replaced = True
+                        body = orjson.dumps({"detail": f"Query budget exceeded: {count} statements, budget {budget}"})
+                        message = {
+                            "type": "http.response.start",
+                            "status": 500,
+                            "headers": [(b"content-type", b"application/json"),
+                                        (b"content-length", str(len(body)).encode())],
+                        }
+                headers = MutableHeaders(scope=message)
+                headers["X-Query-Count"] = str(count)
+                headers["X-Query-Budget"] = str(budget)
+                await send(message)
+                if body is not None:
+                    await send({"type": "http.response.body", "body": body})
+            elif not replaced:
+                await send(message)
+
+        token = _counter.set(counter)
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            _counter.reset(token)
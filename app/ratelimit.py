@@ -0,0 +1,261 @@
+"""Rate limiting and admission control middleware.
+
+``RateLimitMiddleware`` gives every client a token bucket per route: the
+client is the user id of a valid access token, or the client IP for
+anonymous requests. Limits are set per ``"<METHOD> <route template>"`` in the
+settings. Buckets live in a ``RateLimitBackend``, per process in memory or
+shared by every process through Redis.
+
+``ConcurrencyLimitMiddleware`` caps the requests a process serves at once
+and answers 503 beyond it, so a burst is shed quickly instead of queueing
+for database connections until every request times out.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import orjson
+from jose import JWTError, jwt
+from starlette.routing import Match
+
+from app.cache import redis_client
+from app.config import app_settings
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class RateLimit:
+    """Bucket of ``capacity`` tokens refilled at ``capacity`` per ``period_seconds``."""
+
+    __slots__ = ("capacity", "period_seconds")
+
+    def __init__(self, capacity: int, period_seconds: float):
+        self.capacity = capacity
+        self.period_seconds = period_seconds
+
+    @property
+    def refill_per_second(self) -> float:
+        return self.capacity / self.period_seconds
+
+    @classmethod
+    def parse(cls, value: str) -> "RateLimit":
+        """Parses limits written as ``"<count>/<second|minute|hour|day>"``."""
+        try:
+            count, period = value.split("/")
+            limit = cls(int(count), PERIODS[period.strip()])
+        except (ValueError, KeyError):
+            raise ValueError(f"Invalid rate limit '{value}', expected '<count>/<second|minute|hour|day>'")
+        if limit.capacity < 1:
+            raise ValueError(f"Invalid rate limit '{value}', the count must be positive")
+        return limit
+
+
+class RateLimitBackend:
+    """Store of token buckets used by ``RateLimitMiddleware``."""
+
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        """Takes a token from the bucket ``key``.
+
+        Returns 0 when a token was taken, otherwise the seconds until one is
+        available.
+        """
+        raise NotImplementedError
+
+
+def _take_token(tokens: float, updated: float, now: float, limit: RateLimit) -> Tuple[float, float]:
+    """Returns the tokens left after refilling and taking one, and the wait if none was left."""
+    tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_per_second)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / limit.refill_per_second
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Process-local buckets. Each worker process enforces the limits on its own.
+
+    At most ``maxsize`` buckets are kept; the least recently used one is
+    dropped first, which at worst gives an idle client a full bucket back.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (limit.capacity, now))
+            tokens, wait = _take_token(tokens, updated, now, limit)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+# Refills and takes a token atomically; floats are returned as strings since
+# Redis truncates Lua numbers to integers
+_REDIS_TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(wait)
+"""
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """Buckets shared by every worker through a Redis-compatible server."""
+
+    def __init__(self, url: Optional[str]):
+        self._client = redis_client(url, asynchronous=True)
+        self._script = self._client.register_script(_REDIS_TOKEN_BUCKET)
+
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        wait = await self._script(keys=[f"ratelimit:{key}"],
+                                  args=[limit.capacity, limit.refill_per_second, time.time()])
+        return float(wait)
+
+
+def create_rate_limit_backend(backend: str, maxsize: int, redis_url: Optional[str] = None) -> RateLimitBackend:
+    """Builds the rate limit backend named by the settings ("memory" or "redis")."""
+    if backend == "memory":
+        return MemoryRateLimitBackend(maxsize)
+    if backend == "redis":
+        return RedisRateLimitBackend(redis_url)
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
+
+def route_key(routes: Iterable, scope) -> str:
+    """Returns ``"<METHOD> <route template>"`` for the route ``scope`` goes to."""
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{scope['method']} {route.path}"
+    return f"{scope['method']} <unmatched>"
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+def client_key(scope) -> str:
+    """Identifies the client by the user id of a valid access token, else by IP."""
+    authorization = _header(scope, b"authorization")
+    if authorization and authorization[:7].lower() == b"bearer ":
+        try:
+            payload = jwt.decode(authorization[7:].decode("latin-1"), app_settings.SECRET_KEY,
+                                 algorithms=[app_settings.ALGORITHIM])
+            if payload.get("user_id"):
+                return f"user:{payload['user_id']}"
+        except JWTError:
+            pass
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+def request_route(scope) -> str:
+    """Returns the ``route_key`` of the request, computed once and kept in ``scope["state"]``.
+
+    Every middleware keyed by route reads it from there instead of matching
+    the routes again.
+    """
+    state = scope.setdefault("state", {})
+    route = state.get("route_key")
+    if route is None:
+        route = state["route_key"] = route_key(scope["app"].router.routes, scope)
+    return route
+
+
+def request_client(scope) -> str:
+    """Returns the ``client_key`` of the request, decoding its token once per request."""
+    state = scope.setdefault("state", {})
+    client = state.get("client_key")
+    if client is None:
+        client = state["client_key"] = client_key(scope)
+    return client
+
+
+async def _reject(send, status_code: int, detail: str, retry_after: float) -> None:
+    body = orjson.dumps({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 with Retry-After to clients over their limit."""
+
+    def __init__(self, app, backend: RateLimitBackend, limits: Dict[str, str],
+                 default: Optional[str] = None, exempt: Iterable[str] = ()):
+        self.app = app
+        self.backend = backend
+        self.limits = {key: RateLimit.parse(value) for key, value in limits.items()}
+        self.default = RateLimit.parse(default) if default else None
+        self.exempt = set(exempt)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = request_route(scope)
+        limit = self.limits.get(route, self.default)
+        if limit is not None and route not in self.exempt:
+            wait = await self.backend.acquire(f"{route}|{request_client(scope)}", limit)
+            if wait > 0:
+                await _reject(send, 429, "Too many requests", wait)
+                return
+        await self.app(scope, receive, send)
+
+
+class ConcurrencyLimitMiddleware:
+    """ASGI middleware answering 503 with Retry-After beyond ``max_requests`` in flight."""
+
+    def __init__(self, app, max_requests: int, retry_after_seconds: float, exempt: Iterable[str] = ()):
+        self.app = app
+        self.max_requests = max_requests
+        self.retry_after_seconds = retry_after_seconds
+        self.exempt = set(exempt)
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (
+                self.exempt and request_route(scope) in self.exempt):
+            await self.app(scope, receive, send)
+            return
+
+        # Requests run on a single event loop, so the counter needs no lock
+        if self.in_flight >= self.max_requests:
+            self.rejected += 1
+            await _reject(send, 503, "Server is busy, please retry", self.retry_after_seconds)
+            return
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
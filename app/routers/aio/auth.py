@@ -0,0 +1,50 @@
+from fastapi import status, Depends, APIRouter, HTTPException
+from fastapi.security.oauth2 import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import async_crud
+from app.schemes import Token
+from app.hashing import HashingBusyError
+from app.utils import hashing_busy_exception, password_hasher
+from app.database import get_async_db
+from app.oauth2 import create_access_token, user_token_claims
+from app.logging_config import logger
+
+router = APIRouter(prefix="/auth", tags=["authendication"])
+
+
+@router.post("/login", status_code=status.HTTP_201_CREATED, response_model=Token)
+async def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    logger.info("Login request received")
+
+    try:
+        user = await async_crud.get_user_by_email(db, user_credentials.username)
+        if not user:
+            logger.warning("User not found")
+            raise HTTPException(detail="Invalid Credentials", status_code=status.HTTP_403_FORBIDDEN)
+
+        # Password hashing is CPU bound, it runs on the hashing pool
+        valid, new_hash = await password_hasher.verify_and_update_async(user_credentials.password, user.password)
+        if not valid:
+            logger.warning("Invalid password")
+            raise HTTPException(detail="Invalid Credentials", status_code=status.HTTP_403_FORBIDDEN)
+
+        access_token = create_access_token(user_token_claims(user))
+        if new_hash is not None:
+            # Stored with an older scheme or cost, upgrade it while we have the password
+            user.password = new_hash
+            await db.commit()
+        logger.info("Login successful")
+        return {"access_token": access_token, "token_type": "bearer"}
+
+    except HTTPException as http_exc:
+        logger.error("HTTPException: %s", http_exc)
+        raise http_exc
+
+    except HashingBusyError:
+        logger.warning("Password hashing queue full, rejecting login")
+        raise hashing_busy_exception()
+
+    except Exception as e:
+        logger.error("Exception: %s", e)
+        raise HTTPException(detail="Internal Server Error", status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,272 @@
+import io
+from typing import List, Literal, Optional, Union
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app import async_crud
+from app.crud import (
+    BookNotFoundError,
+    BookUnavailableError,
+    LoanNotFoundError,
+    parse_book_ids,
+    serialize_books_batch,
+    unique_book_ids,
+)
+from app.database import SessionLocal, get_async_db
+from app.conditional import cached_json_response
+from app.importer import detect_format, import_books
+from app.pagination import InvalidCursor, decode_cursor
+from app.search import search_books, suggest_titles
+from app.schemes import (
+    BookCreate,
+    Book,
+    BookSearchResult,
+    BookSuggestion,
+    PaginatedBooks,
+    BookBatch,
+    BookUpdate,
+    BatchBorrow,
+    BatchGet,
+    BookImportReport,
+    BorrowedBookRead,
+    CurrentUser,
+)
+from app.utils import verify_admin_privileges_async
+from app.oauth2 import get_current_user_async
+from app.logging_config import logger
+
+
+router = APIRouter(prefix="/books", tags=["books"])
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=Book)
+async def create_book(book: BookCreate, db: AsyncSession = Depends(get_async_db), current_user: CurrentUser = Depends(verify_admin_privileges_async)):
+    """Create a new book."""
+    try:
+        return await async_crud.add_book(db=db, book=book)
+    except Exception as e:
+        logger.error("Error creating book: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to add book")
+
+
+def _import_with_session(stream, import_format: str) -> BookImportReport:
+    db = SessionLocal()
+    try:
+        return import_books(db, stream, import_format)
+    finally:
+        db.close()
+
+
+@router.post("/import", response_model=BookImportReport)
+async def import_books_endpoint(
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "ndjson"]] = Query(default=None, description="Defaults to the upload's file extension"),
+    current_user: CurrentUser = Depends(verify_admin_privileges_async),
+):
+    """Bulk import books from a CSV or NDJSON upload, upserting on title."""
+    import_format = format or detect_format(file.filename)
+    if import_format is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Cannot detect the import format, pass ?format=csv|ndjson")
+    try:
+        # The import uses COPY on the sync driver, run it off the event loop
+        stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+        return await run_in_threadpool(_import_with_session, stream, import_format)
+    except Exception as e:
+        logger.error("Error importing books: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to import books")
+
+
+@router.get("/", response_model=Union[PaginatedBooks, BookBatch])
+async def get_books(
+    request: Request,
+    page: int = Query(default=1, ge=1),
+    page_size: int = Query(default=10, ge=1),
+    after: Optional[str] = Query(default=None, description="Opaque cursor from a previous page's next_cursor"),
+    ids: Optional[str] = Query(default=None, description="Comma-separated book ids to fetch instead of a page"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get paginated list of books, or with ``ids`` the listed books."""
+    if ids is not None:
+        try:
+            book_ids = unique_book_ids(parse_book_ids(ids))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        try:
+            books = await async_crud.get_books_by_ids(db, book_ids)
+            return cached_json_response(request, serialize_books_batch(book_ids, books))
+        except Exception as e:
+            logger.error("Error getting books by id: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to fetch books")
+    try:
+        after_id = decode_cursor(after) if after is not None else None
+        cached = await async_crud.read_books_page(db, page, page_size, after_id)
+        return cached_json_response(request, cached)
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error("Error getting books: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to fetch books")
+
+
+def _search_with_session(q: str, limit: int) -> List[BookSearchResult]:
+    db = SessionLocal()
+    try:
+        return search_books(db, q, limit)
+    finally:
+        db.close()
+
+
+def _suggest_with_session(prefix: str, limit: int) -> List[BookSuggestion]:
+    db = SessionLocal()
+    try:
+        return suggest_titles(db, prefix, limit)
+    finally:
+        db.close()
+
+
+@router.get("/search", response_model=List[BookSearchResult])
+async def search_books_endpoint(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=20, ge=1, le=100),
+):
+    """Search books by title, author and description, best matches first."""
+    try:
+        # Building the in-process index is CPU bound, keep it off the event loop
+        return await run_in_threadpool(_search_with_session, q, limit)
+    except Exception as e:
+        logger.error("Error searching books: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to search books")
+
+
+@router.get("/search/suggest", response_model=List[BookSuggestion])
+async def suggest_books_endpoint(
+    prefix: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=10, ge=1, le=50),
+):
+    """Autocomplete book titles starting with ``prefix``."""
+    try:
+        return await run_in_threadpool(_suggest_with_session, prefix, limit)
+    except Exception as e:
+        logger.error("Error suggesting books: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to suggest books")
+
+
+@router.get("/{book_id}", response_model=Book)
+async def get_book(book_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Get a book by ID."""
+    cached = await async_crud.read_book(db, book_id=book_id)
+    if cached is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+    return cached_json_response(request, cached)
+
+
+@router.put("/{book_id}", response_model=BookUpdate)
+async def update_book_endpoint(
+    book_id: int, book_data: BookUpdate, db: AsyncSession = Depends(get_async_db), current_user: CurrentUser = Depends(verify_admin_privileges_async)
+):
+    """Update a book by ID."""
+    updated_book = await async_crud.update_book(db, book_id=book_id, new_book_data=book_data)
+    if not updated_book:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+    return updated_book
+
+
+@router.delete("/{book_id}")
+async def delete_book_endpoint(
+    book_id: int, db: AsyncSession = Depends(get_async_db), current_user: CurrentUser = Depends(verify_admin_privileges_async)
+):
+    """Delete a book by ID."""
+    if not await async_crud.delete_book(db, book_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+    return {"message": "Book deleted successfully"}
+
+
+@router.post("/get:batch", response_model=BookBatch)
+async def get_books_batch_endpoint(batch: BatchGet, db: AsyncSession = Depends(get_async_db)):
+    """Get books by id like ``GET /books/?ids=``, for id lists too long for a URL."""
+    try:
+        book_ids = unique_book_ids(batch.book_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    try:
+        body = serialize_books_batch(book_ids, await async_crud.get_books_by_ids(db, book_ids)).body
+        return Response(content=body, media_type="application/json")
+    except Exception as e:
+        logger.error("Error getting books by id: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to fetch books")
+
+
+@router.post("/borrow:batch", response_model=List[BorrowedBookRead])
+async def borrow_books_endpoint(
+    batch: BatchBorrow, db: AsyncSession = Depends(get_async_db), current_user: CurrentUser = Depends(get_current_user_async)
+):
+    """Borrow several books in a single transaction, all or nothing."""
+    try:
+        transactions = await async_crud.borrow_books(db, batch.book_ids, current_user.id)
+        return [BorrowedBookRead(book=t.book, borrowed_book=t) for t in transactions]
+    except BookNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error("Error borrowing books: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to borrow books")
+
+
+@router.post("/{book_id}/borrow", response_model=BorrowedBookRead)
+async def borrow_book_endpoint(
+    book_id: int, db: AsyncSession = Depends(get_async_db), current_user: CurrentUser = Depends(get_current_user_async)
+):
+    """Borrow a book."""
+    try:
+        borrowed_book = await async_crud.borrow_book(db, book_id, current_user.id)
+        return BorrowedBookRead(book=borrowed_book.book, borrowed_book=borrowed_book)
+    except BookNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except BookUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error("Error borrowing book: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to borrow book")
+
+
+@router.put("/{book_id}/return", response_model=BorrowedBookRead)
+async def return_book_endpoint(
+    book_id: int, db: AsyncSession = Depends(get_async_db), current_user: CurrentUser = Depends(get_current_user_async)
+):
+    """Return a borrowed book."""
+    try:
+        returned_book = await async_crud.return_book(db, book_id, current_user.id)
+        return BorrowedBookRead(book=returned_book.book, borrowed_book=returned_book)
+    except LoanNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        logger.error("Error returning book: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to return book")
@@ -0,0 +1,121 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, status, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import async_crud, models
+from app.schemes import CreateUser, CurrentUser, UserResponse
+from app.hashing import HashingBusyError
+from app.utils import hashing_busy_exception, password_hasher, verify_admin_privileges_async
+from app.crud import BORROWED_FIELDS, HISTORY_FIELDS, with_next_loan_cursor
+from app.database import AsyncSessionLocal, get_async_db
+from app.export import EXPORT_MEDIA_TYPES, encode_json_rows, stream_rows_async
+from app.pagination import InvalidCursor, decode_cursor
+from app.oauth2 import get_current_user_async
+from app.logging_config import logger
+
+router = APIRouter(prefix="/users", tags=["users"])
+
+
+@router.post("/register", status_code=status.HTTP_201_CREATED, response_model=UserResponse)
+async def create_user(user: CreateUser, db: AsyncSession = Depends(get_async_db)):
+    """Create a new user."""
+    try:
+        new_user = models.Users(**user.model_dump())
+        new_user.password = await password_hasher.hash_async(user.password)
+        db.add(new_user)
+        await db.commit()
+        await db.refresh(new_user)
+        return new_user
+    except HashingBusyError:
+        raise hashing_busy_exception()
+    except Exception as e:
+        logger.error("Error creating user: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create user")
+
+
+@router.get("/book")
+async def get_books_borrowed_by_user_api(
+    active_only: bool = Query(default=False, description="Only the loans not returned yet"),
+    limit: int = Query(default=50, ge=1, le=1000, description="Page size"),
+    after: Optional[str] = Query(default=None, description="Opaque cursor from a previous page's X-Next-Cursor"),
+    current_user: CurrentUser = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get books borrowed by the current user, in loan order.
+
+    Loans are paged on the loan id, ``limit`` at a time; the cursor of the
+    next page is returned in the ``X-Next-Cursor`` header.
+    """
+    try:
+        after_id = decode_cursor(after) if after is not None else None
+        books_borrowed = await async_crud.get_books_borrowed_by_user(
+            db, current_user.id, active_only, after_id, limit + 1)
+        books_borrowed, next_cursor = with_next_loan_cursor(books_borrowed, limit)
+
+        if not books_borrowed:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="No books borrowed by this user")
+
+        response = Response(content=encode_json_rows(books_borrowed, BORROWED_FIELDS), media_type="application/json")
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response
+
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    except HTTPException as http_exception:
+        raise http_exception
+
+    except Exception as e:
+        logger.error("Error getting books borrowed by user: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Failed to fetch borrowed books")
+
+
+async def _stream_history(user_id, book_title, type_, date, export):
+    """Stream the history through its own session, which outlives the request's."""
+    async with AsyncSessionLocal() as db:
+        rows = async_crud.iter_user_book_history(db, user_id, book_title, type_, date)
+        async for chunk in stream_rows_async(rows, export, HISTORY_FIELDS):
+            yield chunk
+
+
+@router.get("/history")
+async def retrieve_user_book_history_api(email: Optional[str] = None,
+                                         book_title: Optional[str] = None,
+                                         type_: Optional[str] = None,
+                                         date: Optional[datetime] = None,
+                                         page: int = Query(default=1, ge=1),
+                                         page_size: int = Query(default=100, ge=1, le=1000),
+                                         export: Optional[Literal["ndjson", "csv"]] = Query(
+                                             default=None, description="Stream every matching row as NDJSON or CSV instead of a page"),
+                                         current_user: CurrentUser = Depends(verify_admin_privileges_async),
+                                         db: AsyncSession = Depends(get_async_db)
+                                         ):
+    """Retrieve user's book borrowing history."""
+    try:
+        user = await async_crud.get_user_by_email(db, email) if email else None
+        if email and not user:
+            return []
+
+        if export:
+            return StreamingResponse(
+                _stream_history(user.id if user else None, book_title, type_, date, export),
+                media_type=EXPORT_MEDIA_TYPES[export],
+                headers={"Content-Disposition": f'attachment; filename="history.{export}"'},
+            )
+
+        books_history = await async_crud.get_user_book_history(
+            db, user.id if user else None, book_title, type_, date,
+            skip=(page - 1) * page_size, limit=page_size)
+        return Response(content=encode_json_rows(books_history, HISTORY_FIELDS), media_type="application/json")
+
+    except Exception as e:
+        logger.error("Error retrieving user book history: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="Failed to fetch user book history")
@@ -1,14 +1,13 @@
-from typing import List  
-
-from fastapi import status, Response, Depends, APIRouter, HTTPException
+from fastapi import status, Depends, APIRouter, HTTPException
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 
 from sqlalchemy.orm import Session  
 from app import models  
-from app.schemes import CreateUser, UserResponse, UserLogin, Token
-from app.utils import verify_password
+from app.schemes import Token
+from app.hashing import HashingBusyError
+from app.utils import hashing_busy_exception, verify_and_update_password
 from app.database import get_db
-from app.oauth2 import create_access_token
+from app.oauth2 import create_access_token, user_token_claims
 from app.logging_config import logger
 
 router = APIRouter(prefix="/auth", tags=["authendication"])
@@ -25,18 +24,27 @@ def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session =
             logger.warning("User not found")  # Log a warning if the user is not found
             raise HTTPException(detail="Invalid Credentials", status_code=status.HTTP_403_FORBIDDEN)
         
-        if not verify_password(user_credentials.password, user.password):
+        valid, new_hash = verify_and_update_password(user_credentials.password, user.password)
+        if not valid:
             logger.warning("Invalid password")  # Log a warning for invalid password
             raise HTTPException(detail="Invalid Credentials", status_code=status.HTTP_403_FORBIDDEN)
 
-        access_token = create_access_token({"user_id": user.id})
+        access_token = create_access_token(user_token_claims(user))
+        if new_hash is not None:
+            # Stored with an older scheme or cost, upgrade it while we have the password
+            user.password = new_hash
+            db.commit()
         logger.info("Login successful")  # Log a success message for successful login
         return {"access_token": access_token, "token_type": "bearer"}
     
     except HTTPException as http_exc:
-        logger.error(f"HTTPException: {http_exc}")  # Log HTTP exceptions
+        logger.error("HTTPException: %s", http_exc)  # Log HTTP exceptions
         raise http_exc
+
+    except HashingBusyError:
+        logger.warning("Password hashing queue full, rejecting login")
+        raise hashing_busy_exception()
     
     except Exception as e:
-        logger.error(f"Exception: {e}")  # Log other unexpected exceptions
+        logger.error("Exception: %s", e)  # Log other unexpected exceptions
         raise HTTPException(detail="Internal Server Error", status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
@@ -1,38 +1,54 @@
-import logging
-from datetime import datetime
-from typing import List
+import io
+from typing import List, Literal, Optional, Union
 
 from fastapi import (
     APIRouter,
     Depends,
+    File,
     HTTPException,
     Query,
+    Request,
+    Response,
+    UploadFile,
     status,
 )
 from sqlalchemy.orm import Session
 
-from app import models
 from app.crud import (
     add_book,
-    get_all_books,
-    get_book_by_id,
+    read_book,
+    read_books_page,
     update_book,
     delete_book,
     borrow_book,
+    borrow_books,
     return_book,
+    get_books_by_ids,
+    parse_book_ids,
+    serialize_books_batch,
+    unique_book_ids,
+    BookNotFoundError,
+    BookUnavailableError,
+    LoanNotFoundError,
 )
 from app.database import get_db
-from app.models import Users
+from app.conditional import cached_json_response
+from app.importer import detect_format, import_books
+from app.pagination import InvalidCursor, decode_cursor
+from app.search import search_books, suggest_titles
 from app.schemes import (
-    CreateUser,
-    UserResponse,
     BookCreate,
     Book,
     PaginatedBooks,
+    BookBatch,
     BookUpdate,
-    BookRead,
+    BookSearchResult,
+    BookSuggestion,
+    BatchBorrow,
+    BatchGet,
+    BookImportReport,
     BorrowedBookRead,
-    BookBarrow,
+    CurrentUser,
 )
 from app.utils import verify_admin_privileges
 from app.oauth2 import get_current_user
@@ -43,103 +59,208 @@ router = APIRouter(prefix="/books", tags=["books"])
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=Book)
-def create_book(book: BookCreate, db: Session = Depends(get_db), current_user: Users = Depends(verify_admin_privileges)):
+def create_book(book: BookCreate, db: Session = Depends(get_db), current_user: CurrentUser = Depends(verify_admin_privileges)):
     """Create a new book."""
     try:
         return add_book(db=db, book=book)
     except Exception as e:
-        logger.error(f"Error creating book: {e}")
+        logger.error("Error creating book: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to add book")
 
 
-@router.get("/", response_model=PaginatedBooks)
+@router.post("/import", response_model=BookImportReport)
+def import_books_endpoint(
+    file: UploadFile = File(...),
+    format: Optional[Literal["csv", "ndjson"]] = Query(default=None, description="Defaults to the upload's file extension"),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(verify_admin_privileges),
+):
+    """Bulk import books from a CSV or NDJSON upload, upserting on title."""
+    import_format = format or detect_format(file.filename)
+    if import_format is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Cannot detect the import format, pass ?format=csv|ndjson")
+    try:
+        stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+        return import_books(db, stream, import_format)
+    except Exception as e:
+        logger.error("Error importing books: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to import books")
+
+
+@router.get("/", response_model=Union[PaginatedBooks, BookBatch])
 def get_books(
+    request: Request,
     page: int = Query(default=1, ge=1),
     page_size: int = Query(default=10, ge=1),
+    after: Optional[str] = Query(default=None, description="Opaque cursor from a previous page's next_cursor"),
+    ids: Optional[str] = Query(default=None, description="Comma-separated book ids to fetch instead of a page"),
     db: Session = Depends(get_db),
 ):
-    """Get paginated list of books."""
+    """Get paginated list of books.
+
+    Without ``after`` the page/page_size offset mode is used. Passing the
+    ``next_cursor`` of a previous response switches to keyset pagination on
+    ``Books.id``, whose cost does not grow with page depth.
+
+    With ``ids`` the listed books are returned instead, in the given order,
+    from a single query; ids that do not exist are listed in ``missing``.
+    """
+    if ids is not None:
+        try:
+            book_ids = unique_book_ids(parse_book_ids(ids))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        try:
+            return cached_json_response(request, serialize_books_batch(book_ids, get_books_by_ids(db, book_ids)))
+        except Exception as e:
+            logger.error("Error getting books by id: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to fetch books")
     try:
-        books = get_all_books(db, skip=(page - 1) * page_size, limit=page_size)
-        total_books = db.query(models.Books).count()
-        return {"total": total_books, "items": books}
+        after_id = decode_cursor(after) if after is not None else None
+        cached = read_books_page(db, page, page_size, after_id)
+        return cached_json_response(request, cached)
+    except InvalidCursor as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
-        logger.error(f"Error getting books: {e}")
+        logger.error("Error getting books: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to fetch books")
 
 
+@router.get("/search", response_model=List[BookSearchResult])
+def search_books_endpoint(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=20, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    """Search books by title, author and description, best matches first.
+
+    Misspelled words still match through trigram similarity.
+    """
+    try:
+        return search_books(db, q, limit)
+    except Exception as e:
+        logger.error("Error searching books: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to search books")
+
+
+@router.get("/search/suggest", response_model=List[BookSuggestion])
+def suggest_books_endpoint(
+    prefix: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=10, ge=1, le=50),
+    db: Session = Depends(get_db),
+):
+    """Autocomplete book titles starting with ``prefix``."""
+    try:
+        return suggest_titles(db, prefix, limit)
+    except Exception as e:
+        logger.error("Error suggesting books: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to suggest books")
+
+
 @router.get("/{book_id}", response_model=Book)
-def get_book(book_id: int, db: Session = Depends(get_db)):
+def get_book(book_id: int, request: Request, db: Session = Depends(get_db)):
     """Get a book by ID."""
-    book = get_book_by_id(db, book_id=book_id)
-    if book is None:
+    cached = read_book(db, book_id=book_id)
+    if cached is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
-    return book
+    return cached_json_response(request, cached)
 
 
 @router.put("/{book_id}", response_model=BookUpdate)
 def update_book_endpoint(
-    book_id: int, book_data: BookUpdate, db: Session = Depends(get_db), current_user: Users = Depends(verify_admin_privileges)
+    book_id: int, book_data: BookUpdate, db: Session = Depends(get_db), current_user: CurrentUser = Depends(verify_admin_privileges)
 ):
     """Update a book by ID."""
-    book = get_book_by_id(db, book_id)
-    if not book:
+    updated_book = update_book(db, book_id=book_id, new_book_data=book_data)
+    if not updated_book:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
-    updated_book = update_book(db, book=book, new_book_data=book_data)
     return updated_book
 
 
 @router.delete("/{book_id}")
 def delete_book_endpoint(
-    book_id: int, db: Session = Depends(get_db), current_user: Users = Depends(verify_admin_privileges)
+    book_id: int, db: Session = Depends(get_db), current_user: CurrentUser = Depends(verify_admin_privileges)
 ):
     """Delete a book by ID."""
-    book = get_book_by_id(db, book_id)
-    if not book:
+    if not delete_book(db, book_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
-    delete_book(db, book)
     return {"message": "Book deleted successfully"}
 
 
+@router.post("/get:batch", response_model=BookBatch)
+def get_books_batch_endpoint(batch: BatchGet, db: Session = Depends(get_db)):
+    """Get books by id like ``GET /books/?ids=``, for id lists too long for a URL."""
+    try:
+        book_ids = unique_book_ids(batch.book_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    try:
+        body = serialize_books_batch(book_ids, get_books_by_ids(db, book_ids)).body
+        return Response(content=body, media_type="application/json")
+    except Exception as e:
+        logger.error("Error getting books by id: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to fetch books")
+
+
+@router.post("/borrow:batch", response_model=List[BorrowedBookRead])
+def borrow_books_endpoint(
+    batch: BatchBorrow, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)
+):
+    """Borrow several books in a single transaction, all or nothing."""
+    try:
+        transactions = borrow_books(db, batch.book_ids, current_user.id)
+        return [BorrowedBookRead(book=t.book, borrowed_book=t) for t in transactions]
+    except BookNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error("Error borrowing books: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to borrow books")
+
+
 @router.post("/{book_id}/borrow", response_model=BorrowedBookRead)
 def borrow_book_endpoint(
-    book_id: int, db: Session = Depends(get_db), current_user: Users = Depends(get_current_user)
+    book_id: int, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)
 ):
     """Borrow a book."""
     try:
-        book = get_book_by_id(db, book_id)
-        if not book:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
-        if book.count <= 0:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                detail="Book is not available for borrowing")
         borrowed_book = borrow_book(db, book_id, current_user.id)
-        return BorrowedBookRead(book=book, borrowed_book=borrowed_book)
+        return BorrowedBookRead(book=borrowed_book.book, borrowed_book=borrowed_book)
+    except BookNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except BookUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
-        logger.error(f"Error borrowing book: {e}")
+        logger.error("Error borrowing book: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to borrow book")
 
 
 @router.put("/{book_id}/return", response_model=BorrowedBookRead)
 def return_book_endpoint(
-    book_id: int, db: Session = Depends(get_db), current_user: Users = Depends(get_current_user)
+    book_id: int, db: Session = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)
 ):
     """Return a borrowed book."""
     try:
-        book = get_book_by_id(db, book_id)
-        if not book:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
-        returned_book = return_book(db, book.id)
-        return BorrowedBookRead(book=book, borrowed_book=returned_book)
+        returned_book = return_book(db, book_id, current_user.id)
+        return BorrowedBookRead(book=returned_book.book, borrowed_book=returned_book)
+    except LoanNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     except Exception as e:
-        logger.error(f"Error returning book: {e}")
+        logger.error("Error returning book: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to return book")
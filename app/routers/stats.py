@@ -0,0 +1,96 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from app import analytics
+from app.database import get_db
+from app.oauth2 import get_current_user
+from app.schemes import BookCirculation, CurrentUser, DailyCirculation, UserCirculation
+from app.utils import verify_admin_privileges
+from app.logging_config import logger
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+
+@router.get("/books/top", response_model=List[BookCirculation])
+def get_top_books(
+    days: Optional[int] = Query(default=None, ge=1, le=366, description="Only count the last days; all time when omitted"),
+    limit: int = Query(default=10, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    """Get the most borrowed books."""
+    try:
+        return analytics.top_books(db, days, limit)
+    except Exception as e:
+        logger.error("Error getting top books: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to fetch book statistics")
+
+
+@router.get("/books/{book_id}", response_model=BookCirculation)
+def get_book_stats(book_id: int, db: Session = Depends(get_db)):
+    """Get the all-time borrows, returns and open loans of a book."""
+    try:
+        stats = analytics.book_stats(db, book_id)
+    except Exception as e:
+        logger.error("Error getting book statistics: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to fetch book statistics")
+    if stats is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+    return stats
+
+
+@router.get("/users/top", response_model=List[UserCirculation])
+def get_top_users(
+    limit: int = Query(default=10, ge=1, le=100),
+    current_user: CurrentUser = Depends(verify_admin_privileges),
+    db: Session = Depends(get_db),
+):
+    """Get the users with the most open loans."""
+    try:
+        return analytics.top_users(db, limit)
+    except Exception as e:
+        logger.error("Error getting top users: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to fetch user statistics")
+
+
+@router.get("/users/me", response_model=UserCirculation)
+def get_my_stats(current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Get the all-time borrows, returns and open loans of the current user."""
+    return get_user_stats(current_user.id, current_user, db)
+
+
+@router.get("/users/{user_id}", response_model=UserCirculation)
+def get_user_stats(
+    user_id: int,
+    current_user: CurrentUser = Depends(verify_admin_privileges),
+    db: Session = Depends(get_db),
+):
+    """Get the all-time borrows, returns and open loans of a user."""
+    try:
+        stats = analytics.user_stats(db, user_id)
+    except Exception as e:
+        logger.error("Error getting user statistics: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to fetch user statistics")
+    if stats is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return stats
+
+
+@router.get("/daily", response_model=List[DailyCirculation])
+def get_daily_circulation(
+    days: int = Query(default=30, ge=1, le=366),
+    current_user: CurrentUser = Depends(verify_admin_privileges),
+    db: Session = Depends(get_db),
+):
+    """Get the library-wide borrows and returns of each of the last days."""
+    try:
+        return analytics.daily_circulation(db, days)
+    except Exception as e:
+        logger.error("Error getting daily circulation: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to fetch daily statistics")
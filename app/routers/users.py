@@ -1,18 +1,25 @@
-import logging
 from datetime import datetime
-from typing import List, Optional
+from typing import Literal, Optional
 
-from fastapi import APIRouter, status, Depends, HTTPException
+from fastapi import APIRouter, status, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 
 from app import models
-from app.schemes import CreateUser, UserResponse, BookBarrow, BookRead, UserBookRead
-from app.utils import hash_password, verify_admin_privileges
-from app.database import get_db
+from app.schemes import CreateUser, CurrentUser, UserResponse
+from app.hashing import HashingBusyError
+from app.utils import hash_password, hashing_busy_exception, verify_admin_privileges
+from app.database import SessionLocal, get_db
+from app.export import EXPORT_MEDIA_TYPES, encode_json_rows, stream_rows
+from app.pagination import InvalidCursor, decode_cursor
 from app.oauth2 import get_current_user
 from app.crud import (
+    BORROWED_FIELDS,
+    HISTORY_FIELDS,
     get_books_borrowed_by_user,
     get_user_by_email,
     get_user_book_history,
+    iter_user_book_history,
+    with_next_loan_cursor,
 )
 from sqlalchemy.orm import Session
 from app.logging_config import logger
@@ -30,81 +37,99 @@ def create_user(user: CreateUser, db: Session = Depends(get_db)):
         db.commit()
         db.refresh(new_user)
         return new_user
+    except HashingBusyError:
+        raise hashing_busy_exception()
     except Exception as e:
-        logger.error(f"Error creating user: {e}")
+        logger.error("Error creating user: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create user")
 
 
 @router.get("/book")
 def get_books_borrowed_by_user_api(
-    current_user: models.Users = Depends(get_current_user),
+    active_only: bool = Query(default=False, description="Only the loans not returned yet"),
+    limit: int = Query(default=50, ge=1, le=1000, description="Page size"),
+    after: Optional[str] = Query(default=None, description="Opaque cursor from a previous page's X-Next-Cursor"),
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get books borrowed by the current user."""
+    """Get books borrowed by the current user, in loan order.
+
+    Loans are paged on the loan id, ``limit`` at a time; the cursor of the
+    next page is returned in the ``X-Next-Cursor`` header.
+    """
     try:
-        books_borrowed = get_books_borrowed_by_user(db, current_user.id)
+        after_id = decode_cursor(after) if after is not None else None
+        books_borrowed = get_books_borrowed_by_user(
+            db, current_user.id, active_only, after_id, limit + 1)
+        books_borrowed, next_cursor = with_next_loan_cursor(books_borrowed, limit)
 
         if not books_borrowed:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="No books borrowed by this user")
 
-        borrowed_books = []
-        for book, transaction in books_borrowed:
-            borrowed_books.append({
-                "id": book.id,
-                "title": book.title,
-                "description": book.description,
-                "author": book.author,
-                "count": book.count,
-                "borrowed_by": current_user.name,
-                "borrowed": transaction.borrowed,
-                "returned": transaction.returned,
-                "borrowed_at": transaction.borrowed_at,
-                "returned_at": transaction.returned_at
-            })
-
-        return borrowed_books
+        response = Response(content=encode_json_rows(books_borrowed, BORROWED_FIELDS), media_type="application/json")
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response
+
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
     except HTTPException as http_exception:
         raise http_exception
 
     except Exception as e:
-        logger.error(f"Error getting books borrowed by user: {e}")
+        logger.error("Error getting books borrowed by user: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="Failed to fetch borrowed books")
 
 
+def _stream_history(user_id, book_title, type_, date, export):
+    """Stream the history through its own session, which outlives the request's."""
+    db = SessionLocal()
+    try:
+        rows = iter_user_book_history(db, user_id, book_title, type_, date)
+        yield from stream_rows(rows, export, HISTORY_FIELDS)
+    finally:
+        db.close()
+
+
 @router.get("/history")
 def retrieve_user_book_history_api(email: Optional[str] = None,
                                    book_title: Optional[str] = None,
                                    type_: Optional[str] = None,
-                                   date: Optional[datetime] = None, current_user: models.Users = Depends(verify_admin_privileges),
+                                   date: Optional[datetime] = None,
+                                   page: int = Query(default=1, ge=1),
+                                   page_size: int = Query(default=100, ge=1, le=1000),
+                                   export: Optional[Literal["ndjson", "csv"]] = Query(
+                                       default=None, description="Stream every matching row as NDJSON or CSV instead of a page"),
+                                   current_user: CurrentUser = Depends(verify_admin_privileges),
                                    db: Session = Depends(get_db)
                                    ):
-    """Retrieve user's book borrowing history."""
+    """Retrieve user's book borrowing history.
+
+    Returns one page of results, or with ``export`` streams the full result
+    from a server-side cursor so memory use does not grow with its size.
+    """
     try:
         user = get_user_by_email(db, email) if email else None
+        if email and not user:
+            return []
+
+        if export:
+            return StreamingResponse(
+                _stream_history(user.id if user else None, book_title, type_, date, export),
+                media_type=EXPORT_MEDIA_TYPES[export],
+                headers={"Content-Disposition": f'attachment; filename="history.{export}"'},
+            )
 
         books_history = get_user_book_history(
-            db, user.id if user else None, book_title, type_, date)
-        borrowed_books = []
-        for book, transaction in books_history:
-            borrowed_books.append({
-                "id": book.id,
-                "title": book.title,
-                "description": book.description,
-                "author": book.author,
-                "count": book.count,
-                "borrowed_by": transaction.borrowed_by,
-                "borrowed": transaction.borrowed,
-                "returned": transaction.returned,
-                "borrowed_at": transaction.borrowed_at,
-                "returned_at": transaction.returned_at
-            })
-        return borrowed_books
+            db, user.id if user else None, book_title, type_, date,
+            skip=(page - 1) * page_size, limit=page_size)
+        return Response(content=encode_json_rows(books_history, HISTORY_FIELDS), media_type="application/json")
 
     except Exception as e:
-        logger.error(f"Error retrieving user book history: {e}")
+        logger.error("Error retrieving user book history: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="Failed to fetch user book history")
@@ -1,7 +1,7 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 class CreateUser(BaseModel):
     """Model for creating a new user."""
@@ -34,6 +34,20 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     """Model for token data."""
     id: Optional[int] = None
+    name: Optional[str] = None
+    role: Optional[str] = None
+    is_active: Optional[bool] = None
+
+class CurrentUser(BaseModel):
+    """Model for the authenticated user principal."""
+    id: int
+    name: str
+    role: str
+    is_active: bool = True
+
+    class Config:
+        """Configuration for CurrentUser."""
+        from_attributes = True
 
 class BookBase(BaseModel):
     """Base model for books."""
@@ -50,10 +64,25 @@ class Book(BookBase):
     """Model for book details."""
     id: int
 
+class BookSearchResult(Book):
+    """Model for a ranked search hit."""
+    score: float
+
+class BookSuggestion(BaseModel):
+    """Model for a title autocomplete suggestion."""
+    id: int
+    title: str
+
 class PaginatedBooks(BaseModel):
     """Model for paginated books."""
     total: int
     items: List[Book]
+    next_cursor: Optional[str] = None
+
+class BookBatch(BaseModel):
+    """Model for books fetched by id, in request order, and the ids not found."""
+    items: List[Book]
+    missing: List[int] = []
 
 class BookUpdate(BaseModel):
     """Model for updating a book."""
@@ -62,6 +91,17 @@ class BookUpdate(BaseModel):
     author: str
     count: int
 
+class BookImportError(BaseModel):
+    """Model for a row rejected by a bulk import."""
+    row: int
+    error: str
+
+class BookImportReport(BaseModel):
+    """Model for the outcome of a bulk import."""
+    imported: int = 0
+    failed: int = 0
+    errors: List[BookImportError] = Field(default_factory=list)
+
 class BookDelete(BaseModel):
     """Model for deleting a book."""
     pass
@@ -87,6 +127,8 @@ class BookBarrow(BaseModel):
     returned: bool
     borrowed_at: Optional[datetime]
     returned_at: Optional[datetime]
+    due_at: Optional[datetime] = None
+    fine_cents: int = 0
 
     class Config:
         """Configuration for BookBarrow."""
@@ -97,6 +139,14 @@ class BorrowedBookRead(BaseModel):
     book: BookRead
     borrowed_book: BookBarrow
 
+class BatchBorrow(BaseModel):
+    """Model for borrowing several books at once."""
+    book_ids: List[int] = Field(min_length=1, max_length=100)
+
+class BatchGet(BaseModel):
+    """Model for fetching several books by id at once."""
+    book_ids: List[int] = Field(min_length=1)
+
 class UserBookRead(BaseModel):
     """Model for reading user book details."""
     id: int
@@ -112,4 +162,26 @@ class UserBookRead(BaseModel):
 
     class Config:
         """Configuration for UserBookRead."""
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class CirculationTotals(BaseModel):
+    """Model for borrow and return counts."""
+    borrows: int
+    returns: int
+    active_loans: int
+
+class BookCirculation(CirculationTotals):
+    """Model for the circulation of a book; the title is None once it is deleted."""
+    book_id: int
+    title: Optional[str]
+
+class UserCirculation(CirculationTotals):
+    """Model for the circulation of a user; the name is None once they are deleted."""
+    user_id: int
+    name: Optional[str]
+
+class DailyCirculation(BaseModel):
+    """Model for the library-wide borrows and returns of a day."""
+    day: date
+    borrows: int
+    returns: int
@@ -0,0 +1,316 @@
+"""Ranked full-text, fuzzy and prefix search over the book catalogue.
+
+On PostgreSQL the ``books.search_vector`` tsvector column, its GIN index and
+the pg_trgm indexes added by migration 0002 answer queries in the database.
+Other databases, or a PostgreSQL schema without that migration, use an
+in-process inverted index that follows writes to the catalogue.
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import app_settings
+from app.schemes import BookSearchResult, BookSuggestion
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it of on or the to with".split())
+
+# Relative weight of a match in each field, mirroring setweight A/B/C in SQL
+FIELD_WEIGHTS = (("title", 3.0), ("author", 2.0), ("description", 1.0))
+
+# Minimum trigram similarity for a typo to count as a match
+SIMILARITY_THRESHOLD = 0.3
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    return [token for token in TOKEN_RE.findall((value or "").lower()) if token not in STOPWORDS]
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class InvertedIndex:
+    """In-memory search index over titles, authors and descriptions.
+
+    Only ids and text are indexed; callers load the current rows by id, so
+    changes to ``count`` do not touch the index. Books can be added and
+    removed individually, which keeps writes from forcing a full rebuild.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.term_trigrams: Dict[str, Set[str]] = {}
+        self.trigram_terms: Dict[str, Set[str]] = defaultdict(set)
+        self.terms_by_book: Dict[int, List[str]] = {}
+        self.titles: List[Tuple[str, int, str]] = []
+        self.title_by_book: Dict[int, Tuple[str, int, str]] = {}
+
+    @classmethod
+    def build(cls, rows) -> "InvertedIndex":
+        index = cls()
+        for row in rows:
+            index._index_text(row)
+            entry = (row.title.lower(), row.id, row.title)
+            index.titles.append(entry)
+            index.title_by_book[row.id] = entry
+        index.titles.sort()
+        return index
+
+    def _index_text(self, row) -> None:
+        weights: Dict[str, float] = {}
+        for field, weight in FIELD_WEIGHTS:
+            for token in tokenize(getattr(row, field)):
+                weights[token] = weights.get(token, 0.0) + weight
+        for term, weight in weights.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                grams = self.term_trigrams[term] = trigrams(term)
+                for gram in grams:
+                    self.trigram_terms[gram].add(term)
+            postings[row.id] = weight
+        self.terms_by_book[row.id] = list(weights)
+
+    def add(self, row) -> None:
+        """Indexes ``row``, replacing any previous version of the same book."""
+        self.remove(row.id)
+        self._index_text(row)
+        entry = (row.title.lower(), row.id, row.title)
+        bisect.insort(self.titles, entry)
+        self.title_by_book[row.id] = entry
+
+    def remove(self, book_id: int) -> None:
+        """Drops ``book_id`` from the index if present."""
+        for term in self.terms_by_book.pop(book_id, ()):
+            postings = self.postings[term]
+            postings.pop(book_id, None)
+            if not postings:
+                del self.postings[term]
+                for gram in self.term_trigrams.pop(term):
+                    self.trigram_terms[gram].discard(term)
+        entry = self.title_by_book.pop(book_id, None)
+        if entry is not None:
+            position = bisect.bisect_left(self.titles, entry)
+            del self.titles[position]
+
+    def _expand(self, token: str) -> List[Tuple[str, float]]:
+        """Returns the indexed terms matching ``token``, exactly or by trigram similarity."""
+        if token in self.postings:
+            return [(token, 1.0)]
+        grams = trigrams(token)
+        shared: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for term in self.trigram_terms.get(gram, ()):
+                shared[term] += 1
+        matches = []
+        for term, common in shared.items():
+            score = common / (len(grams) + len(self.term_trigrams[term]) - common)
+            if score >= SIMILARITY_THRESHOLD:
+                matches.append((term, score))
+        return matches
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        """Returns ``(book_id, score)`` pairs ranked by weighted TF-IDF."""
+        documents = len(self.terms_by_book)
+        scores: Dict[int, float] = defaultdict(float)
+        for token in tokenize(query):
+            for term, closeness in self._expand(token):
+                postings = self.postings[term]
+                idf = math.log(1 + documents / len(postings))
+                for book_id, weight in postings.items():
+                    scores[book_id] += weight * idf * closeness
+        return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def suggest(self, prefix: str, limit: int) -> List[Tuple[int, str]]:
+        """Returns ``(book_id, title)`` pairs whose title starts with ``prefix``."""
+        prefix = prefix.lower()
+        position = bisect.bisect_left(self.titles, (prefix,))
+        results = []
+        while position < len(self.titles) and len(results) < limit:
+            lowered, book_id, title = self.titles[position]
+            if not lowered.startswith(prefix):
+                break
+            results.append((book_id, title))
+            position += 1
+        return results
+
+
+BOOK_TEXT_COLUMNS = (models.Books.id, models.Books.title, models.Books.author, models.Books.description)
+
+
+class LocalSearchIndex:
+    """Process-wide ``InvertedIndex`` kept in step with the books table.
+
+    Books committed through the ORM in this process are re-indexed on the
+    next query. A full rebuild happens on first use, after bulk writes that
+    bypass the ORM, and every ``ttl_seconds`` to pick up writes of other
+    processes. Queries keep using the previous index while it is rebuilt.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._index: Optional[InvertedIndex] = None
+        self._built_at = 0.0
+        self._stale = True
+        self._changed: Set[int] = set()
+        self._changed_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def mark_stale(self) -> None:
+        """Schedules a full rebuild."""
+        self._stale = True
+
+    def mark_changed(self, book_ids) -> None:
+        """Schedules ``book_ids`` to be re-indexed."""
+        with self._changed_lock:
+            self._changed.update(book_ids)
+
+    def _needs_rebuild(self) -> bool:
+        return self._index is None or self._stale or time.monotonic() - self._built_at >= self.ttl_seconds
+
+    def _rebuild(self, db: Session) -> None:
+        self._stale = False
+        index = InvertedIndex.build(db.execute(select(*BOOK_TEXT_COLUMNS)).yield_per(5000))
+        with self._index_lock:
+            self._index = index
+            self._built_at = time.monotonic()
+
+    def _apply_changes(self, db: Session) -> None:
+        with self._changed_lock:
+            changed, self._changed = self._changed, set()
+        if not changed:
+            return
+        rows = {row.id: row for row in db.execute(
+            select(*BOOK_TEXT_COLUMNS).where(models.Books.id.in_(changed)))}
+        for book_id in changed:
+            if book_id in rows:
+                self._index.add(rows[book_id])
+            else:
+                self._index.remove(book_id)
+
+    def _ensure_built(self, db: Session) -> None:
+        if not self._needs_rebuild():
+            return
+        # Only one caller rebuilds; the others keep answering from the
+        # previous index and wait only when there is none yet
+        if self._build_lock.acquire(blocking=self._index is None):
+            try:
+                if self._needs_rebuild():
+                    self._rebuild(db)
+            finally:
+                self._build_lock.release()
+
+    def search(self, db: Session, query: str, limit: int) -> List[Tuple[int, float]]:
+        self._ensure_built(db)
+        with self._index_lock:
+            self._apply_changes(db)
+            return self._index.search(query, limit)
+
+    def suggest(self, db: Session, prefix: str, limit: int) -> List[Tuple[int, str]]:
+        self._ensure_built(db)
+        with self._index_lock:
+            self._apply_changes(db)
+            return self._index.suggest(prefix, limit)
+
+
+local_index = LocalSearchIndex(app_settings.SEARCH_INDEX_TTL_SECONDS)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_books(session, flush_context) -> None:
+    changed = {instance.id for instance in (*session.new, *session.dirty, *session.deleted)
+               if isinstance(instance, models.Books)}
+    if changed:
+        session.info.setdefault("search_changed_books", set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _reindex_committed_books(session) -> None:
+    changed = session.info.pop("search_changed_books", None)
+    if changed:
+        local_index.mark_changed(changed)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_books(session) -> None:
+    session.info.pop("search_changed_books", None)
+
+
+_database_search: Dict[str, bool] = {}
+
+
+def uses_database_search(db: Session) -> bool:
+    """Returns True when the PostgreSQL search column and indexes are available."""
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return False
+    key = str(bind.url)
+    if key not in _database_search:
+        columns = {column["name"] for column in inspect(bind).get_columns("books")}
+        _database_search[key] = "search_vector" in columns
+    return _database_search[key]
+
+
+PG_SEARCH_SQL = text("""
+    SELECT b.id,
+           ts_rank_cd(b.search_vector, q.query) + greatest(similarity(b.title, :q), similarity(b.author, :q)) AS score
+    FROM books AS b, websearch_to_tsquery('english', :q) AS q(query)
+    WHERE b.search_vector @@ q.query OR b.title % :q OR b.author % :q
+    ORDER BY score DESC, b.id
+    LIMIT :limit
+""")
+
+PG_SUGGEST_SQL = text("""
+    SELECT id, title FROM books
+    WHERE lower(title) LIKE :pattern
+    ORDER BY lower(title) COLLATE "C"
+    LIMIT :limit
+""")
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _book_fields(book: models.Books) -> dict:
+    return {"id": book.id, "title": book.title, "description": book.description,
+            "author": book.author, "count": book.count}
+
+
+def search_books(db: Session, query: str, limit: int = 20) -> List[BookSearchResult]:
+    """Returns the books best matching ``query`` with their relevance score."""
+    if uses_database_search(db):
+        ranked = [(row.id, float(row.score)) for row in db.execute(PG_SEARCH_SQL, {"q": query, "limit": limit})]
+    else:
+        ranked = local_index.search(db, query, limit)
+    if not ranked:
+        return []
+    books = {book.id: book for book in db.scalars(
+        select(models.Books).where(models.Books.id.in_([book_id for book_id, _ in ranked])))}
+    return [
+        BookSearchResult(**_book_fields(books[book_id]), score=score)
+        for book_id, score in ranked if book_id in books
+    ]
+
+
+def suggest_titles(db: Session, prefix: str, limit: int = 10) -> List[BookSuggestion]:
+    """Returns the books whose title starts with ``prefix``, in title order."""
+    if uses_database_search(db):
+        pattern = _escape_like(prefix.lower()) + "%"
+        matches = [(row.id, row.title) for row in db.execute(PG_SUGGEST_SQL, {"pattern": pattern, "limit": limit})]
+    else:
+        matches = local_index.suggest(db, prefix, limit)
+    return [BookSuggestion(id=book_id, title=title) for book_id, title in matches]
@@ -0,0 +1,206 @@
+"""Production server: pre-forked uvicorn workers on uvloop and httptools.
+
+The parent process imports the app once, binds the listening socket and
+forks ``SERVER_WORKERS`` workers (one per CPU by default) that share it, so
+the workers start without importing anything and the kernel spreads the
+connections among them. A worker that exits is replaced, e.g. after
+``SERVER_MAX_REQUESTS`` requests. SIGTERM or SIGINT stop every worker
+gracefully.
+
+Every worker has its own connection pools. With ``DB_MAX_CONNECTIONS`` set,
+the pool size and overflow of each worker are cut down so that all workers
+together never open more connections than that budget. The password-hash
+pools are split the same way: unless ``PASSWORD_HASH_WORKERS`` is set, each
+worker gets its share of the CPUs, so the workers together run at most one
+hash process per CPU.
+
+    python -m app.server --workers 4 --port 8000
+
+Metrics, caches and in-memory rate limits are per worker. A write only
+invalidates the memory book cache of its own worker; the others may serve
+the previous version for up to ``BOOK_CACHE_MEMORY_TTL_SECONDS``, or not at
+all with ``BOOK_CACHE_BACKEND=redis``.
+"""
+import argparse
+import os
+import signal
+import sys
+import time
+from typing import Dict, Tuple
+
+from app.config import app_settings
+from app.logging_config import configure_logging, logger, stop_logging
+
+# A worker exiting sooner than this after its start is restarted with a delay
+# so that a crashing worker does not fork in a loop
+MIN_WORKER_UPTIME_SECONDS = 1.0
+
+
+def cpu_count() -> int:
+    """Returns the number of CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def worker_count() -> int:
+    """Returns SERVER_WORKERS, or the number of CPUs this process may run on."""
+    return app_settings.SERVER_WORKERS or cpu_count()
+
+
+def pool_limits(max_connections: int, workers: int, pools_per_worker: int,
+                pool_size: int, max_overflow: int) -> Tuple[int, int]:
+    """Returns the pool size and overflow keeping every pool of every worker within ``max_connections``."""
+    share = max_connections // (workers * pools_per_worker)
+    if share < 1:
+        raise ValueError(f"DB_MAX_CONNECTIONS={max_connections} cannot give {workers} workers "
+                         f"{pools_per_worker} pooled connection(s) each")
+    pool_size = min(pool_size, share)
+    return pool_size, min(max_overflow, share - pool_size)
+
+
+def size_pools(workers: int) -> None:
+    """Applies the per-worker share of DB_MAX_CONNECTIONS and of the CPUs to the pool settings.
+
+    Must run before ``app.database`` and ``app.utils`` are imported, which
+    build the engines and the password hasher.
+    """
+    if app_settings.PASSWORD_HASH_WORKERS is None:
+        app_settings.PASSWORD_HASH_WORKERS = max(1, cpu_count() // workers)
+        logger.info("Password hash pools sized to %s worker(s) per server worker.",
+                    app_settings.PASSWORD_HASH_WORKERS)
+    if app_settings.DB_MAX_CONNECTIONS is None:
+        return
+    # The sync engine still exists in async mode, for startup and the
+    # in-process scheduler
+    pools_per_worker = 2 if app_settings.DB_MODE == "async" else 1
+    pool_size, max_overflow = pool_limits(app_settings.DB_MAX_CONNECTIONS, workers, pools_per_worker,
+                                          app_settings.DB_POOL_SIZE, app_settings.DB_MAX_OVERFLOW)
+    app_settings.DB_POOL_SIZE = pool_size
+    app_settings.DB_MAX_OVERFLOW = max_overflow
+    logger.info("Database pools sized to %s + %s overflow connections per worker.", pool_size, max_overflow)
+
+
+def build_config(app, host: str, port: int):
+    """Returns the uvicorn configuration of the workers."""
+    import uvicorn
+
+    return uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        lifespan="on",
+        backlog=app_settings.SERVER_BACKLOG,
+        timeout_keep_alive=app_settings.SERVER_KEEPALIVE_SECONDS,
+        timeout_graceful_shutdown=app_settings.SERVER_GRACEFUL_SHUTDOWN_SECONDS,
+        limit_max_requests=app_settings.SERVER_MAX_REQUESTS,
+        access_log=app_settings.SERVER_ACCESS_LOG,
+        forwarded_allow_ips=app_settings.SERVER_FORWARDED_ALLOW_IPS,
+        server_header=False,
+        # Keep the app's logging pipeline; uvicorn's default config would
+        # replace the handlers of the "uvicorn" logger it shares
+        log_config=None,
+    )
+
+
+def run_worker(config, sock) -> None:
+    """Serves ``sock`` in this process until the server stops."""
+    import uvicorn
+
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def fork_worker(config, sock) -> int:
+    """Forks a worker serving ``sock`` and returns its pid in the parent."""
+    # The log writer thread would not survive the fork; stop it around it
+    stop_logging()
+    pid = os.fork()
+    configure_logging(app_settings)
+    if pid:
+        return pid
+
+    from app.database import reset_pools_after_fork
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)
+    reset_pools_after_fork()
+    code = 0
+    try:
+        run_worker(config, sock)
+    except BaseException as e:
+        logger.error("Worker %s failed: %s", os.getpid(), e)
+        code = 1
+    finally:
+        stop_logging()
+        os._exit(code)
+
+
+def supervise(config, sock, workers: int) -> int:
+    """Keeps ``workers`` workers running until SIGTERM or SIGINT."""
+    stopping = False
+    started: Dict[int, float] = {}
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in started:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        started[fork_worker(config, sock)] = time.monotonic()
+    logger.info("Serving on %s:%s with %s workers.", config.host, config.port, workers)
+
+    while started:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        uptime = time.monotonic() - started.pop(pid, 0)
+        if stopping:
+            continue
+        logger.warning("Worker %s exited with status %s, starting a new one.", pid, os.waitstatus_to_exitcode(status))
+        if uptime < MIN_WORKER_UPTIME_SECONDS:
+            time.sleep(MIN_WORKER_UPTIME_SECONDS)
+        started[fork_worker(config, sock)] = time.monotonic()
+    logger.info("Server stopped.")
+    return 0
+
+
+def serve(host: str, port: int, workers: int) -> int:
+    size_pools(workers)
+
+    # Import the app before forking so workers share the loaded modules
+    from main import app
+
+    config = build_config(app, host, port)
+    sock = config.bind_socket()
+    if workers == 1:
+        run_worker(config, sock)
+        return 0
+    return supervise(config, sock, workers)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.server", description="Run the production server.")
+    parser.add_argument("--host", default=app_settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=app_settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="Defaults to SERVER_WORKERS or the CPU count")
+    args = parser.parse_args(argv)
+
+    if args.workers:
+        app_settings.SERVER_WORKERS = args.workers
+    return serve(args.host, args.port, worker_count())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
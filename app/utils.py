@@ -1,32 +1,64 @@
-import logging
-from passlib.context import CryptContext
+from typing import Optional, Tuple
+
 from fastapi import status, Depends, HTTPException
 
-from app.oauth2 import get_current_user
-from app.models import Users
+from app.config import app_settings
+from app.hashing import PasswordHasher
+from app.oauth2 import get_current_user, get_current_user_async
+from app.schemes import CurrentUser
 from app.logging_config import logger
 
-pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
+password_hasher = PasswordHasher(
+    schemes=app_settings.PASSWORD_SCHEMES,
+    rounds=app_settings.PASSWORD_ROUNDS,
+    executor=app_settings.PASSWORD_HASH_EXECUTOR,
+    workers=app_settings.PASSWORD_HASH_WORKERS,
+    max_pending=app_settings.PASSWORD_HASH_MAX_PENDING,
+)
 
 
 def hash_password(password: str) -> str:
     """Hashes a password."""
-    return pwd_context.hash(password)
+    return password_hasher.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifies a plain password against a hashed password."""
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.verify_and_update(plain_password, hashed_password)[0]
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verifies a password and returns its new hash if the stored one is outdated."""
+    return password_hasher.verify_and_update(plain_password, hashed_password)
+
 
+def hashing_busy_exception() -> HTTPException:
+    """Returns the 503 sent when the password hashing queue is full."""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many concurrent logins, retry shortly",
+        headers={"Retry-After": str(app_settings.PASSWORD_HASH_RETRY_AFTER_SECONDS)},
+    )
 
-def verify_admin_privileges(current_user: Users = Depends(get_current_user)) -> Users:
+
+def verify_admin_privileges(current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
     """Verifies if the current user has admin privileges."""
     try:
         if current_user.role != "admin":
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                                 detail="User does not have admin privileges")
         return current_user
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error verifying admin privileges: {e}")
+        logger.error("Error verifying admin privileges: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal Server Error")
+
+
+async def verify_admin_privileges_async(current_user: CurrentUser = Depends(get_current_user_async)) -> CurrentUser:
+    """Verifies if the current user has admin privileges (async request path)."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="User does not have admin privileges")
+    return current_user
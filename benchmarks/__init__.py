@@ -0,0 +1,5 @@
+"""Benchmarks and load checks for the Librarian service.
+
+Each module is runnable with ``python -m benchmarks.<module>`` and prints a
+JSON report on stdout.
+"""
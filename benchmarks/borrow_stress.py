@@ -0,0 +1,112 @@
+"""Concurrency stress check for borrowing.
+
+Many threads race to borrow the copies of a single book. The check fails if
+more loans are recorded than copies exist, and reports borrow throughput.
+
+    python -m benchmarks.borrow_stress --workers 64 --copies 500
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# The app settings are required at import time; provide harmless defaults
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHIM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+from sqlalchemy import create_engine, func, select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app import crud, models  # noqa: E402
+
+
+def make_engine(url: str, workers: int):
+    if url.startswith("sqlite"):
+        return create_engine(url, connect_args={"timeout": 60, "check_same_thread": False})
+    return create_engine(url, pool_size=workers, max_overflow=0)
+
+
+def run(url: str, workers: int, copies: int, attempts: int) -> dict:
+    engine = make_engine(url, workers)
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    with Session() as db:
+        suffix = str(time.time_ns())
+        user = models.Users(name=f"stress-{suffix}", email=f"stress-{suffix}@example.com", password="x")
+        book = models.Books(title=f"stress-{suffix}", author=f"stress-{suffix}", description="", count=copies)
+        db.add_all([user, book])
+        db.commit()
+        user_id, book_id = user.id, book.id
+
+    counters = {"borrowed": 0, "unavailable": 0, "errors": 0}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(workers)
+
+    def borrower():
+        outcome = {"borrowed": 0, "unavailable": 0, "errors": 0}
+        start_barrier.wait()
+        with Session() as db:
+            for _ in range(attempts):
+                try:
+                    crud.borrow_book(db, book_id, user_id)
+                    outcome["borrowed"] += 1
+                except crud.BookUnavailableError:
+                    outcome["unavailable"] += 1
+                except Exception:
+                    outcome["errors"] += 1
+        with lock:
+            for key, value in outcome.items():
+                counters[key] += value
+
+    threads = [threading.Thread(target=borrower) for _ in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with Session() as db:
+        remaining = db.scalar(select(models.Books.count).where(models.Books.id == book_id))
+        loans = db.scalar(select(func.count(models.BookTransactions.id)).where(
+            models.BookTransactions.book_id == book_id))
+    engine.dispose()
+
+    attempted = workers * attempts
+    return {
+        "workers": workers,
+        "copies": copies,
+        "attempts": attempted,
+        **counters,
+        "loans_recorded": loans,
+        "copies_remaining": remaining,
+        "oversold": loans > copies or remaining < 0 or loans != counters["borrowed"],
+        "elapsed_s": round(elapsed, 4),
+        "attempts_per_s": round(attempted / elapsed, 1) if elapsed else None,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Database to run against (default: a temporary SQLite file)")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--copies", type=int, default=100)
+    parser.add_argument("--attempts", type=int, default=10, help="Borrow attempts per worker")
+    args = parser.parse_args(argv)
+
+    url = args.database_url
+    if url is None:
+        url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="librarian-bench-"), "stress.db")
+    report = run(url, args.workers, args.copies, args.attempts)
+    print(json.dumps(report, indent=2))
+    return 1 if report["oversold"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Load test of every router against a seeded dataset.
+
+Seeds the dataset (see ``benchmarks.dataset``), then drives the app in
+process through ``httpx.AsyncClient`` and ``ASGITransport`` with
+``--concurrency`` clients per endpoint. Reports the status codes, throughput
+and latency percentiles of each endpoint as JSON. The app runs in the mode
+set by ``DB_MODE``, so both the sync and async routers can be measured.
+
+    python -m benchmarks.load --transactions 1000000 --requests 500 --concurrency 16
+    DB_MODE=async python -m benchmarks.load --database-url postgresql://localhost/librarian_bench
+
+With ``--query-budget`` the SQL statements of each request are counted
+against the route budgets (see ``app.querybudget``), each endpoint reports
+the most statements one of its requests ran, and the exit status is 1 if any
+endpoint went over its budget. A short run makes a CI check against N+1
+regressions:
+
+    python -m benchmarks.load --transactions 1000 --requests 5 --concurrency 1 --query-budget raise
+"""
+import os
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from benchmarks.dataset import PASSWORD, add_dataset_arguments, configure_environment, seed, user_email
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(latencies: List[float], statuses: Dict[int, int], elapsed: float) -> dict:
+    return {
+        "requests": len(latencies),
+        "statuses": statuses,
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p90_ms": round(percentile(latencies, 0.90), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "max_ms": round(max(latencies), 3),
+    }
+
+
+async def measure(send: Callable[[int], Awaitable], requests: int, concurrency: int) -> dict:
+    """Calls ``send(i)`` ``requests`` times from ``concurrency`` concurrent clients."""
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    queries: List[int] = []
+    budget = None
+    counter = iter(range(requests))
+
+    async def client():
+        nonlocal budget
+        for i in counter:
+            started = time.perf_counter()
+            response = await send(i)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if "x-query-count" in response.headers:
+                queries.append(int(response.headers["x-query-count"]))
+                budget = int(response.headers["x-query-budget"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    summary = summarize(latencies, statuses, time.perf_counter() - started)
+    if queries:
+        summary.update(max_queries=max(queries), query_budget=budget)
+    return summary
+
+
+async def run(args) -> dict:
+    import httpx
+
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        async def login(index: int) -> str:
+            response = await http.post("/auth/login", data={"username": user_email(index), "password": PASSWORD})
+            response.raise_for_status()
+            return response.json()["access_token"]
+
+        admin = {"Authorization": f"Bearer {await login(0)}"}
+        members = [{"Authorization": f"Bearer {await login(i)}"} for i in range(1, min(args.users, 11))]
+        rng = random.Random(0)
+        first_page = (await http.get("/books/", params={"page_size": 50})).json()
+        cursor = first_page["next_cursor"]
+        loans = []
+
+        async def borrow(i):
+            headers = members[i % len(members)]
+            book_id = rng.randint(1, args.books)
+            response = await http.post(f"/books/{book_id}/borrow", headers=headers)
+            if response.status_code == 200:
+                loans.append((headers, book_id))
+            return response
+
+        async def give_back(i):
+            headers, book_id = loans.pop() if loans else (members[0], 0)
+            return await http.put(f"/books/{book_id}/return", headers=headers)
+
+        # Endpoints are measured one after another; return consumes the loans of borrow
+        scenarios = {
+            "GET /": lambda i: http.get("/"),
+            "GET /books/ (offset)": lambda i: http.get(
+                "/books/", params={"page": rng.randint(1, max(1, args.books // 50)), "page_size": 50}),
+            "GET /books/ (keyset)": lambda i: http.get("/books/", params={"page_size": 50, "after": cursor}),
+            "GET /books/{id}": lambda i: http.get(f"/books/{rng.randint(1, args.books)}"),
+            "GET /books/?ids= (50)": lambda i: http.get(
+                "/books/", params={"ids": ",".join(str(rng.randint(1, args.books)) for _ in range(50))}),
+            "POST /books/get:batch (500)": lambda i: http.post(
+                "/books/get:batch", json={"book_ids": [rng.randint(1, args.books) for _ in range(500)]}),
+            "GET /books/search": lambda i: http.get(
+                "/books/search", params={"q": f"benchmark book {rng.randint(1, args.books)}"}),
+            "GET /books/search/suggest": lambda i: http.get(
+                "/books/search/suggest", params={"prefix": f"Book {rng.randint(1, 99)}"}),
+            "POST /books/{id}/borrow": borrow,
+            "PUT /books/{id}/return": give_back,
+            "GET /users/book": lambda i: http.get("/users/book", headers=members[i % len(members)]),
+            "GET /users/book?active_only": lambda i: http.get(
+                "/users/book", params={"active_only": "true", "limit": 20}, headers=members[i % len(members)]),
+            "GET /users/history": lambda i: http.get(
+                "/users/history", params={"email": user_email(rng.randint(1, args.users - 1))}, headers=admin),
+            "GET /users/history (all)": lambda i: http.get("/users/history", headers=admin),
+            "GET /stats/books/top": lambda i: http.get("/stats/books/top", params={"days": 30}),
+            "GET /stats/books/{id}": lambda i: http.get(f"/stats/books/{rng.randint(1, args.books)}"),
+            "GET /stats/users/top": lambda i: http.get("/stats/users/top", headers=admin),
+            "GET /stats/users/me": lambda i: http.get("/stats/users/me", headers=members[i % len(members)]),
+            "GET /stats/daily": lambda i: http.get("/stats/daily", headers=admin),
+            "POST /auth/login": lambda i: http.post(
+                "/auth/login", data={"username": user_email(i % args.users), "password": PASSWORD}),
+        }
+
+        results = {}
+        for name, send in scenarios.items():
+            if args.endpoint and not any(pattern in name for pattern in args.endpoint):
+                continue
+            results[name] = await measure(send, args.requests, args.concurrency)
+        return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_dataset_arguments(parser)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--endpoint", nargs="*", help="Only measure endpoints whose name contains one of these")
+    parser.add_argument("--query-budget", choices=("warn", "raise"),
+                        help="Check the SQL statements of each request against the route budgets")
+    args = parser.parse_args(argv)
+    if args.users < 2:
+        parser.error("--users must be at least 2: user 0 is the admin")
+
+    if args.query_budget:
+        os.environ["QUERY_BUDGET_MODE"] = args.query_budget
+    database_url = configure_environment(args.database_url)
+    dataset = seed(args.users, args.books, args.transactions)
+
+    from app.config import app_settings
+
+    results = asyncio.run(run(args))
+    print(json.dumps({
+        "database_url": database_url,
+        "db_mode": app_settings.DB_MODE,
+        "dataset": dataset,
+        "concurrency": args.concurrency,
+        "endpoints": results,
+    }, indent=2))
+    over_budget = [name for name, result in results.items()
+                   if result.get("max_queries", 0) > (result.get("query_budget") or float("inf"))]
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Request latency with logging off, through the queue pipeline, and with a
+synchronous file handler on the request thread.
+
+Each mode runs in a fresh interpreter because logging is configured when the
+app settings are imported.
+
+    python -m benchmarks.logging_overhead --requests 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ("off", "queue", "sync")
+
+
+def child(mode: str, requests: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="librarian-bench-")
+    os.environ.update({
+        "SQLALCHEMY_DATABASE_URL": "sqlite:///" + os.path.join(workdir, "bench.db"),
+        "SECRET_KEY": "benchmark",
+        "ALGORITHIM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+        "LOG_FILE": os.path.join(workdir, "librarian.log"),
+        "LOG_LEVEL": "CRITICAL" if mode == "off" else "DEBUG",
+        # Measure the user lookup path, which logs on every request
+        "AUTH_USER_CACHE_ENABLED": "false",
+    })
+
+    import logging
+    from fastapi.testclient import TestClient
+
+    from app import logging_config, models
+    from app.database import SessionLocal
+    from app.oauth2 import create_access_token
+    from main import app
+
+    if mode == "sync":
+        # The previous setup: format and write every record on the request thread
+        logging_config.logger.removeHandler(logging_config.queue_handler)
+        handler = logging.FileHandler(os.environ["LOG_FILE"])
+        handler.setFormatter(logging.Formatter(logging_config.TEXT_FORMAT))
+        logging_config.logger.addHandler(handler)
+
+    with SessionLocal() as db:
+        user = models.Users(name="bench", email="bench@example.com", password="x", role="admin")
+        db.add(user)
+        db.add(models.Books(title="bench", author="bench", description="", count=1))
+        db.commit()
+        token = create_access_token({"user_id": user.id})
+
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(50):
+        client.get("/users/book", headers=headers)
+
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.get("/users/book", headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests": requests,
+        "mean_ms": round(statistics.fmean(latencies), 4),
+        "p50_ms": round(latencies[len(latencies) // 2], 4),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 4),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args.child, args.requests)))
+        return 0
+
+    results = []
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.logging_overhead", "--child", mode, "--requests", str(args.requests)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    baseline = results[0]["mean_ms"]
+    for result in results:
+        result["overhead_pct"] = round((result["mean_ms"] - baseline) / baseline * 100, 2)
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Login throughput against the number of password hashing workers.
+
+Each configuration runs in a fresh interpreter because the hashing pool is
+configured from the app settings at import time. Logins are sent from
+concurrent client threads, twice as many as there are hashing workers.
+
+    python -m benchmarks.login_throughput --logins 200 --executor process thread
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def worker_counts(max_workers: int):
+    count = 1
+    while count < max_workers:
+        yield count
+        count *= 2
+    yield max_workers
+
+
+def child(executor: str, workers: int, logins: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="librarian-bench-")
+    os.environ.update({
+        "SQLALCHEMY_DATABASE_URL": "sqlite:///" + os.path.join(workdir, "bench.db"),
+        "SECRET_KEY": "benchmark",
+        "ALGORITHIM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+        "LOG_FILE": os.path.join(workdir, "librarian.log"),
+        "PASSWORD_HASH_EXECUTOR": executor,
+        "PASSWORD_HASH_WORKERS": str(workers),
+        "RATE_LIMIT_ENABLED": "false",
+        "MAX_CONCURRENT_REQUESTS": "0",
+    })
+
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    client = TestClient(app)
+    client.post("/users/register", json={"name": "bench", "email": "bench@example.com", "password": "secret"})
+    form = {"username": "bench@example.com", "password": "secret"}
+    # Start the pool before measuring
+    client.post("/auth/login", data=form)
+
+    concurrency = workers * 2
+    statuses = {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for response in pool.map(lambda _: client.post("/auth/login", data=form), range(logins)):
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    elapsed = time.perf_counter() - started
+    return {
+        "executor": executor,
+        "workers": workers,
+        "concurrency": concurrency,
+        "logins": logins,
+        "statuses": statuses,
+        "logins_per_second": round(statuses.get(201, 0) / elapsed, 2),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--executor", nargs="+", choices=("process", "thread"), default=["process", "thread"])
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        executor, workers = args.child
+        print(json.dumps(child(executor, int(workers), args.logins)))
+        return 0
+
+    results = []
+    for executor in args.executor:
+        for workers in worker_counts(args.max_workers):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.login_throughput",
+                 "--child", executor, str(workers), "--logins", str(args.logins)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps({"cpu_count": os.cpu_count(), "results": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
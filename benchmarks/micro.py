@@ -0,0 +1,90 @@
+"""Micro-benchmarks of the CRUD functions and JWT handling.
+
+Seeds the dataset (see ``benchmarks.dataset``) and times each function
+directly on a session, without HTTP or routing, so regressions can be traced
+to the query or the encoding rather than the framework. Reports the mean,
+p50 and p99 of each in microseconds as JSON.
+
+    python -m benchmarks.micro --transactions 1000000 --repeat 200
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Callable, List
+
+from benchmarks.dataset import add_dataset_arguments, configure_environment, seed
+
+
+def timed(fn: Callable, repeat: int) -> dict:
+    samples: List[float] = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    samples.sort()
+    return {
+        "mean_us": round(statistics.fmean(samples), 1),
+        "p50_us": round(samples[len(samples) // 2], 1),
+        "p99_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_dataset_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    configure_environment(args.database_url)
+    dataset = seed(args.users, args.books, args.transactions)
+
+    from fastapi import HTTPException
+
+    from app import crud, models
+    from app.database import SessionLocal
+    from app.export import encode_json_rows
+    from app.oauth2 import create_access_token, user_token_claims, verify_access_token
+
+    rng = random.Random(0)
+    db = SessionLocal()
+    user = db.get(models.Users, 2)
+    token = create_access_token(user_token_claims(user))
+    credentials_exception = HTTPException(status_code=401)
+
+    def borrow_and_return(i):
+        book_id = rng.randint(1, args.books)
+        crud.borrow_book(db, book_id, user.id)
+        crud.return_book(db, book_id, user.id)
+
+    benchmarks = {
+        "crud.get_all_books": lambda i: crud.get_all_books(db, skip=rng.randrange(args.books), limit=50),
+        "crud.get_books_after": lambda i: crud.get_books_after(db, after_id=rng.randrange(args.books), limit=50),
+        "crud.count_books": lambda i: crud.count_books(db),
+        "crud.get_book_by_id": lambda i: crud.get_book_by_id(db, rng.randint(1, args.books)),
+        "crud.read_book (cached)": lambda i: crud.read_book(db, rng.randint(1, 10)),
+        "crud.read_books_page (cached)": lambda i: crud.read_books_page(db, 1, 50),
+        "crud.get_books_borrowed_by_user": lambda i: crud.get_books_borrowed_by_user(db, user.id),
+        "crud.get_user_book_history (user)": lambda i: encode_json_rows(
+            crud.get_user_book_history(db, user_id=rng.randint(1, args.users), limit=100), crud.HISTORY_FIELDS),
+        "crud.get_user_book_history (all)": lambda i: encode_json_rows(
+            crud.get_user_book_history(db, limit=100), crud.HISTORY_FIELDS),
+        "crud.borrow_book + return_book": borrow_and_return,
+        "oauth2.create_access_token": lambda i: create_access_token(user_token_claims(user)),
+        "oauth2.verify_access_token": lambda i: verify_access_token(token, credentials_exception),
+    }
+
+    results = {}
+    for name, fn in benchmarks.items():
+        fn(0)
+        results[name] = timed(fn, args.repeat)
+        db.rollback()
+    db.close()
+    print(json.dumps({"dataset": dataset, "repeat": args.repeat, "results": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Cost of building the /users/history response for 10k rows, before and after
+column projection with orjson.
+
+"before" loads ``(Books, BookTransactions)`` ORM pairs, builds a dict per row
+and renders it the way FastAPI did: ``jsonable_encoder`` then the stdlib
+``JSONResponse``. "after" selects only the needed columns and encodes the rows
+with ``encode_json_rows``. Both the full path (query + encode) and the
+encoding alone are timed.
+
+    python -m benchmarks.serialization --rows 10000 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def setup_environment() -> None:
+    workdir = tempfile.mkdtemp(prefix="librarian-bench-")
+    os.environ.update({
+        "SQLALCHEMY_DATABASE_URL": "sqlite:///" + os.path.join(workdir, "bench.db"),
+        "SECRET_KEY": "benchmark",
+        "ALGORITHIM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+        "LOG_FILE": os.path.join(workdir, "librarian.log"),
+    })
+
+
+def seed(db, models, rows: int) -> None:
+    user = models.Users(name="bench", email="bench@example.com", password="x", role="admin")
+    db.add(user)
+    books = [models.Books(title=f"title {i}", author=f"author {i}", description="description " * 5, count=1)
+             for i in range(100)]
+    db.add_all(books)
+    db.flush()
+    db.bulk_insert_mappings(models.BookTransactions, [
+        {"book_id": books[i % len(books)].id, "borrowed_by": user.id, "borrowed": True, "returned": i % 2 == 0}
+        for i in range(rows)
+    ])
+    db.commit()
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    setup_environment()
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    from app import models
+    from app.crud import HISTORY_FIELDS, HISTORY_ORDER, get_user_book_history
+    from app.database import Base, SessionLocal, engine
+    from app.export import encode_json_rows
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    seed(db, models, args.rows)
+
+    def load_orm():
+        db.expunge_all()
+        return db.query(models.Books, models.BookTransactions).join(
+            models.BookTransactions, models.BookTransactions.book_id == models.Books.id
+        ).order_by(*HISTORY_ORDER).limit(args.rows).all()
+
+    def encode_orm(pairs):
+        rows = [{
+            "id": book.id,
+            "title": book.title,
+            "description": book.description,
+            "author": book.author,
+            "count": book.count,
+            "borrowed_by": transaction.borrowed_by,
+            "borrowed": transaction.borrowed,
+            "returned": transaction.returned,
+            "borrowed_at": transaction.borrowed_at,
+            "returned_at": transaction.returned_at,
+        } for book, transaction in pairs]
+        return JSONResponse(jsonable_encoder(rows)).body
+
+    def load_columns():
+        return get_user_book_history(db, limit=args.rows)
+
+    def encode_columns(rows):
+        return encode_json_rows(rows, HISTORY_FIELDS)
+
+    pairs = load_orm()
+    rows = load_columns()
+    assert json.loads(encode_orm(pairs)) == json.loads(encode_columns(rows))
+
+    before = {
+        "total_ms": timed(lambda: encode_orm(load_orm()), args.repeat),
+        "encode_ms": timed(lambda: encode_orm(pairs), args.repeat),
+    }
+    after = {
+        "total_ms": timed(lambda: encode_columns(load_columns()), args.repeat),
+        "encode_ms": timed(lambda: encode_columns(rows), args.repeat),
+    }
+    db.close()
+    print(json.dumps({
+        "rows": args.rows,
+        "before": before,
+        "after": after,
+        "speedup_total": round(before["total_ms"] / after["total_ms"], 2),
+        "speedup_encode": round(before["encode_ms"] / after["encode_ms"], 2),
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Startup time budget of a production worker.
+
+Seeds a small database, then starts the app in a fresh interpreter with
+ENVIRONMENT=production and measures the time to import it, to run the
+lifespan startup (mapper configuration and pool warmup) and to serve the
+first request. Exits with status 1 when a measurement is over its budget, so
+it can gate a deployment pipeline.
+
+    python -m benchmarks.startup --import-budget-ms 2000 --first-request-budget-ms 200
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.dataset import configure_environment
+
+
+def child(mode: str, path: str) -> dict:
+    os.environ.update({"ENVIRONMENT": "production", "DB_MODE": mode})
+
+    started = time.perf_counter()
+    from main import app
+    imported = time.perf_counter()
+
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        ready = time.perf_counter()
+        response = client.get(path)
+        served = time.perf_counter()
+    return {
+        "mode": mode,
+        "path": path,
+        "status": response.status_code,
+        "import_ms": round((imported - started) * 1000, 1),
+        "lifespan_ms": round((ready - imported) * 1000, 1),
+        "first_request_ms": round((served - ready) * 1000, 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Defaults to a temporary SQLite file")
+    parser.add_argument("--mode", nargs="+", choices=("sync", "async"), default=["sync", "async"])
+    parser.add_argument("--path", default="/books/", help="Endpoint of the first request")
+    parser.add_argument("--import-budget-ms", type=float, default=2000)
+    parser.add_argument("--first-request-budget-ms", type=float, default=200)
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        mode, path = args.child
+        print(json.dumps(child(mode, path)))
+        return 0
+
+    # Production workers do not create tables, so the schema is seeded first
+    database_url = configure_environment(args.database_url)
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.dataset", "--database-url", database_url,
+         "--users", "2", "--books", "10", "--transactions", "10"],
+        check=True, capture_output=True,
+    )
+
+    results = []
+    for mode in args.mode:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child", mode, args.path],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result["within_budget"] = (result["status"] == 200
+                                   and result["import_ms"] <= args.import_budget_ms
+                                   and result["first_request_ms"] <= args.first_request_budget_ms)
+        results.append(result)
+    print(json.dumps({
+        "import_budget_ms": args.import_budget_ms,
+        "first_request_budget_ms": args.first_request_budget_ms,
+        "results": results,
+    }, indent=2))
+    return 0 if all(result["within_budget"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
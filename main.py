@@ -1,5 +1,3 @@
-import logging
-
 from app import initialize_app
 from app.logging_config import logger
 
@@ -13,5 +11,5 @@ async def root():
     try:
         return "Librarian App Backend Up and Running"
     except Exception as e:
-        logger.error(f"Error in root endpoint: {e}")
+        logger.error("Error in root endpoint: %s", e)
         return {"error": "Internal Server Error"}
@@ -0,0 +1,68 @@
+"""Startup time budget of a production worker.
+
+Each check starts the app in a fresh interpreter with ENVIRONMENT=production
+against a small seeded SQLite database, so nothing imported by pytest skews
+the measurement. The budgets can be raised on slow machines with
+STARTUP_IMPORT_BUDGET_MS and STARTUP_FIRST_REQUEST_BUDGET_MS.
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+IMPORT_BUDGET_MS = float(os.environ.get("STARTUP_IMPORT_BUDGET_MS", 2000))
+FIRST_REQUEST_BUDGET_MS = float(os.environ.get("STARTUP_FIRST_REQUEST_BUDGET_MS", 200))
+
+IMPORT_MAIN = """
+import json, time
+started = time.perf_counter()
+import main
+print(json.dumps({"import_ms": (time.perf_counter() - started) * 1000}))
+"""
+
+
+def run_python(args, env) -> dict:
+    """Runs the interpreter with ``args`` and returns the JSON on its last output line."""
+    output = subprocess.run([sys.executable, *args], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@pytest.fixture(scope="module")
+def environment(tmp_path_factory):
+    """Returns the environment of a production worker on a seeded database."""
+    workdir = tmp_path_factory.mktemp("startup")
+    env = {
+        **os.environ,
+        "SQLALCHEMY_DATABASE_URL": f"sqlite:///{workdir / 'startup.db'}",
+        "LOG_FILE": str(workdir / "librarian.log"),
+        "SECRET_KEY": "startup",
+        "ALGORITHIM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+        "RATE_LIMIT_ENABLED": "false",
+    }
+    # Production workers do not create tables, so the schema is seeded first
+    subprocess.run([sys.executable, "-m", "benchmarks.dataset", "--database-url", env["SQLALCHEMY_DATABASE_URL"],
+                    "--users", "2", "--books", "10", "--transactions", "10"],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+    env["ENVIRONMENT"] = "production"
+    return env
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_import_within_budget(environment, mode):
+    result = run_python(["-c", IMPORT_MAIN], {**environment, "DB_MODE": mode})
+    assert result["import_ms"] <= IMPORT_BUDGET_MS, result
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_first_request_within_budget(environment, mode):
+    # The benchmark's child serves GET /books/ from a TestClient after startup
+    result = run_python(["-m", "benchmarks.startup", "--child", mode, "/books/"], {**environment, "DB_MODE": mode})
+    assert result["status"] == 200, result
+    assert result["first_request_ms"] <= FIRST_REQUEST_BUDGET_MS, result
@@ -0,0 +1,41 @@
+"""Background worker running the scheduled jobs next to the API servers.
+
+    python worker.py           # scan for overdue loans every OVERDUE_SCAN_INTERVAL_SECONDS
+    python worker.py --once    # a single scan, e.g. from cron
+"""
+import argparse
+import json
+import sys
+import time
+
+from app.config import app_settings
+from app.logging_config import logger
+from app.overdue import notification_sink, scan_overdue
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the Librarian background jobs.")
+    parser.add_argument("--once", action="store_true", help="Run one overdue scan, print its report and exit")
+    parser.add_argument("--interval", type=float, default=app_settings.OVERDUE_SCAN_INTERVAL_SECONDS,
+                        help="Seconds between overdue scans")
+    args = parser.parse_args(argv)
+
+    if args.once:
+        print(json.dumps(scan_overdue(notification_sink)))
+        return 0
+
+    logger.info("Worker started, scanning for overdue loans every %ss.", args.interval)
+    try:
+        while True:
+            try:
+                logger.info("Overdue scan finished: %s", scan_overdue(notification_sink))
+            except Exception as e:
+                logger.error("Overdue scan failed: %s", e)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        logger.info("Worker stopped.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())